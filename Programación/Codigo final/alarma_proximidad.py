@@ -0,0 +1,171 @@
+"""
+Alarma de proximidad por el HC-SR04, sin esperar a YOLO.
+
+Las distancias llegan a 20–50 Hz; cada muestra pasa por
+DetectorAcercamiento, que avisa cuando:
+
+    cerca          la distancia cruza hacia abajo `distancia_critica`
+    caida          cae de golpe (`caida_cm` en `ventana_caida` s): algo se
+                   metió adelante
+    acercamiento   se acerca de forma sostenida (pendiente por mínimos
+                   cuadrados en `ventana` s) y el tiempo hasta el choque es
+                   menor que `ttc`
+
+Las muestras se filtran con la mediana de las últimas 3 (el HC-SR04 da
+ecos sueltos) y 0 es "sin eco". Después de una alarma hay `rearme`
+segundos de silencio para no pitar en cada muestra. Las muestras llegan
+desde el hilo del loop de captura y desde los hilos que procesan frames:
+agregar() toma un lock.
+
+AlarmaSonora reproduce un pitido corto con aplay (WAV generado al inicio),
+que arranca en unos milisegundos; espeak tarda bastante más. La latencia
+del aviso depende solo del sensor, no del ritmo de la inferencia.
+
+    detector = DetectorAcercamiento()
+    motivo = detector.agregar(cm, t)    # None, 'cerca', 'caida' o 'acercamiento'
+    AlarmaSonora().sonar(motivo)
+"""
+import io
+import math
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from collections import deque
+
+APLAY_CMD = '/usr/bin/aplay'
+
+# motivo → pitido
+TONOS = {
+    'urgente': {'frecuencia': 1800, 'duracion': 0.07, 'pitidos': 3, 'pausa': 0.04},
+    'aviso': {'frecuencia': 1200, 'duracion': 0.10, 'pitidos': 1, 'pausa': 0.0},
+}
+TONO_MOTIVO = {'cerca': 'urgente', 'caida': 'urgente', 'acercamiento': 'aviso'}
+
+
+# ===============================
+# DETECCIÓN
+# ===============================
+class DetectorAcercamiento:
+    """Estado de un sensor: muestras recientes filtradas y la última alarma."""
+
+    def __init__(self, distancia_critica=50, distancia_alarma=150, caida_cm=50,
+                 ventana_caida=0.3, velocidad_min=30.0, ttc=2.0, ventana=1.0,
+                 rearme=2.0, alcance=400):
+        self.distancia_critica = distancia_critica
+        self.distancia_alarma = distancia_alarma   # las caídas cuentan solo por debajo
+        self.caida_cm = caida_cm
+        self.ventana_caida = ventana_caida
+        self.velocidad_min = velocidad_min         # cm/s
+        self.ttc = ttc                             # s hasta el choque
+        self.ventana = ventana
+        self.rearme = rearme
+        self.alcance = alcance                     # más lejos: lectura dudosa
+        self._crudas = deque(maxlen=3)
+        self._filtradas = deque()                  # (t, cm) dentro de `ventana`
+        self._t_alarma = None
+        self._lock = threading.Lock()
+        self.velocidad = 0.0                       # cm/s, negativa si se acerca
+
+    def agregar(self, cm, t=None):
+        """Suma una muestra; devuelve el motivo de alarma o None."""
+        t = time.monotonic() if t is None else t
+        if cm <= 0 or cm > self.alcance:
+            return None
+        with self._lock:
+            if self._filtradas and t < self._filtradas[-1][0]:
+                # llegó después de una más nueva (otro hilo): no romper el orden
+                t = self._filtradas[-1][0]
+            self._crudas.append(cm)
+            filtrada = sorted(self._crudas)[len(self._crudas) // 2]
+            anterior = self._filtradas[-1][1] if self._filtradas else None
+            self._filtradas.append((t, filtrada))
+            while self._filtradas[0][0] < t - self.ventana:
+                self._filtradas.popleft()
+
+            motivo = self._motivo(t, filtrada, anterior)
+            if motivo is None:
+                return None
+            if self._t_alarma is not None and t - self._t_alarma < self.rearme:
+                return None
+            self._t_alarma = t
+            return motivo
+
+    def _motivo(self, t, cm, anterior):
+        if anterior is not None and cm < self.distancia_critica <= anterior:
+            return 'cerca'
+        if cm < self.distancia_alarma:
+            recientes = [d for ti, d in self._filtradas if ti >= t - self.ventana_caida]
+            if max(recientes) - cm >= self.caida_cm:
+                return 'caida'
+        self.velocidad = self._pendiente()
+        if self.velocidad <= -self.velocidad_min and cm / -self.velocidad <= self.ttc:
+            return 'acercamiento'
+        return None
+
+    def _pendiente(self):
+        """cm/s por mínimos cuadrados sobre la ventana (0 si hay pocas muestras)."""
+        n = len(self._filtradas)
+        if n < 5 or self._filtradas[-1][0] - self._filtradas[0][0] < self.ventana / 2:
+            return 0.0
+        t0 = self._filtradas[0][0]
+        media_t = sum(ti - t0 for ti, _ in self._filtradas) / n
+        media_d = sum(d for _, d in self._filtradas) / n
+        cov = sum((ti - t0 - media_t) * (d - media_d) for ti, d in self._filtradas)
+        var = sum((ti - t0 - media_t) ** 2 for ti, _ in self._filtradas)
+        return cov / var if var > 0 else 0.0
+
+
+# ===============================
+# SONIDO
+# ===============================
+def tono_wav(frecuencia, duracion, pitidos=1, pausa=0.0, volumen=0.6, tasa=22050):
+    """WAV mono 16 bit con `pitidos` senoidales (con rampas para que no haga clic)."""
+    muestras = []
+    n = int(duracion * tasa)
+    rampa = max(1, int(0.005 * tasa))
+    for p in range(pitidos):
+        for i in range(n):
+            envolvente = min(1.0, i / rampa, (n - 1 - i) / rampa)
+            muestras.append(int(32767 * volumen * envolvente *
+                                math.sin(2 * math.pi * frecuencia * i / tasa)))
+        if p < pitidos - 1:
+            muestras.extend([0] * int(pausa * tasa))
+    salida = io.BytesIO()
+    with wave.open(salida, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(tasa)
+        w.writeframes(struct.pack(f'<{len(muestras)}h', *muestras))
+    return salida.getvalue()
+
+
+class AlarmaSonora:
+    """Pitidos por aplay; si todavía suena uno, el nuevo se saltea."""
+
+    def __init__(self, carpeta=None, comando=APLAY_CMD):
+        carpeta = carpeta or tempfile.gettempdir()
+        self.comando = comando
+        self.rutas = {}
+        for nombre, tono in TONOS.items():
+            ruta = os.path.join(carpeta, f'via_alarma_{nombre}.wav')
+            with open(ruta, 'wb') as f:
+                f.write(tono_wav(**tono))
+            self.rutas[nombre] = ruta
+        self._proceso = None
+
+    def sonar(self, motivo):
+        """Lanza el pitido del motivo sin bloquear; False si no se pudo."""
+        if self._proceso is not None and self._proceso.poll() is None:
+            return False
+        ruta = self.rutas[TONO_MOTIVO.get(motivo, 'aviso')]
+        try:
+            self._proceso = subprocess.Popen([self.comando, '-q', ruta],
+                                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            print("⚠️ No se pudo reproducir la alarma:", e)
+            return False
+        return True
@@ -0,0 +1,368 @@
+"""
+Microbenchmarks de cada etapa del pipeline, por separado y sin hardware.
+
+Mide con un corpus fijo de JPEGs (los sintéticos de simulador_esp32.py o
+una carpeta grabada con --jpegs):
+
+    protocolo_imgstart    respuesta a IMGSTART (distancia + tamaño + JPEG) leída
+                          con leer_respuesta_imagen(), como leer_cuerpo_frame()
+    protocolo_stream      imagen fragmentada + distancia, por ParserTramas
+    decodificacion        imdecode del frame entero
+    cambio_escena         miniatura gris del ROI + comparación (cambio_escena.py)
+    decodificacion_roi_N  ROI central listo para YOLO con imgsz N (DecodificadorJPEG)
+    recorte_roi_N         recorte + resize de un frame ya decodificado (camino v4.1)
+    codificacion_qN       imencode del frame entero a calidad N
+    codificacion_low      achicar a 320 px + imencode q40 (perfil 'low' de /video)
+    inferencia_B_N        detector.detectar del ROI con el motor B (pytorch, onnx,
+                          openvino; ver detectores.py) e imgsz N
+    extraccion            seguir las pistas (seguimiento.py) y armar las cajas del
+                          evento como hilo_inferencia()
+    frase_tts             armar la frase de espeak
+
+Guarda un JSON con el equipo (modelo de Pi, CPU, versiones) para comparar
+Pi 4, Pi 5 y x86, o la misma máquina antes y después de un cambio:
+
+    python benchmark_etapas.py --salida pi5.json
+    python benchmark_etapas.py --backends pytorch onnx openvino --imgsz 224 --solo inferencia
+    python benchmark_etapas.py --jpegs capturas/ --sin-modelo --comparar pi5.json
+
+Las etapas que necesitan OpenCV o un motor de inferencia se saltean (y
+quedan anotadas) si no están instalados o falta el grafo exportado.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import struct
+import time
+
+from protocolo_via import (TIPO_FRAGMENTO, TIPO_DISTANCIA, FLAG_FIN, TAM_FRAGMENTO,
+                           MARCA_DISTANCIA, MAX_PAYLOAD, LectorTramas, PoolBuffers,
+                           TIPO_IMAGEN, empaquetar_trama, leer_respuesta_imagen)
+from simulador_esp32 import cargar_jpegs, jpegs_sinteticos
+from frases import frase_objetos
+
+try:
+    import cv2
+    import numpy as np
+    from decodificacion import DecodificadorJPEG, region_central
+    from cambio_escena import DetectorCambio
+except ImportError:
+    cv2 = None
+
+IMGSZ_DEFECTO = (160, 224, 320)
+FRACCION_ROI = 0.5
+TOLERANCIA_DEFECTO = 0.15     # para --comparar: más de +15 % en p50 es regresión...
+PISO_MS = 0.05                # ...y además más de 0.05 ms (el ruido de las etapas chicas)
+
+
+# ===============================
+# MEDICIÓN
+# ===============================
+def cronometrar(funcion, repeticiones, calentamiento=3):
+    """Tiempos (s) de `repeticiones` llamadas, después de unas de calentamiento."""
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t0)
+    return tiempos
+
+
+def estadisticas(tiempos):
+    orden = sorted(tiempos)
+    n = len(orden)
+    return {
+        'n': n,
+        'media_ms': round(1000 * sum(orden) / n, 4),
+        'p50_ms': round(1000 * orden[n // 2], 4),
+        'p95_ms': round(1000 * orden[min(n - 1, int(0.95 * n))], 4),
+        'min_ms': round(1000 * orden[0], 4),
+        'por_segundo': round(n / sum(orden), 1) if sum(orden) else None,
+    }
+
+
+def equipo():
+    """Lo necesario para saber contra qué se compara."""
+    info = {
+        'maquina': platform.machine(),
+        'sistema': platform.platform(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+    }
+    try:
+        with open('/proc/device-tree/model', 'rb') as f:
+            info['modelo'] = f.read().rstrip(b'\0').decode(errors='replace')
+    except OSError:
+        pass
+    try:
+        with open('/proc/cpuinfo') as f:
+            for linea in f:
+                if linea.startswith('model name'):
+                    info['cpu'] = linea.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    if cv2 is not None:
+        info['opencv'] = cv2.__version__
+        info['numpy'] = np.__version__
+    try:
+        import torch
+        info['torch'] = torch.__version__
+        info['torch_hilos'] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+# ===============================
+# ETAPAS
+# ===============================
+def _ciclo(items):
+    return itertools.cycle(items).__next__
+
+
+def etapas_protocolo(jpegs):
+    """Lectura del protocolo a partir de bytes ya en memoria (sin serial)."""
+    respuestas = [struct.pack('>HI', 57, len(j)) + j for j in jpegs]
+    buffer = memoryview(bytearray(MAX_PAYLOAD))
+    siguiente_respuesta = _ciclo(respuestas)
+
+    def imgstart():
+        # la misma función que usa leer_cuerpo_frame() sobre buffer_legacy
+        _, motivo = leer_respuesta_imagen(io.BytesIO(siguiente_respuesta()), buffer,
+                                          lambda cm: None)
+        if motivo:
+            raise RuntimeError(f"respuesta IMGSTART descartada ({motivo})")
+
+    flujos = []
+    seq = 0
+    for jpeg in jpegs:
+        datos = bytearray(empaquetar_trama(TIPO_DISTANCIA, seq, 57, MARCA_DISTANCIA.pack(seq)))
+        seq += 1
+        partes = range(0, len(jpeg), TAM_FRAGMENTO)
+        for indice, inicio in enumerate(partes):
+            fin = inicio + TAM_FRAGMENTO >= len(jpeg)
+            datos += empaquetar_trama(TIPO_FRAGMENTO, seq, indice, jpeg[inicio:inicio + TAM_FRAGMENTO],
+                                      FLAG_FIN if fin else 0)
+            seq += 1
+        flujos.append(bytes(datos))
+    siguiente_flujo = _ciclo(flujos)
+    lector = LectorTramas(None, PoolBuffers(cantidad=3))
+
+    def stream():
+        lector.ser = io.BytesIO(siguiente_flujo())
+        while True:
+            trama = lector.leer_trama(timeout=1.0)
+            if trama is None:
+                raise RuntimeError("el flujo terminó sin imagen completa")
+            tipo = trama.tipo
+            trama.liberar()
+            if tipo == TIPO_IMAGEN:
+                return
+
+    return {'protocolo_imgstart': imgstart, 'protocolo_stream': stream}
+
+
+def etapas_imagen(jpegs, imgszs, usar_turbojpeg):
+    siguiente = _ciclo(jpegs)
+    frames = [cv2.imdecode(np.frombuffer(j, dtype=np.uint8), cv2.IMREAD_COLOR) for j in jpegs]
+    siguiente_frame = _ciclo(frames)
+    etapas = {'decodificacion': lambda: cv2.imdecode(np.frombuffer(siguiente(), dtype=np.uint8),
+                                                     cv2.IMREAD_COLOR)}
+    # sin intervalos: siempre arma la miniatura y la compara
+    cambios = DetectorCambio(intervalo_min=0.0, intervalo_max=float('inf'), fraccion_roi=FRACCION_ROI)
+    etapas['cambio_escena'] = lambda: cambios.decidir(siguiente())
+
+    for imgsz in imgszs:
+        decodificador = DecodificadorJPEG(imgsz, FRACCION_ROI, usar_turbojpeg=usar_turbojpeg)
+        etapas[f'decodificacion_roi_{imgsz}'] = lambda d=decodificador: d.roi(siguiente())
+
+        def recorte(imgsz=imgsz):
+            frame = siguiente_frame()
+            h, w = frame.shape[:2]
+            x0, y0, x1, y1 = region_central(w, h, FRACCION_ROI)
+            cv2.resize(frame[y0:y1, x0:x1], (imgsz, imgsz), interpolation=cv2.INTER_AREA)
+        etapas[f'recorte_roi_{imgsz}'] = recorte
+
+    for calidad in (40, 65, 80):
+        etapas[f'codificacion_q{calidad}'] = lambda c=calidad: cv2.imencode(
+            '.jpg', siguiente_frame(), [cv2.IMWRITE_JPEG_QUALITY, c])
+
+    def codificacion_low():
+        frame = siguiente_frame()
+        alto = round(frame.shape[0] * 320 / frame.shape[1])
+        chico = cv2.resize(frame, (320, alto), interpolation=cv2.INTER_AREA)
+        cv2.imencode('.jpg', chico, [cv2.IMWRITE_JPEG_QUALITY, 40])
+    etapas['codificacion_low'] = codificacion_low
+    return etapas
+
+
+def etapas_modelo(jpegs, imgszs, backends, omitidas):
+    """Una etapa por motor e imgsz; los grafos exportados solo miden su imgsz fijo."""
+    from detectores import crear_detector
+
+    etapas = {}
+    muestra = None
+    for backend in backends:
+        for imgsz in imgszs:
+            nombre = f'inferencia_{backend}_{imgsz}'
+            try:
+                detector = crear_detector(backend, imgsz=imgsz)
+            except Exception as e:        # falta el motor o el grafo exportado
+                omitidas[nombre] = f"{type(e).__name__}: {e}"
+                continue
+            if detector.imgsz != imgsz:
+                omitidas[nombre] = f"grafo exportado con imgsz {detector.imgsz}"
+                continue
+            decodificador = DecodificadorJPEG(imgsz, FRACCION_ROI)
+            siguiente_roi = _ciclo([decodificador.roi(j) for j in jpegs])
+            etapas[nombre] = lambda d=detector, s=siguiente_roi: d.detectar([s()])
+            if muestra is None:
+                muestra = detector.detectar([siguiente_roi()])[0]
+
+    if muestra is not None:
+        from seguimiento import Seguidor
+        m = (1.0 - FRACCION_ROI) / 2
+        seguidor = Seguidor()
+        reloj = itertools.count(step=0.5)   # una inferencia cada 0,5 s
+
+        def extraccion():
+            # lo que hace hilo_inferencia() con las detecciones de un frame
+            t = next(reloj)
+            visibles = seguidor.actualizar(muestra, t)
+            cajas = [{'id': p.id, 'clase': p.nombre, 'conf': round(p.conf, 2),
+                      'caja': [round(m + v * FRACCION_ROI, 3) for v in p.caja]}
+                     for p in visibles]
+            return cajas, seguidor.por_anunciar(t)
+        etapas['extraccion'] = extraccion
+    return etapas
+
+
+def etapa_frase():
+    casos = _ciclo([(['persona'], 45, None), (['persona', 'auto'], 80, None),
+                    (['perro', 'bicicleta', 'persona'], 150, None),
+                    (['silla'], 30, 'a la izquierda')])
+
+    def frase():
+        objs, distancia, ubicacion = casos()
+        return frase_objetos(objs, distancia, ubicacion=ubicacion)
+    return {'frase_tts': frase}
+
+
+# ===============================
+# CORRIDA Y COMPARACIÓN
+# ===============================
+PESADAS = ('inferencia_', 'extraccion')
+
+
+def correr(jpegs, repeticiones, imgszs, backends=('pytorch',), usar_turbojpeg=True, filtro=None,
+           informar=print):
+    etapas = {}
+    omitidas = {}
+    etapas.update(etapas_protocolo(jpegs))
+    if cv2 is not None:
+        etapas.update(etapas_imagen(jpegs, imgszs, usar_turbojpeg))
+    else:
+        omitidas['imagen'] = "sin OpenCV/numpy"
+    if backends and cv2 is None:
+        omitidas['inferencia'] = "sin OpenCV/numpy"
+    elif backends:
+        etapas.update(etapas_modelo(jpegs, imgszs, backends, omitidas))
+    else:
+        omitidas['inferencia'] = "--sin-modelo"
+    etapas.update(etapa_frase())
+
+    resultados = {}
+    for nombre, funcion in etapas.items():
+        if filtro and not any(nombre.startswith(f) for f in filtro):
+            continue
+        n = max(5, repeticiones // 10) if nombre.startswith(PESADAS) else repeticiones
+        resultados[nombre] = estadisticas(cronometrar(funcion, n))
+        informar(f"  {nombre:<24} p50 {resultados[nombre]['p50_ms']:>10.3f} ms"
+                 f"   p95 {resultados[nombre]['p95_ms']:>10.3f} ms")
+    return resultados, omitidas
+
+
+def comparar(actual, anterior, tolerancia=TOLERANCIA_DEFECTO, piso_ms=PISO_MS):
+    """
+    {etapa: (p50 anterior, p50 actual, cociente, regresión?)} de las etapas en
+    común. Es regresión si el p50 sube más de `tolerancia` y más de `piso_ms`:
+    en etapas de microsegundos un +15 % es ruido del reloj.
+    """
+    cambios = {}
+    for nombre, datos in actual.items():
+        previo = anterior.get(nombre)
+        if not previo or not previo.get('p50_ms'):
+            continue
+        cociente = datos['p50_ms'] / previo['p50_ms']
+        cambios[nombre] = (previo['p50_ms'], datos['p50_ms'], round(cociente, 3),
+                           cociente > 1 + tolerancia
+                           and datos['p50_ms'] - previo['p50_ms'] > piso_ms)
+    return cambios
+
+
+# ===============================
+# MAIN
+# ===============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Microbenchmarks por etapa del pipeline VIA")
+    ap.add_argument('--jpegs', help="carpeta con JPEGs grabados (si no, los sintéticos)")
+    ap.add_argument('--repeticiones', type=int, default=200)
+    ap.add_argument('--imgsz', type=int, nargs='+', default=list(IMGSZ_DEFECTO))
+    ap.add_argument('--backends', nargs='+', default=['pytorch'],
+                    choices=['pytorch', 'onnx', 'openvino'], help="motores de inferencia a comparar")
+    ap.add_argument('--sin-modelo', action='store_true', help="no medir la inferencia")
+    ap.add_argument('--sin-turbojpeg', action='store_true')
+    ap.add_argument('--solo', nargs='+', help="prefijos de etapas a medir")
+    ap.add_argument('--salida', help="archivo JSON para guardar el resultado")
+    ap.add_argument('--comparar', help="JSON de una corrida anterior")
+    ap.add_argument('--tolerancia', type=float, default=TOLERANCIA_DEFECTO)
+    ap.add_argument('--piso-ms', type=float, default=PISO_MS,
+                    help="suba mínima del p50 para contar como regresión")
+    args = ap.parse_args()
+
+    if args.jpegs:
+        jpegs = cargar_jpegs(args.jpegs)
+        corpus = {'tipo': 'grabado', 'carpeta': os.path.abspath(args.jpegs)}
+    else:
+        jpegs = jpegs_sinteticos()
+        corpus = {'tipo': 'sintetico'}
+    if not jpegs:
+        raise SystemExit("❌ No hay JPEGs en el corpus")
+    corpus.update(cantidad=len(jpegs), bytes_medio=sum(map(len, jpegs)) // len(jpegs))
+
+    print(f"⏱️ {len(jpegs)} JPEGs ({corpus['tipo']}), {args.repeticiones} repeticiones")
+    resultados, omitidas = correr(jpegs, args.repeticiones, args.imgsz,
+                                  [] if args.sin_modelo else args.backends,
+                                  not args.sin_turbojpeg, args.solo)
+    for grupo, motivo in omitidas.items():
+        print(f"  ⚠️ {grupo}: omitidas ({motivo})")
+
+    informe = {'version': 1, 'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'equipo': equipo(), 'corpus': corpus, 'repeticiones': args.repeticiones,
+               'etapas': resultados, 'omitidas': omitidas}
+    if args.salida:
+        with open(args.salida, 'w') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"💾 Guardado en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            anterior = json.load(f)
+        equipo_anterior = anterior.get('equipo', {})
+        print(f"\n📊 Contra {args.comparar} "
+              f"({equipo_anterior.get('modelo') or equipo_anterior.get('cpu', '?')})")
+        regresiones = 0
+        for nombre, (antes, ahora, cociente, regresion) in comparar(
+                resultados, anterior.get('etapas', {}), args.tolerancia, args.piso_ms).items():
+            marca = "⚠️" if regresion else "  "
+            regresiones += regresion
+            print(f"  {marca} {nombre:<24} {antes:>10.3f} → {ahora:>10.3f} ms  (x{cociente})")
+        if regresiones:
+            raise SystemExit(f"❌ {regresiones} etapa(s) más lentas que +{args.tolerancia:.0%} "
+                             f"(y +{args.piso_ms} ms)")
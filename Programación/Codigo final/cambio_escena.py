@@ -0,0 +1,100 @@
+"""
+Detector barato de cambios de escena: decide cuándo vale la pena volver a
+correr YOLO sobre una cámara.
+
+En lugar de inferir cada `intervalo` fijo, se compara el frame nuevo con el
+último que se infirió:
+
+  - si el JPEG cambió mucho de tamaño, la escena cambió (no hace falta
+    decodificar nada);
+  - si no, se decodifica en gris a 1/8 (IMREAD_REDUCED_GRAYSCALE_8, ~1 ms
+    en la Pi), se toma el recorte central que mira YOLO, se lleva a una
+    grilla chica y se cuenta qué fracción de celdas cambió más de
+    `umbral_pixel` niveles. A cada grilla se le resta su media, así un
+    ajuste de exposición de la cámara no cuenta como cambio.
+
+Con eso la inferencia corre a lo sumo cada `intervalo_min` mientras algo se
+mueve (o quien lleva la cámara camina) y cada `intervalo_max` con la escena
+quieta, para no perder algo que apareció despacio. forzar() hace que el
+próximo frame se infiera sí o sí (p. ej. ante una alarma de proximidad).
+
+    cambios = DetectorCambio()
+    motivo = cambios.decidir(jpeg, recortado)   # None: no inferir este frame
+"""
+import time
+
+import cv2
+import numpy as np
+
+MOTIVOS = ('primero', 'maximo', 'tamano', 'cambio', 'proximidad')
+
+
+class DetectorCambio:
+    """Estado de una cámara: la miniatura y el tamaño del último frame inferido."""
+
+    def __init__(self, intervalo_min=0.5, intervalo_max=5.0, fraccion_roi=0.5, lado=32,
+                 umbral_pixel=20, fraccion_cambio=0.04, cambio_tamano=0.2):
+        self.intervalo_min = intervalo_min
+        self.intervalo_max = intervalo_max
+        self.fraccion_roi = fraccion_roi
+        self.lado = lado
+        self.umbral_pixel = umbral_pixel
+        self.fraccion_cambio = fraccion_cambio
+        self.cambio_tamano = cambio_tamano
+        self._referencia = None       # miniatura del último frame inferido
+        self._tamano = None
+        self._t = None                # cuándo se eligió (monotonic)
+        self._forzado = None          # motivo pedido por forzar()
+        self.puntaje = 0.0            # fracción de celdas que cambió (último cálculo)
+
+    def miniatura(self, jpeg, recortado=False):
+        """Grilla gris de `lado` columnas del ROI, centrada en su media, o None."""
+        img = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if img is None:
+            return None
+        if not recortado:
+            alto, ancho = img.shape
+            m = (1.0 - self.fraccion_roi) / 2
+            img = img[int(alto * m):int(alto * (1 - m)), int(ancho * m):int(ancho * (1 - m))]
+        alto, ancho = img.shape
+        filas = max(1, round(self.lado * alto / ancho))
+        chica = cv2.resize(img, (self.lado, filas), interpolation=cv2.INTER_AREA).astype(np.float32)
+        return chica - chica.mean()
+
+    def forzar(self, motivo='proximidad'):
+        """El próximo decidir() elige el frame aunque no haya pasado intervalo_min."""
+        self._forzado = motivo
+
+    def decidir(self, jpeg, recortado=False, t=None):
+        """
+        Motivo para inferir este frame (uno de MOTIVOS) o None. Si devuelve
+        un motivo, el frame pasa a ser la referencia: se asume que se va a
+        inferir.
+        """
+        t = time.monotonic() if t is None else t
+        forzado, self._forzado = self._forzado, None
+        if forzado is None and self._t is not None and t - self._t < self.intervalo_min:
+            return None
+
+        tamano = len(jpeg)
+        chica = self.miniatura(jpeg, recortado)
+        if forzado is not None:
+            motivo = forzado
+        elif self._referencia is None:
+            motivo = 'primero'
+        elif t - self._t >= self.intervalo_max:
+            motivo = 'maximo'
+        elif abs(tamano - self._tamano) > self.cambio_tamano * self._tamano:
+            motivo = 'tamano'
+        elif chica is not None and chica.shape == self._referencia.shape:
+            self.puntaje = float(np.mean(np.abs(chica - self._referencia) > self.umbral_pixel))
+            motivo = 'cambio' if self.puntaje >= self.fraccion_cambio else None
+        else:
+            motivo = 'cambio'         # otra resolución: no se puede comparar
+        if motivo is None:
+            return None
+
+        self._referencia = chica
+        self._tamano = tamano
+        self._t = t
+        return motivo
@@ -0,0 +1,244 @@
+"""
+Captura de tramas del ESP32-CAM sobre asyncio.
+
+En lugar de girar sobre ser.read() mirando el reloj, el descriptor del
+puerto se registra en el event loop (add_reader): el hilo duerme hasta que
+llegan bytes y los plazos de cada frame los maneja el propio loop.
+Con varias cámaras, todas comparten ese mismo loop (GestorCamaras).
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from protocolo_via import (ParserTramas, TIPO_IMAGEN, TIPO_CONFIG, TIPO_DISTANCIA,
+                           CMD_STREAM_INICIO, CMD_STREAM_FIN, leer_distancia)
+
+
+class FuenteFramesAsync:
+    """
+    Iterador asíncrono de tramas de imagen de un ESP32-CAM en streaming.
+
+        async with FuenteFramesAsync(ser, pool) as fuente:
+            async for trama in fuente:
+                ...
+                trama.liberar()
+
+    Si no llega un frame válido dentro de `plazo_frame` segundos se
+    reinicia el stream (STREAMSTOP / STREAMSTART) y se sigue esperando.
+    Las respuestas a CFG no se iteran: van a al_config(texto). Las
+    distancias tampoco: van apenas llegan a al_distancia(cm, t, t_esp).
+    Si el puerto se cierra (USB desenchufado, pty cerrado) se deja de
+    escuchar el fd y la iteración termina con ConnectionError.
+    """
+
+    def __init__(self, ser, pool=None, plazo_frame=3.0, max_en_cola=2, al_config=None,
+                 al_distancia=None):
+        self.ser = ser
+        self.nombre = getattr(ser, 'port', None) or 'serial'
+        self.parser = ParserTramas(pool)
+        self.plazo_frame = plazo_frame
+        self.al_config = al_config
+        self.al_distancia = al_distancia
+        self._cola = asyncio.Queue(maxsize=max_en_cola)
+        self._loop = None
+        self._fd = None
+        self._error = None            # por qué se perdió el puerto
+        self.vencimientos = 0
+        self.tramas_salteadas = 0     # descartadas porque el consumidor no llegó
+        self.comandos_enviados = 0
+
+    async def __aenter__(self):
+        await self.iniciar()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.cerrar()
+
+    async def iniciar(self):
+        """Registra el puerto en el loop y pide el stream al ESP32."""
+        self._loop = asyncio.get_running_loop()
+        if self._fd is None:
+            self._fd = self.ser.fileno()
+            # pyserial ya abre el puerto así, pero el callback no debe
+            # bloquear nunca el loop aunque el fd venga de otro lado
+            os.set_blocking(self._fd, False)
+            self._loop.add_reader(self._fd, self._al_haber_datos)
+        await self.reiniciar_stream()
+
+    async def reiniciar_stream(self):
+        self.ser.write(CMD_STREAM_FIN)
+        await asyncio.sleep(0.2)
+        self.ser.reset_input_buffer()
+        self.parser.reiniciar()
+        self._vaciar_cola()
+        self.ser.write(CMD_STREAM_INICIO)
+
+    def enviar(self, comando):
+        """Manda un comando de texto al ESP32 (por ejemplo un CFG)."""
+        self.ser.write(comando)
+        self.comandos_enviados += 1
+
+    def cerrar(self):
+        self._dejar_de_leer()
+        try:
+            self.ser.write(CMD_STREAM_FIN)
+        except Exception:
+            pass
+        self._vaciar_cola()
+
+    def _dejar_de_leer(self):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+
+    def _vaciar_cola(self):
+        while not self._cola.empty():
+            trama = self._cola.get_nowait()
+            if trama is not None:
+                trama.liberar()
+
+    def _perder_puerto(self, error):
+        """EOF o error de lectura: sin esto el loop llamaría al callback sin parar."""
+        self._dejar_de_leer()
+        self._error = error
+        self._vaciar_cola()
+        self._cola.put_nowait(None)   # despierta a __anext__
+
+    def _al_haber_datos(self):
+        """Callback del loop: lee todo lo disponible sin bloquear."""
+        parser = self.parser
+        primera = True
+        while True:
+            try:
+                n = os.readv(self._fd, [parser.destino()])
+            except BlockingIOError:
+                break
+            except OSError as e:
+                self._perder_puerto(ConnectionError(f"{self.nombre}: {e}"))
+                return
+            if n == 0:
+                # pyserial deja VMIN=VTIME=0: un tty vacío devuelve 0, no
+                # EAGAIN. Solo es EOF si el loop dijo que había datos y no vino nada.
+                if primera:
+                    self._perder_puerto(ConnectionError(f"{self.nombre}: puerto cerrado"))
+                    return
+                break
+            primera = False
+            parser.alimentar(n)
+        while True:
+            trama = parser.trama_lista()
+            if trama is None:
+                break
+            if trama.tipo != TIPO_IMAGEN:
+                try:
+                    if trama.tipo == TIPO_DISTANCIA and self.al_distancia:
+                        cm, t_esp = leer_distancia(trama)
+                        self.al_distancia(cm, trama.t, t_esp)
+                    elif trama.tipo == TIPO_CONFIG and self.al_config:
+                        self.al_config(bytes(trama.payload).decode(errors='replace'))
+                except Exception as e:     # p. ej. una distancia corta: no tirar el loop
+                    print(f"⚠️ Trama {trama.tipo} inválida en {self.nombre}:", e)
+                finally:
+                    trama.liberar()
+                continue
+            if self._cola.full():
+                # quedarse con lo más nuevo: el frame viejo ya no sirve
+                self._cola.get_nowait().liberar()
+                self.tramas_salteadas += 1
+            self._cola.put_nowait(trama)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            if self._error is not None:
+                raise self._error
+            try:
+                trama = await asyncio.wait_for(self._cola.get(), self.plazo_frame)
+            except asyncio.TimeoutError:
+                self.vencimientos += 1
+                print(f"⚠️ Stream sin datos en {self.nombre}, reiniciando...")
+                await self.reiniciar_stream()
+                continue
+            if trama is None:
+                raise self._error
+            return trama
+
+
+class GestorCamaras:
+    """
+    Varias ESP32-CAM (frente, izquierda, derecha...) en un solo event loop.
+
+    `puertos` es {id_camara: serial abierto}. La E/S de todas las cámaras la
+    atiende un único hilo; el trabajo pesado de cada frame (decodificar,
+    recortar, codificar) corre en un pool de hilos, así cada cámara puede
+    usar un núcleo distinto de la Pi (cv2 libera el GIL).
+
+    procesar(camara, trama) se ejecuta en el pool y debe liberar la trama.
+    Si se pasa crear_control(camara) → ControlAdaptativo, cada cámara ajusta
+    su tamaño y calidad JPEG según lo que mide de su propio enlace.
+    al_distancia(camara, cm, t, t_esp) recibe la telemetría del HC-SR04 en
+    el hilo del loop, sin pasar por la cola de frames.
+    Si se pierde un puerto, se lo reabre cada `espera_reapertura` segundos.
+    """
+
+    def __init__(self, puertos, procesar, pool=None, hilos=None, plazo_frame=3.0,
+                 crear_control=None, al_distancia=None, espera_reapertura=2.0):
+        self.puertos = puertos
+        self.procesar = procesar
+        self.pool = pool
+        self.hilos = hilos or max(1, min(len(puertos), os.cpu_count() or 1))
+        self.plazo_frame = plazo_frame
+        self.crear_control = crear_control
+        self.al_distancia = al_distancia
+        self.espera_reapertura = espera_reapertura
+        self.fuentes = {}
+        self.controles = {}
+        self.reaperturas = 0
+
+    async def correr(self):
+        with ThreadPoolExecutor(max_workers=self.hilos,
+                                thread_name_prefix='procesar_frame') as ejecutor:
+            await asyncio.gather(*(self._camara(cam, ser, ejecutor)
+                                   for cam, ser in self.puertos.items()))
+
+    async def _camara(self, camara, ser, ejecutor):
+        loop = asyncio.get_running_loop()
+        control = self.crear_control(camara) if self.crear_control else None
+        self.controles[camara] = control
+        al_config = control.registrar_respuesta if control else None
+        al_distancia = (lambda cm, t, t_esp: self.al_distancia(camara, cm, t, t_esp)) \
+            if self.al_distancia else None
+        while True:
+            try:
+                async with FuenteFramesAsync(ser, self.pool, self.plazo_frame,
+                                             al_config=al_config,
+                                             al_distancia=al_distancia) as fuente:
+                    self.fuentes[camara] = fuente
+                    async for trama in fuente:
+                        if control is not None:
+                            control.registrar_frame(len(trama.payload))
+                            comando = control.decidir()
+                            if comando:
+                                fuente.enviar(comando)
+                        try:
+                            await loop.run_in_executor(ejecutor, self.procesar, camara, trama)
+                        except Exception as e:
+                            print(f"⚠️ Error procesando frame de {camara}:", e)
+            except OSError as e:          # ConnectionError o el write de un puerto caído
+                print(f"⚠️ Se perdió {camara} ({e}), reabriendo...")
+            await self._reabrir(camara, ser)
+
+    async def _reabrir(self, camara, ser):
+        """Cierra y vuelve a abrir el puerto hasta que ande (mismo nombre y baudios)."""
+        while True:
+            await asyncio.sleep(self.espera_reapertura)
+            try:
+                ser.close()
+                ser.open()
+            except OSError:               # serial.SerialException es un OSError
+                continue
+            self.reaperturas += 1
+            print(f"✅ {camara} reabierto")
+            return
@@ -0,0 +1,145 @@
+"""
+Control adaptativo del JPEG que manda el ESP32-CAM.
+
+La inferencia usa solo el centro del frame a imgsz=224, así que mandar VGA
+a calidad 12 desperdicia la mayor parte del enlace de 500 kbps. Este módulo
+elige tamaño de frame, calidad y (opcionalmente) un recorte en el sensor a
+partir del throughput medido y de la resolución que necesita YOLO, y arma
+los comandos CFG para el firmware.
+
+El tamaño de frame parte del mínimo que deja el ROI con imgsz píxeles; si
+el enlace sigue saturado con la peor calidad, baja un tamaño (el ROI llega
+más chico y YOLO lo agranda, pero no se pierden fps) y vuelve a subir
+cuando sobran fps y el frame más grande entra en el enlace.
+"""
+import time
+
+from protocolo_via import cmd_config
+
+# (nombre del firmware, ancho, alto), de menor a mayor
+TAMANOS = [
+    ('QQVGA', 160, 120),
+    ('QVGA', 320, 240),
+    ('CIF', 400, 296),
+    ('VGA', 640, 480),     # máximo: los frame buffers se reservan para VGA
+]
+
+
+def _indice(nombre):
+    return [t[0] for t in TAMANOS].index(nombre)
+
+
+def tamano_minimo(ancho_necesario):
+    """El frame más chico cuyo ancho alcanza (o VGA si ninguno alcanza)."""
+    for nombre, ancho, _ in TAMANOS:
+        if ancho >= ancho_necesario:
+            return nombre
+    return TAMANOS[-1][0]
+
+
+class ControlAdaptativo:
+    """
+    Una instancia por cámara. registrar_frame() en cada imagen recibida y
+    decidir() devuelve un comando CFG cuando conviene cambiar algo.
+    """
+
+    def __init__(self, imgsz=224, fraccion_roi=0.5, fps_objetivo=4.0,
+                 recorte_sensor=False, capacidad=50000, calidad_inicial=12,
+                 calidad_min=10, calidad_max=40, paso=2, periodo=2.0):
+        self.imgsz = imgsz
+        self.fraccion_roi = fraccion_roi
+        self.fps_objetivo = fps_objetivo
+        self.recorte_sensor = recorte_sensor
+        self.capacidad = capacidad    # bytes/s nominales del enlace (baudios / 10)
+        self.calidad_min = calidad_min
+        self.calidad_max = calidad_max
+        self.paso = paso
+        self.periodo = periodo
+
+        self.calidad = calidad_inicial
+        self.tamano = 'VGA'
+        self.recorte = None
+        self.confirmado = None        # última respuesta "OK ..." del ESP32
+
+        # promedios exponenciales de lo medido
+        self.throughput = None        # bytes/s
+        self.bytes_frame = None       # bytes por frame
+        self.fps = None
+        self._t_ultimo = None
+        self._t_decision = None
+
+    def registrar_frame(self, n_bytes, ahora=None):
+        ahora = time.monotonic() if ahora is None else ahora
+        if self._t_ultimo is not None and ahora > self._t_ultimo:
+            instantaneo = n_bytes / (ahora - self._t_ultimo)
+            fps = 1.0 / (ahora - self._t_ultimo)
+            if self.throughput is None:
+                self.throughput, self.fps = instantaneo, fps
+            else:
+                self.throughput = 0.8 * self.throughput + 0.2 * instantaneo
+                self.fps = 0.8 * self.fps + 0.2 * fps
+        self.bytes_frame = n_bytes if self.bytes_frame is None \
+            else 0.8 * self.bytes_frame + 0.2 * n_bytes
+        self._t_ultimo = ahora
+
+    def registrar_respuesta(self, texto):
+        if texto.startswith('OK'):
+            self.confirmado = texto
+        else:
+            print("⚠️ El ESP32 rechazó la configuración:", texto)
+
+    def objetivo_resolucion(self):
+        """Tamaño y recorte para que el ROI llegue con al menos imgsz píxeles."""
+        if self.recorte_sensor:
+            # el sensor ya manda solo el centro: el frame entero es el ROI
+            m = (1.0 - self.fraccion_roi) / 2
+            recorte = (m, m, self.fraccion_roi, self.fraccion_roi)
+            return tamano_minimo(self.imgsz), recorte
+        return tamano_minimo(self.imgsz / self.fraccion_roi), None
+
+    def decidir(self, ahora=None):
+        """Devuelve el comando CFG a enviar, o None si no hay cambios."""
+        ahora = time.monotonic() if ahora is None else ahora
+        if not self.throughput:
+            return None
+        if self._t_decision is not None and ahora - self._t_decision < self.periodo:
+            return None
+        self._t_decision = ahora
+
+        objetivo, recorte = self.objetivo_resolucion()
+        i_objetivo = _indice(objetivo)
+        i = min(_indice(self.tamano), i_objetivo)
+
+        # Si el enlace está saturado y no se llega a fps_objetivo, se achica
+        # el JPEG: primero la calidad y, ya en la peor, el tamaño. Con fps de
+        # sobra se recupera: primero el tamaño (si entra en el enlace),
+        # después la calidad. Un paso por decisión, con histéresis entre
+        # 0,9 y 1,1–1,3 × fps_objetivo. Si el enlace no está saturado y
+        # faltan fps, el cuello de botella es otro: no se toca nada.
+        saturado = self.throughput >= 0.6 * self.capacidad
+        lento = self.fps < self.fps_objetivo * 0.9
+        holgado = self.fps > self.fps_objetivo * (1.1 if not saturado else 1.3)
+        calidad = self.calidad
+        if saturado and lento:
+            if calidad < self.calidad_max:
+                calidad = min(self.calidad_max, calidad + self.paso)
+            elif i > 0:
+                i -= 1
+        elif holgado:
+            if i < i_objetivo and self._entra(i + 1):
+                i += 1
+            else:
+                calidad = max(self.calidad_min, calidad - self.paso)
+        tamano = TAMANOS[i][0]
+
+        if (tamano, calidad, recorte) == (self.tamano, self.calidad, self.recorte):
+            return None
+        self.tamano, self.calidad, self.recorte = tamano, calidad, recorte
+        return cmd_config(tamano, calidad, recorte)
+
+    def _entra(self, i):
+        """Si el tamaño TAMANOS[i] a fps_objetivo cabe en el 60 % del enlace."""
+        _, ancho, alto = TAMANOS[i]
+        _, ancho_actual, alto_actual = TAMANOS[_indice(self.tamano)]
+        bytes_frame = self.bytes_frame * (ancho * alto) / (ancho_actual * alto_actual)
+        return bytes_frame * self.fps_objetivo <= 0.6 * self.capacidad
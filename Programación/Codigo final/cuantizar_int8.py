@@ -0,0 +1,258 @@
+"""
+Cuantización INT8 (post-entrenamiento, estática) del YOLOv10n exportado a
+ONNX, calibrada con frames de nuestras propias sesiones.
+
+La calibración usa exactamente lo que ve la inferencia: los JPEG grabados
+del ESP32-CAM (gate_rendimiento.py grabar ...) pasan por el mismo
+DecodificadorJPEG (ROI central) y el mismo letterbox que DetectorONNX.
+Solo se cuantizan las Conv/MatMul; la cabeza de YOLOv10 (top-k, gather)
+queda en float para no romper la salida (N, 6).
+
+    python detectores.py exportar --imgsz 224
+    python cuantizar_int8.py --modelo yolov10n.onnx \\
+        --calibracion sesiones/calle1 sesiones/casa \\
+        --evaluacion etiquetadas/ --salida yolov10n_int8.onnx --informe int8.json
+
+El conjunto de evaluación es aparte (no se usa para calibrar): JPEGs con
+etiquetas YOLO (clase cx cy w h, normalizadas al frame completo) en
+<carpeta>/labels/<nombre>.txt o <carpeta>/<nombre>.txt. Se informa mAP@0.5
+y precisión/recall en el punto de trabajo del pipeline, float vs INT8.
+
+Para usarlo: VIA_BACKEND=onnx VIA_MODELO=yolov10n_int8.onnx python deteccion-...py
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import time
+
+import numpy as np
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                      QuantType, quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from decodificacion import DecodificadorJPEG
+from detectores import DetectorONNX, letterbox
+from seguimiento import CONF_NUEVA
+from simulador_esp32 import cargar_jpegs
+
+FRACCION_ROI = 0.5
+IOU_ACIERTO = 0.5
+
+
+# ===============================
+# CALIBRACIÓN
+# ===============================
+def rois_de_sesiones(carpetas, imgsz, maximo=300, fraccion_roi=FRACCION_ROI, recortado=False,
+                     semilla=0):
+    """ROIs como las decodifica el pipeline, repartidas entre todas las sesiones."""
+    jpegs = []
+    for carpeta in carpetas:
+        jpegs.extend(cargar_jpegs(carpeta))
+    if len(jpegs) > maximo:
+        jpegs = random.Random(semilla).sample(jpegs, maximo)
+    decodificador = DecodificadorJPEG(imgsz, fraccion_roi)
+    rois = [decodificador.roi(j, recortado) for j in jpegs]
+    return [r for r in rois if r is not None]
+
+
+class LectorCalibracion(CalibrationDataReader):
+    """Entrega a quantize_static un ROI con letterbox por vez."""
+
+    def __init__(self, nombre_entrada, rois, imgsz):
+        self._pendientes = iter(rois)
+        self._nombre = nombre_entrada
+        self._imgsz = imgsz
+
+    def get_next(self):
+        roi = next(self._pendientes, None)
+        if roi is None:
+            return None
+        return {self._nombre: letterbox(roi, self._imgsz)[0]}
+
+
+def cuantizar(modelo, salida, rois, metodo='minmax'):
+    """Escribe el modelo INT8 (QDQ, pesos por canal) en `salida`."""
+    import onnxruntime as ort
+    entrada = ort.InferenceSession(modelo, providers=['CPUExecutionProvider']).get_inputs()[0]
+    imgsz = entrada.shape[-1]
+
+    preparado = salida + '.pre.onnx'
+    quant_pre_process(modelo, preparado)
+    try:
+        quantize_static(
+            preparado, salida, LectorCalibracion(entrada.name, rois, imgsz),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            op_types_to_quantize=['Conv', 'MatMul'],
+            calibrate_method={'minmax': CalibrationMethod.MinMax,
+                              'percentil': CalibrationMethod.Percentile,
+                              'entropia': CalibrationMethod.Entropy}[metodo])
+    finally:
+        os.remove(preparado)
+    return salida
+
+
+# ===============================
+# EVALUACIÓN
+# ===============================
+def _etiquetas(carpeta, ruta_jpeg):
+    nombre = os.path.splitext(os.path.basename(ruta_jpeg))[0] + '.txt'
+    for ruta in (os.path.join(carpeta, 'labels', nombre), os.path.join(carpeta, nombre)):
+        if os.path.exists(ruta):
+            with open(ruta) as f:
+                return [tuple(float(v) for v in linea.split()[:5]) for linea in f if linea.strip()]
+    return []
+
+
+def _region_normalizada(fraccion):
+    # como region_central, pero en fracciones del frame
+    m = (1.0 - fraccion) / 2
+    return m, m, 1 - m, 1 - m
+
+
+def etiquetas_en_roi(etiquetas, fraccion_roi=FRACCION_ROI, recortado=False):
+    """(clase, x0, y0, x1, y1) normalizadas al ROI; las que caen afuera se descartan."""
+    x0r, y0r, x1r, y1r = (0.0, 0.0, 1.0, 1.0) if recortado else _region_normalizada(fraccion_roi)
+    lado_x, lado_y = x1r - x0r, y1r - y0r
+    cajas = []
+    for clase, cx, cy, w, h in etiquetas:
+        if not (x0r <= cx <= x1r and y0r <= cy <= y1r):
+            continue
+        x0 = min(max((cx - w / 2 - x0r) / lado_x, 0.0), 1.0)
+        y0 = min(max((cy - h / 2 - y0r) / lado_y, 0.0), 1.0)
+        x1 = min(max((cx + w / 2 - x0r) / lado_x, 0.0), 1.0)
+        y1 = min(max((cy + h / 2 - y0r) / lado_y, 0.0), 1.0)
+        cajas.append((int(clase), x0, y0, x1, y1))
+    return cajas
+
+
+def conjunto_etiquetado(carpeta, imgsz, fraccion_roi=FRACCION_ROI, recortado=False):
+    """[(roi, [(clase, x0, y0, x1, y1)])] del conjunto de evaluación."""
+    decodificador = DecodificadorJPEG(imgsz, fraccion_roi)
+    muestras = []
+    for ruta in sorted(glob.glob(os.path.join(carpeta, '*.jp*g'))):
+        with open(ruta, 'rb') as f:
+            roi = decodificador.roi(f.read(), recortado)
+        if roi is not None:
+            muestras.append((roi, etiquetas_en_roi(_etiquetas(carpeta, ruta), fraccion_roi, recortado)))
+    return muestras
+
+
+def _iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _ap(aciertos, total_reales):
+    """AP con interpolación en todos los puntos (VOC 2010+)."""
+    if total_reales == 0:
+        return None
+    if not aciertos:
+        return 0.0
+    aciertos = np.array(aciertos, dtype=np.float64)
+    tp = np.cumsum(aciertos)
+    fp = np.cumsum(1 - aciertos)
+    recall = np.concatenate(([0.0], tp / total_reales, [1.0]))
+    precision = np.concatenate(([1.0], tp / np.maximum(tp + fp, 1e-9), [0.0]))
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    cambios = np.where(recall[1:] != recall[:-1])[0]
+    return float(np.sum((recall[cambios + 1] - recall[cambios]) * precision[cambios + 1]))
+
+
+def evaluar(detector, muestras, conf_trabajo=CONF_NUEVA):
+    """mAP@0.5, precisión/recall con conf_trabajo y latencia media por ROI."""
+    por_clase = {}                # clase → [(conf, acierto)]
+    reales = {}
+    tp = fp = 0
+    tiempos = []
+    for roi, etiquetas in muestras:
+        t0 = time.perf_counter()
+        detecciones = detector.detectar([roi])[0]
+        tiempos.append(time.perf_counter() - t0)
+        for clase, *_ in etiquetas:
+            reales[clase] = reales.get(clase, 0) + 1
+        usadas = set()
+        for d in sorted(detecciones, key=lambda d: -d.conf):
+            mejor, indice = 0.0, None
+            for i, (clase, *caja) in enumerate(etiquetas):
+                if clase != d.clase or i in usadas:
+                    continue
+                iou = _iou(d.caja, caja)
+                if iou > mejor:
+                    mejor, indice = iou, i
+            acierto = mejor >= IOU_ACIERTO
+            if acierto:
+                usadas.add(indice)
+            por_clase.setdefault(d.clase, []).append((d.conf, acierto))
+            if d.conf >= conf_trabajo:
+                tp += acierto
+                fp += not acierto
+
+    aps = {}
+    for clase, total in reales.items():
+        lista = sorted(por_clase.get(clase, []), key=lambda x: -x[0])
+        aps[clase] = _ap([a for _, a in lista], total)
+    total_reales = sum(reales.values())
+    return {
+        'map50': round(float(np.mean(list(aps.values()))), 4) if aps else None,
+        'ap50_por_clase': {detector.nombres.get(c, str(c)): round(ap, 4) for c, ap in aps.items()},
+        'precision': round(tp / (tp + fp), 4) if tp + fp else None,
+        'recall': round(tp / total_reales, 4) if total_reales else None,
+        'latencia_ms': round(1000 * sum(tiempos) / len(tiempos), 2) if tiempos else None,
+    }
+
+
+# ===============================
+# MAIN
+# ===============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Cuantización INT8 de YOLOv10n calibrada con sesiones VIA")
+    ap.add_argument('--modelo', default='yolov10n.onnx', help="ONNX float exportado")
+    ap.add_argument('--calibracion', nargs='+', required=True, help="carpetas de sesiones grabadas")
+    ap.add_argument('--evaluacion', help="carpeta etiquetada (aparte de la calibración)")
+    ap.add_argument('--salida', default='yolov10n_int8.onnx')
+    ap.add_argument('--muestras', type=int, default=300, help="ROIs de calibración")
+    ap.add_argument('--metodo', default='minmax', choices=['minmax', 'percentil', 'entropia'])
+    ap.add_argument('--recortado', action='store_true', help="frames ya recortados en el sensor")
+    ap.add_argument('--informe', help="guardar la comparación como JSON")
+    args = ap.parse_args()
+
+    if args.evaluacion and os.path.abspath(args.evaluacion) in map(os.path.abspath, args.calibracion):
+        raise SystemExit("❌ La carpeta de evaluación no puede ser también de calibración")
+
+    imgsz = DetectorONNX(args.modelo).imgsz
+    rois = rois_de_sesiones(args.calibracion, imgsz, args.muestras, recortado=args.recortado)
+    if not rois:
+        raise SystemExit("❌ No hay frames de calibración")
+    print(f"🎯 Calibrando con {len(rois)} ROIs ({args.metodo}, imgsz {imgsz})...")
+    cuantizar(args.modelo, args.salida, rois, args.metodo)
+    tamano = {ruta: round(os.path.getsize(ruta) / 1e6, 2) for ruta in (args.modelo, args.salida)}
+    print(f"💾 {args.salida} ({tamano[args.salida]} MB, float {tamano[args.modelo]} MB)")
+
+    informe = {'modelo': args.modelo, 'int8': args.salida, 'metodo': args.metodo,
+               'muestras_calibracion': len(rois), 'tamano_mb': tamano}
+    if args.evaluacion:
+        muestras = conjunto_etiquetado(args.evaluacion, imgsz, recortado=args.recortado)
+        print(f"📐 Evaluando en {len(muestras)} imágenes etiquetadas...")
+        resultados = {}
+        for clave, ruta in (('float', args.modelo), ('int8', args.salida)):
+            # conf baja y sin tope de cajas para el mAP; P/R en CONF_NUEVA (lo que se anuncia)
+            resultados[clave] = evaluar(DetectorONNX(ruta, conf=0.001, max_det=300), muestras)
+        delta = {k: round(resultados['int8'][k] - resultados['float'][k], 4)
+                 for k in ('map50', 'precision', 'recall', 'latencia_ms')
+                 if resultados['int8'][k] is not None and resultados['float'][k] is not None}
+        informe.update(resultados, delta=delta)
+        for k in ('map50', 'precision', 'recall', 'latencia_ms'):
+            print(f"  {k:<12} float {resultados['float'][k]}   int8 {resultados['int8'][k]}"
+                  f"   Δ {delta.get(k)}")
+
+    if args.informe:
+        with open(args.informe, 'w') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
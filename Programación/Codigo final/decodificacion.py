@@ -0,0 +1,146 @@
+"""
+Decodificación parcial de los JPEG del ESP32-CAM.
+
+YOLO solo mira el recorte central y lo lleva a imgsz, así que no hace falta
+decodificar el frame entero a resolución completa:
+
+  - con PyTurboJPEG (opcional) se recorta el JPEG sin recomprimir (en
+    bloques MCU) y se decodifica solo ese pedazo, escalado en la DCT;
+  - sin PyTurboJPEG, OpenCV decodifica todo pero a 1/2, 1/4 u 1/8
+    (IMREAD_REDUCED_COLOR_*).
+
+En los dos casos el factor es el mayor que deja el lado largo del ROI en
+al menos `escala_min` × imgsz. Por defecto escala_min = 1: YOLO recibe el
+ROI con imgsz píxeles o más, como sin reducir. Con escala_min < 1 (opcional)
+también se reduce por debajo de imgsz y el letterbox de YOLO agranda el
+ROI: p. ej. el de 320×240 de un frame VGA con imgsz 224 se decodifica a
+1/2 (160 px) y se estira a 224. Ahorra ~0,3 ms por frame en la Pi (1,39 ms
+contra 1,67 ms en benchmark_etapas.py), pero YOLO ve menos detalle y los
+objetos chicos o lejanos se detectan peor: medir el mAP antes de usarlo.
+
+La decodificación completa (o reducida al ancho de un perfil, ver
+reducido()) queda para cuando alguien mira el streaming.
+"""
+import cv2
+import numpy as np
+
+try:
+    from turbojpeg import TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+MODOS_REDUCIDOS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# marcadores SOF (menos DHT 0xC4, JPG 0xC8 y DAC 0xCC, que comparten rango)
+_MARCAS_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def dimensiones_jpeg(datos):
+    """(ancho, alto) leídos de la cabecera SOF sin decodificar, o None."""
+    i, n = 2, len(datos)
+    while i + 9 <= n:
+        if datos[i] != 0xFF:
+            return None
+        marca = datos[i + 1]
+        if marca == 0xFF:             # relleno
+            i += 1
+            continue
+        if marca == 0x01 or 0xD0 <= marca <= 0xD8:
+            i += 2                    # marcadores sin largo
+            continue
+        if marca in _MARCAS_SOF:
+            alto = (datos[i + 5] << 8) | datos[i + 6]
+            ancho = (datos[i + 7] << 8) | datos[i + 8]
+            return ancho, alto
+        if marca == 0xDA:             # empezó la imagen y no hubo SOF
+            return None
+        i += 2 + ((datos[i + 2] << 8) | datos[i + 3])
+    return None
+
+
+def region_central(ancho, alto, fraccion):
+    """(x0, y0, x1, y1) del recorte central de lado `fraccion`."""
+    m = (1.0 - fraccion) / 2
+    return int(ancho * m), int(alto * m), int(ancho * (1 - m)), int(alto * (1 - m))
+
+
+class DecodificadorJPEG:
+    """Decodifica el ROI de inferencia con el menor trabajo posible."""
+
+    def __init__(self, imgsz=224, fraccion_roi=0.5, usar_turbojpeg=True, escala_min=1.0):
+        self.imgsz = imgsz
+        self.fraccion_roi = fraccion_roi
+        self.escala_min = escala_min  # el lado largo reducido no baja de esto × imgsz
+        self._tj = None
+        if usar_turbojpeg and TurboJPEG is not None:
+            try:
+                self._tj = TurboJPEG()
+            except (OSError, RuntimeError) as e:
+                print("⚠️ PyTurboJPEG instalado pero sin libturbojpeg:", e)
+
+    def factor(self, lado_roi):
+        """Mayor reducción (8, 4, 2) que deja `lado_roi` en escala_min × imgsz o más."""
+        for f in (8, 4, 2):
+            if lado_roi / f >= self.escala_min * self.imgsz:
+                return f
+        return 1
+
+    def roi(self, jpeg, recortado=False):
+        """
+        ROI central listo para YOLO (BGR), o None si el JPEG no se puede leer.
+        Si el sensor ya recortó (recortado=True) el frame entero es el ROI.
+        """
+        dims = dimensiones_jpeg(jpeg)
+        if dims is None:
+            frame = self.completo(jpeg)
+            if frame is None or recortado:
+                return frame
+            h, w = frame.shape[:2]
+            x0, y0, x1, y1 = region_central(w, h, self.fraccion_roi)
+            return frame[y0:y1, x0:x1]
+
+        ancho, alto = dims
+        if recortado:
+            x0, y0, x1, y1 = 0, 0, ancho, alto
+        else:
+            x0, y0, x1, y1 = region_central(ancho, alto, self.fraccion_roi)
+        f = self.factor(max(x1 - x0, y1 - y0))
+
+        if self._tj is not None and not recortado:
+            try:
+                return self._roi_turbo(jpeg, ancho, (x0, y0, x1, y1), f)
+            except Exception:
+                pass                  # JPEG raro para tjTransform: ir por OpenCV
+
+        img = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), MODOS_REDUCIDOS[f])
+        if img is None or recortado:
+            return img
+        return img[y0 // f:y1 // f, x0 // f:x1 // f]
+
+    def reducido(self, jpeg, ancho):
+        """Frame entero decodificado a la mayor reducción que deja `ancho` píxeles."""
+        dims = dimensiones_jpeg(jpeg)
+        f = 1
+        if dims is not None:
+            for f in (8, 4, 2, 1):
+                if dims[0] / f >= ancho:
+                    break
+        return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), MODOS_REDUCIDOS[f])
+
+    def completo(self, jpeg):
+        """Frame entero a resolución completa (para el streaming)."""
+        return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def _roi_turbo(self, jpeg, ancho, region, f):
+        x0, y0, x1, y1 = region
+        # tjTransform recorta en múltiplos de MCU (como mucho 32×16 píxeles)
+        xa, ya = x0 - x0 % 32, y0 - y0 % 16
+        recorte = self._tj.crop(bytes(jpeg), xa, ya, min(ancho, x1) - xa, y1 - ya)
+        img = self._tj.decode(recorte, scaling_factor=(1, f))
+        dx, dy = (x0 - xa) // f, (y0 - ya) // f
+        return img[dy:dy + (y1 - y0) // f, dx:dx + (x1 - x0) // f]
@@ -1,52 +1,241 @@
+import os
+import json
+import math
 import serial
-import struct
-import numpy as np
 import cv2
 import time
 import threading
-from flask import Flask, Response
-from ultralytics import YOLO
+import asyncio
+import queue
+from flask import Flask, Response, request
 import subprocess
-import torch
+from protocolo_via import (PoolBuffers, MAX_PAYLOAD, CMD_IMAGEN, FLAG_RECORTE,
+                           SIN_DISTANCIA, es_jpeg, leer_respuesta_imagen)
+from captura_async import GestorCamaras
+from control_camara import ControlAdaptativo
+from telemetria import HistorialDistancias
+from decodificacion import DecodificadorJPEG
+from transmision import Transmision, CanalEventos, TIPO_MJPEG, TIPO_EVENTOS
+from servidor_async import ServidorAsync
+from metricas import Registro, TIPO_PROMETHEUS
+from trazas import Trazador
+from frases import frase_objetos
+from perfilador import PerfiladorMuestreo
+from detectores import crear_detector
+from cambio_escena import DetectorCambio
+from alarma_proximidad import DetectorAcercamiento, AlarmaSonora
+from seguimiento import Seguidor, CONF_MINIMA, CONF_NUEVA
 
 # ===============================
 # CONFIGURACIÓN GENERAL
 # ===============================
-device = 'cpu'
-print(f"🧠 Dispositivo en uso: {device}")
-
-model = YOLO("yolov10n.pt")
+# Motor de inferencia: 'pytorch' (ultralytics, yolov10n.pt), 'onnx' u
+# 'openvino' (grafos exportados con `python detectores.py exportar`, con
+# el mismo IMGSZ). Los tres devuelven las mismas detecciones.
+# VIA_MODELO elige otro archivo, p. ej. el INT8 de cuantizar_int8.py (onnx).
+BACKEND_DETECTOR = os.environ.get('VIA_BACKEND', 'pytorch')
+RUTA_MODELO = os.environ.get('VIA_MODELO')      # None: el de RUTAS_DEFECTO
+IMGSZ = 224           # resolución de entrada de YOLO
+# conf baja a propósito: las detecciones < CONF_NUEVA solo continúan pistas
+# que ya existen (seguimiento.py), no abren ni anuncian objetos nuevos
+detector = crear_detector(BACKEND_DETECTOR, RUTA_MODELO, imgsz=IMGSZ, conf=CONF_MINIMA, iou=0.45,
+                          max_det=3)
+if detector.imgsz != IMGSZ:
+    print(f"⚠️ El modelo exportado es de imgsz {detector.imgsz}, no {IMGSZ}")
+print(f"🧠 Detector: {detector.backend} (CPU, imgsz {detector.imgsz})")
+
+FRACCION_ROI = 0.5    # lado del recorte central que se infiere
+decodificador = DecodificadorJPEG(IMGSZ, FRACCION_ROI)   # solo el ROI, reducido si alcanza
+
+# Inferencia por cambio de escena (cambio_escena.py): a lo sumo cada
+# INTERVALO_MIN mientras cambia algo en el ROI, y cada INTERVALO_MAX aunque
+# la escena siga quieta.
+INTERVALO_MIN = 0.5   # s
+INTERVALO_MAX = 5.0   # s
+
+# Alarma de proximidad (alarma_proximidad.py): un pitido por aplay apenas el
+# HC-SR04 ve algo cerca, cayendo de golpe o acercándose, sin esperar a YOLO,
+# y una inferencia fuera de turno del frame más nuevo de esa cámara.
+ALARMA_PROXIMIDAD = True
+
+# Seguimiento (seguimiento.py): cada objeto tiene un id entre inferencias y
+# se anuncia una vez; se repite si sigue a la vista después de REPETIR_AVISO.
+REPETIR_AVISO = 10.0  # s
 
 # ===============================
 # SERIAL (ESP32-CAM)
 # ===============================
-SERIAL_PORT = '/dev/ttyUSB0'
+SERIAL_PORT = os.environ.get('VIA_PUERTO', '/dev/ttyUSB0')   # VIA_PUERTO: p. ej. el pty de simulador_esp32.py
 BAUDRATE = 500000
-try:
-    ser = serial.Serial(SERIAL_PORT, BAUDRATE, timeout=1)
+MODO_STREAMING = True   # True: el ESP32 envía tramas continuas tras STREAMSTART
+                        # False: un IMGSTART por frame (firmware ≤ v3.4 original)
+
+# Cámaras montadas: id → puerto. La primera es la principal (modo IMGSTART
+# y /video por defecto). Todas se leen desde un solo hilo de captura.
+CAMARAS = {
+    'frente': SERIAL_PORT,
+    # 'izquierda': '/dev/ttyUSB1',
+    # 'derecha': '/dev/ttyUSB2',
+}
+CAMARA_PRINCIPAL = next(iter(CAMARAS))
+# cómo se nombra cada cámara al hablar (solo si hay más de una)
+UBICACION_CAMARA = {'frente': 'adelante', 'izquierda': 'a la izquierda', 'derecha': 'a la derecha'}
+
+puertos = {}
+for camara, puerto in CAMARAS.items():
+    try:
+        puertos[camara] = serial.Serial(puerto, BAUDRATE, timeout=1)
+        print(f"✅ Puerto serial {puerto} ({camara}) abierto a {BAUDRATE} bps.")
+    except Exception as e:
+        print(f"❌ Error abriendo puerto serial {puerto} ({camara}):", e)
+if puertos:
     time.sleep(1.0)
-    print(f"✅ Puerto serial {SERIAL_PORT} abierto a {BAUDRATE} bps.")
-except Exception as e:
-    print("❌ Error abriendo puerto serial:", e)
-    ser = None
+ser = puertos.get(CAMARA_PRINCIPAL)   # modo IMGSTART: solo la principal
+
+# Ajuste automático de tamaño/calidad JPEG según el enlace (solo streaming)
+CONTROL_ADAPTATIVO = True
+FPS_OBJETIVO = 4.0
+RECORTE_EN_SENSOR = False   # OV2640: el sensor manda solo el ROI central
+
+def crear_control(camara):
+    return ControlAdaptativo(imgsz=IMGSZ, fraccion_roi=FRACCION_ROI,
+                             fps_objetivo=FPS_OBJETIVO,
+                             recorte_sensor=RECORTE_EN_SENSOR,
+                             capacidad=BAUDRATE / 10)
+
+# Buffers preasignados: la captura en régimen no asigna memoria por frame
+# (por cámara: imagen en armado, 2 en cola, 1 procesándose y 1 de telemetría)
+pool_buffers = PoolBuffers(cantidad=5 * max(1, len(puertos)), tamano=MAX_PAYLOAD)
+buffer_legacy = memoryview(bytearray(MAX_PAYLOAD))   # modo IMGSTART
+
+# /video manda los JPEG de la cámara tal cual llegan; la distancia y las
+# detecciones van aparte por /estado y la página las dibuja encima.
+# False: se dibujan sobre el frame y se recodifica (más CPU por frame).
+STREAM_DIRECTO = True
+
+# Perfiles de /video?profile=...: cada uno se codifica a lo sumo una vez por
+# frame y solo mientras tiene suscriptores; sus clientes comparten ese JPEG.
+# ancho None = resolución de la cámara (con STREAM_DIRECTO, el JPEG original).
+PERFILES_STREAM = {
+    'high': {'ancho': None, 'calidad': 65},
+    'low': {'ancho': 320, 'calidad': 40},
+}
+PERFIL_DEFECTO = 'high'
+
+# Servidor web: 'flask' (un hilo por cliente) o 'async' (servidor_async.py,
+# todos los clientes en un event loop, con backpressure)
+SERVIDOR = os.environ.get('VIA_SERVIDOR', 'flask')
+PUERTO_WEB = int(os.environ.get('VIA_PUERTO_WEB', 8080))
 
 # ===============================
 # VARIABLES GLOBALES
 # ===============================
-ultimo_jpeg = None
-frame_para_inferencia = None
-objetos_detectados = []
-objetos_para_leer = []
-ultima_deteccion = 0
-ultima_distancia = 0
-intervalo = 3.0
+transmisiones = {camara: {perfil: Transmision(**conf) for perfil, conf in PERFILES_STREAM.items()}
+                 for camara in CAMARAS}   # cámara → perfil → streaming /video
+pendientes_inferencia = {}            # cámara → (jpeg, recortado, seq, traza) todavía no inferido
+ultimos_frames = {}                   # cámara → (jpeg, recortado, seq) más nuevo, para inferir_ya()
+eventos = CanalEventos()              # detecciones para /eventos (SSE)
+lock_pendientes = threading.Lock()
+objetos_detectados = {}               # cámara → últimos objetos detectados
+seguidores = {camara: Seguidor(conf_alta=CONF_NUEVA) for camara in CAMARAS}   # cámara → pistas
+cola_tts = queue.Queue()              # (cámara, objetos, distancia, traza) a anunciar
+trazador = Trazador()                 # trazas de los últimos frames, para /trace
+perfilador = PerfiladorMuestreo(intervalo=0.01)   # /perfil, a pedido
+PERFIL_MAX_SEGUNDOS = 120
+hay_frame_nuevo = threading.Event()   # despierta a la inferencia
+cambios = {camara: DetectorCambio(INTERVALO_MIN, INTERVALO_MAX, FRACCION_ROI)
+           for camara in CAMARAS}     # cámara → referencia de la última inferencia
+historiales = {camara: HistorialDistancias() for camara in CAMARAS}   # cámara → muestras del HC-SR04
+acercamientos = {camara: DetectorAcercamiento() for camara in CAMARAS}   # cámara → filtro del HC-SR04
+alarma = AlarmaSonora()
+cola_alarmas = queue.Queue()          # (cámara, motivo, cm, t de la muestra) a hacer sonar
+gestor_camaras = None                 # GestorCamaras en modo streaming
+servidor_web = None                   # ServidorAsync si SERVIDOR == 'async'
 salida_txt = "detecciones_yolov10n.txt"
 DISTANCIA_MAX_RANGO = 100  # cm — límite para determinar "fuera de rango"
 
+def registrar_distancia(camara, cm, t=None, t_esp=None):
+    historiales[camara].agregar(cm, t, t_esp)
+    if ALARMA_PROXIMIDAD:
+        # corre en el loop de captura o en los hilos de procesar_trama (el
+        # detector tiene lock): solo decide; el pitido va por hilo_alarma
+        motivo = acercamientos[camara].agregar(cm, t)
+        if motivo:
+            cola_alarmas.put((camara, motivo, cm, time.monotonic() if t is None else t))
+
+def distancia_actual(camara):
+    """Última distancia medida por esa cámara (cm), 0 si todavía no hay."""
+    muestra = historiales[camara].ultima()
+    return muestra[1] if muestra else 0
+
+def distancia_en(camara, t):
+    """Distancia más cercana al instante t (time.monotonic)."""
+    muestra = historiales[camara].cercana(t)
+    return muestra[1] if muestra else 0
+
 # crear/limpiar log
 with open(salida_txt, "w") as f:
     f.write("Registro de detecciones (YOLOv10-N)\n=========================\n\n")
 
+# ===============================
+# MÉTRICAS (/metrics)
+# ===============================
+# Cada etapa guarda su serie del histograma: medir cuesta un par de µs.
+metricas = Registro()
+_etapas = metricas.histograma('via_etapa_segundos', "Duración de cada etapa del pipeline", ('etapa',))
+t_captura = _etapas.con('captura')              # leer_frame() en modo IMGSTART
+t_cambio = _etapas.con('cambio_escena')         # miniatura y comparación con la referencia
+t_decodificacion = _etapas.con('decodificacion')  # ROI para YOLO
+t_inferencia = _etapas.con('inferencia')        # detector.detectar del lote
+t_stream = _etapas.con('stream')                # decodificar para un perfil de /video
+t_codificacion = _etapas.con('codificacion')    # imencode de un perfil de /video
+t_espeak = _etapas.con('espeak')                # lanzar espeak
+frames_recibidos = metricas.contador('via_frames_total', "JPEG recibidos", ('camara',))
+frames_descartados = metricas.contador(
+    'via_frames_descartados_total', "Frames que no llegaron a inferirse", ('camara', 'motivo'))
+inferencias = metricas.contador('via_inferencias_total', "Frames inferidos", ('camara',))
+disparos = metricas.contador('via_disparos_inferencia_total', "Por qué se infirió cada frame",
+                             ('camara', 'motivo'))
+detecciones = metricas.contador('via_detecciones_total', "Objetos detectados", ('clase',))
+frases_dichas = metricas.contador('via_frases_total', "Frases lanzadas a espeak")
+alarmas = metricas.contador('via_alarmas_total', "Alarmas de proximidad", ('camara', 'motivo'))
+latencia_alarma = metricas.histograma(
+    'via_distancia_alarma_segundos', "Desde la muestra del HC-SR04 hasta lanzar aplay",
+    cubetas=(0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5))
+latencia_audio = metricas.histograma(
+    'via_captura_audio_segundos', "Desde que se pidió o empezó a llegar el frame hasta lanzar espeak",
+    cubetas=(0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 7.5, 10.0))
+metricas.medidor('via_cambio_escena', "Fracción del ROI que cambió respecto de la última inferencia",
+                 ('camara',), funcion=lambda: {(c,): d.puntaje for c, d in cambios.items()})
+metricas.medidor('via_distancia_cm', "Última distancia del HC-SR04", ('camara',),
+                 funcion=lambda: {(c,): distancia_actual(c) for c in CAMARAS})
+metricas.medidor('via_espectadores', "Clientes de /video", ('camara', 'perfil'),
+                 funcion=lambda: {(c, p): t.espectadores()
+                                  for c, perfiles in transmisiones.items()
+                                  for p, t in perfiles.items()})
+metricas.contador('via_pool_asignaciones_extra_total', "Veces que el pool de buffers se quedó vacío",
+                  funcion=lambda: pool_buffers.asignaciones_extra)
+
+def _estadistica_fuentes(campo, del_parser=True):
+    """{(cámara,): valor} de un contador de cada FuenteFramesAsync (o su parser)."""
+    fuentes = gestor_camaras.fuentes if gestor_camaras else {}
+    return {(c,): getattr(f.parser if del_parser else f, campo) for c, f in fuentes.items()}
+
+for _nombre, _campo, _ayuda in (
+        ('via_tramas_total', 'tramas_ok', "Tramas con CRC válido"),
+        ('via_tramas_corruptas_total', 'tramas_corruptas', "Tramas con CRC inválido"),
+        ('via_tramas_perdidas_total', 'tramas_perdidas', "Huecos en la secuencia"),
+        ('via_imagenes_incompletas_total', 'imagenes_incompletas', "Imágenes con fragmentos perdidos"),
+        ('via_bytes_descartados_total', 'bytes_descartados', "Bytes sin cabecera válida")):
+    metricas.contador(_nombre, _ayuda, ('camara',),
+                      funcion=lambda campo=_campo: _estadistica_fuentes(campo))
+metricas.contador('via_tramas_salteadas_total', "Imágenes reemplazadas en la cola de captura", ('camara',),
+                  funcion=lambda: _estadistica_fuentes('tramas_salteadas', del_parser=False))
+metricas.contador('via_reinicios_stream_total', "Streams reiniciados por falta de frames", ('camara',),
+                  funcion=lambda: _estadistica_fuentes('vencimientos', del_parser=False))
+metricas.contador('via_comandos_camara_total', "CFG enviados por el control adaptativo", ('camara',),
+                  funcion=lambda: _estadistica_fuentes('comandos_enviados', del_parser=False))
+
 # ===============================
 # TTS (espeak)
 # ===============================
@@ -54,81 +243,207 @@ ESPEAK_CMD = '/usr/bin/espeak'
 def hablar(texto):
     """Usa espeak para decir texto sin bloquear."""
     try:
-        subprocess.Popen([ESPEAK_CMD, '-s', '140', '-v', 'es-la', texto],
-                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with t_espeak.medir():
+            subprocess.Popen([ESPEAK_CMD, '-s', '140', '-v', 'es-la', texto],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        frases_dichas.inc()
     except Exception as e:
         print("Error al reproducir voz:", e)
 
 # ===============================
-# FLASK STREAMING
+# WEB: PÁGINA, ESTADO Y STREAMING
 # ===============================
-app = Flask(__name__)
+PAGINA = """<h1>Proyecto VIA - Raspberry Pi 5</h1>
+<h3>ESP32-CAM + HC-SR04 + YOLOv10n</h3>
+<div style="position:relative;display:inline-block">
+  <img id="video" style="display:block">
+  <canvas id="cajas" style="position:absolute;left:0;top:0;width:100%%;height:100%%"></canvas>
+  <div id="estado" style="position:absolute;top:8px;left:10px;color:#ff0;
+       font:bold 20px sans-serif;text-shadow:0 0 3px #000"></div>
+</div>
+<p><a href='/video'>Ver transmisión en vivo</a> · <a href='/estado'>estado (JSON)</a></p>
+<script>
+const cam = new URLSearchParams(location.search).get('cam') || '%(camara)s';
+const img = document.getElementById('video'), lienzo = document.getElementById('cajas');
+const perfil = new URLSearchParams(location.search).get('profile');
+img.src = '/video?cam=' + cam + (perfil ? '&profile=' + perfil : '');
+let deteccion = null;
+
+// las cajas las dibuja el navegador: la Pi no toca el JPEG
+function dibujar() {
+  const w = lienzo.width = img.clientWidth, h = lienzo.height = img.clientHeight;
+  const g = lienzo.getContext('2d');
+  g.clearRect(0, 0, w, h);
+  if (!deteccion) return;
+  g.lineWidth = 2;
+  g.font = 'bold 14px sans-serif';
+  g.strokeStyle = g.fillStyle = '#0f0';
+  g.setLineDash(deteccion.prediccion ? [6, 4] : []);   // extrapoladas entre inferencias
+  for (const d of deteccion.det) {
+    const [x0, y0, x1, y1] = d.caja;
+    g.strokeRect(x0 * w, y0 * h, (x1 - x0) * w, (y1 - y0) * h);
+    g.fillText(d.clase + ' #' + d.id + ' ' + Math.round(d.conf * 100) + '%%', x0 * w + 3, y0 * h + 15);
+  }
+}
+new EventSource('/eventos').onmessage = (m) => {
+  const e = JSON.parse(m.data);
+  if (e.cam === cam) { deteccion = e; dibujar(); }
+};
+img.onload = dibujar;
+window.onresize = dibujar;
+
+async function actualizar() {
+  try {
+    const e = (await (await fetch('/estado')).json())[cam];
+    if (e) document.getElementById('estado').textContent =
+      'Distancia: ' + e.distancia + ' cm' + (e.objetos.length ? ' | ' + e.objetos.join(', ') : '');
+  } catch (err) {}
+  setTimeout(actualizar, 250);
+}
+actualizar();
+</script>"""
+
+def trazas_json(parametros):
+    """
+    /trace?segundos=30: trazas por frame en formato Chrome trace (abrir en
+    ui.perfetto.dev); &formato=resumen da los percentiles por etapa.
+    """
+    try:
+        segundos = float(parametros.get('segundos', 30))
+    except ValueError:
+        return 400, 'text/plain', "segundos inválido"
+    if parametros.get('formato') == 'resumen':
+        return 'application/json', json.dumps(trazador.resumen(segundos))
+    return 'application/json', json.dumps(trazador.chrome(segundos))
+
+def pagina_inicio(parametros):
+    return 'text/html; charset=utf-8', PAGINA % {'camara': CAMARA_PRINCIPAL}
+
+def estado_json(parametros):
+    """Lo que antes se dibujaba sobre el frame, para superponerlo en el cliente."""
+    return 'application/json', json.dumps(
+        {camara: {'distancia': distancia_actual(camara),
+                  'objetos': objetos_detectados.get(camara, [])}
+         for camara in CAMARAS})
+
+def abrir_video(parametros, asincronico=False):
+    """
+    /video?cam=izquierda&profile=low&fps=5&calidad=30 (todo opcional; fps y
+    calidad son topes dentro del perfil)
+    """
+    camara = parametros.get('cam', CAMARA_PRINCIPAL)
+    if camara not in transmisiones:
+        return 404, 'text/plain', f"Cámara desconocida: {camara}"
+    perfil = parametros.get('profile', PERFIL_DEFECTO)
+    if perfil not in transmisiones[camara]:
+        return 400, 'text/plain', f"Perfil desconocido: {perfil} (hay {', '.join(PERFILES_STREAM)})"
+    try:
+        fps = float(parametros['fps']) if 'fps' in parametros else None
+        calidad = int(parametros['calidad']) if 'calidad' in parametros else None
+    except ValueError:
+        return 400, 'text/plain', "fps/calidad inválidos"
+    if fps is not None and not (math.isfinite(fps) and fps > 0):
+        return 400, 'text/plain', "fps tiene que ser un número mayor que 0"
+    if calidad is not None and not 1 <= calidad <= 100:
+        return 400, 'text/plain', "calidad tiene que estar entre 1 y 100"
+    # mientras haya alguien suscripto, la captura produce frames para /video
+    transmision = transmisiones[camara][perfil]
+    if asincronico:
+        return TIPO_MJPEG, transmision.generar_async(fps, calidad)
+    return TIPO_MJPEG, transmision.generar(fps, calidad)
+
+def abrir_perfil(parametros, asincronico=False):
+    """
+    /perfil?segundos=10&formato=colapsado|speedscope: muestrea las pilas de
+    todos los hilos durante ese tiempo y devuelve el perfil (para
+    speedscope.app o flamegraph.pl). La respuesta tarda esos segundos.
+    """
+    try:
+        segundos = float(parametros.get('segundos', 10))
+    except ValueError:
+        return 400, 'text/plain', "segundos inválido"
+    if not 0 < segundos <= PERFIL_MAX_SEGUNDOS:
+        return 400, 'text/plain', f"segundos entre 0 y {PERFIL_MAX_SEGUNDOS}"
+    formato = parametros.get('formato', 'colapsado')
+    if formato not in ('colapsado', 'speedscope'):
+        return 400, 'text/plain', "formato: colapsado o speedscope"
+    if perfilador.ocupado():
+        return 409, 'text/plain', "Ya hay un perfil en curso"
+
+    def perfilar():
+        perfil = perfilador.muestrear(segundos)
+        if perfil is None:
+            return "Ya hay un perfil en curso\n".encode()
+        print(f"🔬 Perfil de {perfil.duracion:.1f} s ({perfil.muestras} muestras)")
+        if formato == 'speedscope':
+            return json.dumps(perfil.speedscope()).encode()
+        return perfil.colapsado().encode()
+
+    # el muestreo bloquea: en el servidor async va a un hilo del executor
+    if asincronico:
+        async def cuerpo():
+            yield await asyncio.get_running_loop().run_in_executor(None, perfilar)
+    else:
+        def cuerpo():
+            yield perfilar()
+    tipo = 'application/json' if formato == 'speedscope' else 'text/plain; charset=utf-8'
+    return tipo, cuerpo()
+
+def abrir_eventos(parametros, asincronico=False):
+    """Una línea JSON por frame: cámara, seq, distancia y cajas (con id de pista)."""
+    return TIPO_EVENTOS, eventos.generar_async() if asincronico else eventos.generar()
+
+# Rutas: f(parámetros) → (tipo, cuerpo) o (estado, tipo, cuerpo). Las sirven
+# Flask y servidor_async por igual; las de flujo dan un generador como cuerpo.
+RUTAS = {
+    '/': pagina_inicio,
+    '/estado': estado_json,
+    '/metrics': lambda parametros: (TIPO_PROMETHEUS, metricas.exponer()),
+    '/trace': trazas_json,
+}
+RUTAS_FLUJO = {
+    '/video': abrir_video,
+    '/eventos': abrir_eventos,
+    '/perfil': abrir_perfil,
+}
 
-@app.route('/')
-def index():
-    return """<h1>Proyecto VIA - Raspberry Pi 5</h1>
-              <h3>ESP32-CAM + HC-SR04 + YOLOv10n</h3>
-              <p><a href='/video'>Ver transmisión en vivo</a></p>"""
+app = Flask(__name__)
 
-def generar_video():
-    global ultimo_jpeg
-    while True:
-        if ultimo_jpeg:
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + ultimo_jpeg + b'\r\n')
-        time.sleep(0.08)
+def vista_flask(funcion):
+    def vista():
+        respuesta = funcion(request.args.to_dict())
+        if len(respuesta) == 2:
+            respuesta = (200,) + tuple(respuesta)
+        estado, tipo, cuerpo = respuesta
+        return Response(cuerpo, status=estado, content_type=tipo)
+    return vista
 
-@app.route('/video')
-def video():
-    return Response(generar_video(), mimetype='multipart/x-mixed-replace; boundary=frame')
+for ruta, funcion in {**RUTAS, **RUTAS_FLUJO}.items():
+    app.add_url_rule(ruta, funcion.__name__, vista_flask(funcion))
 
 # ===============================
 # FUNCIONES AUXILIARES
 # ===============================
-def read_n_bytes(n, timeout=2.0):
+def leer_cuerpo_frame():
+    """Lee distancia + tamaño + JPEG ya en camino y devuelve el JPEG (vista
+    sobre buffer_legacy, válida hasta el próximo frame)."""
     if not ser:
         return None
-    data = bytearray()
-    start = time.time()
-    while len(data) < n:
-        chunk = ser.read(n - len(data))
-        if chunk:
-            data.extend(chunk)
-        elif time.time() - start > timeout:
-            return None
-    return bytes(data)
+    jpeg, motivo = leer_respuesta_imagen(
+        ser, buffer_legacy, lambda cm: registrar_distancia(CAMARA_PRINCIPAL, cm))
+    if motivo:
+        frames_descartados.con(CAMARA_PRINCIPAL, motivo).inc()
+    return jpeg
 
 def leer_frame():
-    """Lee un frame y la distancia del ESP32."""
-    global ultima_distancia
+    """Pide un frame al ESP32 y devuelve su JPEG (la distancia queda registrada)."""
     if not ser:
         return None
     try:
-        ser.reset_input_buffer()
-        ser.write(b"IMGSTART\n")
-
-        dist_bytes = read_n_bytes(2, timeout=1.0)
-        if not dist_bytes:
-            return None
-        ultima_distancia = struct.unpack('>H', dist_bytes)[0]
-
-        size_bytes = read_n_bytes(4, timeout=1.0)
-        if not size_bytes:
-            return None
-        img_size = struct.unpack('>I', size_bytes)[0]
-        if not (1000 <= img_size <= 600000):
-            return None
-
-        img_bytes = read_n_bytes(img_size, timeout=3.0)
-        if not img_bytes or len(img_bytes) != img_size:
-            return None
-
-        if not (img_bytes.startswith(b'\xff\xd8') and img_bytes.endswith(b'\xff\xd9')):
-            return None
-
-        np_arr = np.frombuffer(img_bytes, dtype=np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        return frame
+        with t_captura.medir():
+            ser.reset_input_buffer()
+            ser.write(CMD_IMAGEN)
+            return leer_cuerpo_frame()
 
     except Exception as e:
         print("⚠️ Error lectura serial:", e)
@@ -137,69 +452,195 @@ def leer_frame():
 # ===============================
 # HILO CAPTURA
 # ===============================
-def hilo_captura():
-    global ultimo_jpeg, frame_para_inferencia
-    while True:
-        frame = leer_frame()
-        if frame is None:
-            time.sleep(0.05)
+def procesar_jpeg(camara, jpeg, recortado=False, t=None, seq=None, traza=None):
+    """Deja el JPEG para inferencia y, si alguien mira /video, publica el frame."""
+    # La inferencia decodifica solo el ROI y solo de los frames que usa:
+    # acá basta con copiar el JPEG fuera del buffer (unos 30 KB).
+    copia = bytes(jpeg)
+    frames_recibidos.con(camara).inc()
+    if traza is None:
+        traza = trazador.nueva(camara, t).marcar('recepcion')
+    with lock_pendientes:
+        anterior = pendientes_inferencia.get(camara)
+        pendientes_inferencia[camara] = (copia, recortado, seq, traza)
+        ultimos_frames[camara] = (copia, recortado, seq)
+    if anterior is not None:
+        # la inferencia no llegó a usarlo: lo pisa el más nuevo
+        frames_descartados.con(camara, 'reemplazado').inc()
+    hay_frame_nuevo.set()
+
+    # Solo los perfiles con alguien mirando (y a los que ya les toca según
+    # sus fps); cada resolución se decodifica una sola vez para todos
+    frames = {}
+    for transmision in transmisiones[camara].values():
+        calidad = transmision.quiere_frame()
+        if calidad is None:
+            continue
+        if STREAM_DIRECTO and transmision.ancho is None:
+            # la misma copia sirve para /video: ni decodificar ni recodificar
+            transmision.publicar(copia)
             continue
 
-        cv2.putText(frame, f"Distancia: {ultima_distancia} cm", (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
-
-        h, w = frame.shape[:2]
-        roi = frame[int(h*0.25):int(h*0.75), int(w*0.25):int(w*0.75)]
-
-        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 65])
+        if transmision.ancho not in frames:
+            with t_stream.medir():
+                frames[transmision.ancho] = frame_para_stream(camara, copia, transmision.ancho, t)
+        frame = frames[transmision.ancho]
+        if frame is None:
+            continue
+        with t_codificacion.medir():
+            ok, salida = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, calidad])
         if ok:
-            ultimo_jpeg = jpeg.tobytes()
+            transmision.publicar(salida.tobytes())
+
+def frame_para_stream(camara, jpeg, ancho=None, t=None):
+    """Frame decodificado (y achicado a `ancho`) para un perfil de /video."""
+    if ancho is None:
+        frame = decodificador.completo(jpeg)
+    else:
+        frame = decodificador.reducido(jpeg, ancho)
+        if frame is not None and frame.shape[1] > ancho:
+            alto = round(frame.shape[0] * ancho / frame.shape[1])
+            frame = cv2.resize(frame, (ancho, alto), interpolation=cv2.INTER_AREA)
+    if frame is None or STREAM_DIRECTO:
+        return frame      # con STREAM_DIRECTO los datos van por /estado y /eventos
+
+    # la muestra de distancia más cercana al momento en que llegó el frame
+    distancia = distancia_en(camara, t) if t is not None else distancia_actual(camara)
+    cv2.putText(frame, f"Distancia: {distancia} cm", (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
+    return frame
+
+def procesar_trama(camara, trama):
+    """Corre en el pool de GestorCamaras: procesa y libera la trama."""
+    try:
+        if not es_jpeg(trama.payload):
+            frames_descartados.con(camara, 'jpeg').inc()
+            return
+        if trama.aux != SIN_DISTANCIA:
+            # trama de imagen entera (firmware sin telemetría aparte)
+            registrar_distancia(camara, trama.aux, trama.t)
+        # la traza arranca cuando llegó la (primera) trama del frame
+        traza = trazador.nueva(camara, trama.t).marcar('recepcion')
+        procesar_jpeg(camara, trama.payload, bool(trama.flags & FLAG_RECORTE),
+                      trama.t, trama.seq, traza)
+    finally:
+        trama.liberar()
 
-        frame_para_inferencia = roi
+def hilo_captura():
+    global gestor_camaras
+    if not puertos:
+        return
+    if MODO_STREAMING:
+        # Streaming: un event loop para todas las cámaras, sin polling
+        gestor_camaras = GestorCamaras(puertos, procesar_trama, pool_buffers, plazo_frame=3.0,
+                                       crear_control=crear_control if CONTROL_ADAPTATIVO else None,
+                                       al_distancia=registrar_distancia)
+        asyncio.run(gestor_camaras.correr())
+        return
+    while True:
+        t_pedido = time.monotonic()     # la traza arranca con el IMGSTART
+        jpeg = leer_frame()
+        if jpeg is None:
+            time.sleep(0.05)
+            continue
+        traza = trazador.nueva(CAMARA_PRINCIPAL, t_pedido).marcar('recepcion')
+        procesar_jpeg(CAMARA_PRINCIPAL, jpeg, traza=traza)
         time.sleep(0.12)
 
 # ===============================
 # HILO INFERENCIA
 # ===============================
+def caja_en_frame(xyxyn, recortado):
+    """Caja normalizada al ROI → normalizada al frame que muestra /video."""
+    if recortado:
+        return xyxyn
+    m = (1.0 - FRACCION_ROI) / 2
+    return [m + v * FRACCION_ROI for v in xyxyn]
+
+def publicar_cajas(camara, seq, traza, pistas, recortado, prediccion=False):
+    """Evento de /eventos con las cajas [(pista, caja en el ROI)] de un frame."""
+    cajas = [{'id': pista.id, 'clase': pista.nombre, 'conf': round(pista.conf, 2),
+              'caja': [round(v, 3) for v in caja_en_frame(caja, recortado)]}
+             for pista, caja in pistas]
+    evento = {'cam': camara, 'seq': seq, 'traza': traza.id, 't': round(time.time(), 2),
+              'distancia': distancia_actual(camara), 'det': cajas}
+    if prediccion:
+        evento['prediccion'] = True   # extrapoladas, sin inferencia en este frame
+    eventos.publicar(evento)
+
 def hilo_inferencia():
-    global frame_para_inferencia, ultima_deteccion, objetos_detectados, objetos_para_leer
     while True:
-        if frame_para_inferencia is None or (time.time() - ultima_deteccion < intervalo):
-            time.sleep(0.1)
+        # dormir hasta que la captura publique un frame, sin polling
+        hay_frame_nuevo.wait()
+        hay_frame_nuevo.clear()
+
+        # un solo lote con el frame más nuevo de cada cámara cuya escena
+        # cambió desde su última inferencia (o que ya lleva INTERVALO_MAX)
+        with lock_pendientes:
+            pendientes = list(pendientes_inferencia.items())
+            pendientes_inferencia.clear()
+        lote = []
+        t_toma = time.monotonic()
+        for camara, (jpeg, recortado, seq, traza) in pendientes:
+            with t_cambio.medir():
+                motivo = cambios[camara].decidir(jpeg, recortado, t_toma)
+            if motivo is None:
+                # igual que antes de INTERVALO_MIN: espera al próximo frame,
+                # y mientras tanto las cajas siguen a sus pistas
+                frames_descartados.con(camara, 'sin_cambio').inc()
+                publicar_cajas(camara, seq, traza, seguidores[camara].predecir(traza.t0),
+                               recortado, prediccion=True)
+                continue
+            disparos.con(camara, motivo).inc()
+            traza.marcar('espera_inferencia', t_toma)
+            with t_decodificacion.medir():
+                roi = decodificador.roi(jpeg, recortado)
+            traza.marcar('decodificacion')
+            if roi is not None:
+                lote.append((camara, roi, recortado, seq, traza, motivo))
+            else:
+                frames_descartados.con(camara, 'decodificacion').inc()
+                trazador.cerrar(traza, seq=seq, descartado='decodificacion')
+        if not lote:
             continue
 
-        frame = frame_para_inferencia
         try:
-            with torch.inference_mode():
-                results = model.predict(
-                    frame,
-                    conf=0.45,
-                    iou=0.45,
-                    imgsz=224,
-                    max_det=3,
-                    verbose=False,
-                    device=device
-                )
-
-            objetos = []
-            for r in results:
-                if hasattr(r, 'boxes') and r.boxes is not None:
-                    for box in r.boxes:
-                        cls = int(box.cls[0]) if hasattr(box, 'cls') else int(box.cls)
-                        if 0 <= cls < len(model.names):
-                            objetos.append(model.names[cls])
-
-            if objetos:
-                objetos_detectados = list(set(objetos))
-                objetos_para_leer.extend(objetos_detectados)
-
-                estado = "FUERA DE RANGO" if ultima_distancia > DISTANCIA_MAX_RANGO else "EN RANGO"
-                linea = f"[{time.strftime('%H:%M:%S')}] {ultima_distancia} cm ({estado}) -> {', '.join(objetos_detectados)}"
-                print(linea)
-                with open(salida_txt, "a") as f:
-                    f.write(linea + "\n")
-
-            ultima_deteccion = time.time()
+            with t_inferencia.medir():
+                resultados = detector.detectar([roi for _, roi, _, _, _, _ in lote])
+
+            t_resultado = time.monotonic()
+            for (camara, _, recortado, seq, traza, motivo), dets in zip(lote, resultados):
+                traza.marcar('inferencia', t_resultado)
+                inferencias.con(camara).inc()
+                seguidor = seguidores[camara]
+                visibles = seguidor.actualizar(dets, traza.t0)
+                for pista in visibles:
+                    detecciones.con(pista.nombre).inc()
+
+                # también sin detecciones: así la página borra las cajas viejas
+                publicar_cajas(camara, seq, traza, [(p, p.caja) for p in visibles], recortado)
+                objetos_detectados[camara] = list(dict.fromkeys(p.nombre for p in visibles))
+
+                # solo las pistas que todavía no se dijeron; ante una alarma
+                # de proximidad, todo lo que está a la vista
+                nuevas = seguidor.por_anunciar(t_resultado, REPETIR_AVISO,
+                                               todas=motivo == 'proximidad')
+                if nuevas:
+                    objetos = list(dict.fromkeys(p.nombre for p in nuevas))
+                    # la distancia más nueva, no la del frame: el aviso no
+                    # espera a que termine de llegar otra imagen
+                    distancia = distancia_actual(camara)
+                    traza.marcar('resultado')
+                    cola_tts.put((camara, objetos, distancia, traza))
+
+                    estado = "FUERA DE RANGO" if distancia > DISTANCIA_MAX_RANGO else "EN RANGO"
+                    ids = ', '.join(f"{p.nombre} #{p.id}" for p in nuevas)
+                    linea = f"[{time.strftime('%H:%M:%S')}] [{camara}] {distancia} cm ({estado}) -> {ids}"
+                    print(linea)
+                    with open(salida_txt, "a") as f:
+                        f.write(linea + "\n")
+                else:
+                    trazador.cerrar(traza, seq=seq, detecciones=len(visibles))
 
         except Exception as e:
             print("❌ Error en inferencia:", e)
@@ -208,39 +649,79 @@ def hilo_inferencia():
 # ===============================
 # HILO TTS (con control de rango)
 # ===============================
+def armar_texto(objs, distancia, camara=None):
+    """Frase a decir para los objetos de una cámara."""
+    ubicacion = None
+    if camara is not None and len(CAMARAS) > 1:
+        ubicacion = UBICACION_CAMARA.get(camara, camara)
+    return frase_objetos(objs, distancia, DISTANCIA_MAX_RANGO, ubicacion)
+
 def hilo_tts():
-    global objetos_para_leer, ultima_distancia
     while True:
-        if objetos_para_leer:
-            objs = objetos_para_leer.copy()
-            objetos_para_leer.clear()
-
-            if ultima_distancia > DISTANCIA_MAX_RANGO:
-                # fuera de rango
-                if len(objs) == 1:
-                    texto = f"{objs[0]} fuera de rango"
-                else:
-                    texto_obj = ", ".join(objs[:-1]) + f" y {objs[-1]}"
-                    texto = f"{texto_obj} fuera de rango"
-            else:
-                # dentro del rango
-                if len(objs) == 1:
-                    texto = f"{objs[0]} detectado a {ultima_distancia} centímetros"
-                else:
-                    texto_obj = ", ".join(objs[:-1]) + f" y {objs[-1]}"
-                    texto = f"{texto_obj} detectados a {ultima_distancia} centímetros"
-
+        pendientes = [cola_tts.get()]     # bloquea hasta que haya algo que decir
+        while not cola_tts.empty():
+            pendientes.append(cola_tts.get_nowait())
+
+        # una frase por cámara con lo último que informó
+        t_toma = time.monotonic()
+        por_camara = {}
+        for camara, objs, distancia, traza in pendientes:
+            traza.marcar('espera_tts', t_toma)
+            if camara in por_camara:
+                # la pisa una más nueva de la misma cámara: no se dice
+                trazador.cerrar(por_camara[camara][2], agrupada=True)
+            por_camara[camara] = (objs, distancia, traza)
+        for camara, (objs, distancia, traza) in por_camara.items():
+            if not objs:
+                trazador.cerrar(traza)
+                continue
+            texto = armar_texto(objs, distancia, camara)
             hablar(texto)
+            traza.marcar('espeak')
+            latencia_audio.observar(traza.t_fin - traza.t0)
+            trazador.cerrar(traza, frase=texto)
 
-        time.sleep(0.3)
+# ===============================
+# HILO ALARMA
+# ===============================
+def inferir_ya(camara):
+    """Infiere el frame más nuevo de la cámara sin esperar a un cambio de escena."""
+    cambios[camara].forzar('proximidad')
+    with lock_pendientes:
+        if camara not in pendientes_inferencia and camara in ultimos_frames:
+            # ya se infirió o se salteó: se vuelve a poner, con traza nueva
+            jpeg, recortado, seq = ultimos_frames[camara]
+            traza = trazador.nueva(camara).marcar('recepcion')
+            pendientes_inferencia[camara] = (jpeg, recortado, seq, traza)
+    hay_frame_nuevo.set()
+
+def hilo_alarma():
+    while True:
+        camara, motivo, cm, t = cola_alarmas.get()
+        if alarma.sonar(motivo):
+            latencia_alarma.observar(time.monotonic() - t)
+        alarmas.con(camara, motivo).inc()
+        print(f"🚨 [{camara}] {motivo}: {cm} cm")
+        inferir_ya(camara)
 
 # ===============================
 # MAIN
 # ===============================
 if __name__ == "__main__":
-    threading.Thread(target=hilo_captura, daemon=True).start()
-    threading.Thread(target=hilo_inferencia, daemon=True).start()
-    threading.Thread(target=hilo_tts, daemon=True).start()
-
-    print("🌐 Servidor activo en: http://0.0.0.0:8080")
-    app.run(host="0.0.0.0", port=8080, debug=False, threaded=True)
+    # con nombre: así aparecen en /perfil
+    threading.Thread(target=hilo_captura, name='hilo_captura', daemon=True).start()
+    threading.Thread(target=hilo_inferencia, name='hilo_inferencia', daemon=True).start()
+    threading.Thread(target=hilo_tts, name='hilo_tts', daemon=True).start()
+    threading.Thread(target=hilo_alarma, name='hilo_alarma', daemon=True).start()
+
+    print(f"🌐 Servidor ({SERVIDOR}) activo en: http://0.0.0.0:{PUERTO_WEB}")
+    if SERVIDOR == 'async':
+        servidor_web = ServidorAsync(RUTAS, RUTAS_FLUJO, puerto=PUERTO_WEB)
+        # solo existen con el servidor async (Flask no los lleva)
+        metricas.medidor('via_clientes_flujo', "Clientes de /video y /eventos (servidor async)",
+                         funcion=lambda: servidor_web.clientes_flujo)
+        metricas.contador('via_desconectados_lentos_total', "Clientes cortados por no avanzar",
+                          funcion=lambda: servidor_web.desconectados_lentos)
+        asyncio.run(servidor_web.correr())
+    else:
+        app.run(host="0.0.0.0", port=PUERTO_WEB, debug=False, threaded=True)
@@ -0,0 +1,259 @@
+"""
+Detectores YOLOv10n intercambiables: PyTorch (ultralytics), ONNX Runtime y
+OpenVINO.
+
+Todos reciben una lista de ROIs BGR y devuelven, por ROI, una lista de
+Deteccion(clase, nombre, conf, caja) con la caja (x0, y0, x1, y1)
+normalizada al ROI. Así hilo_inferencia() no depende del motor.
+
+ultralytics.predict agrega mucho Python por llamada (preproceso, objetos
+Results, hooks); con ONNX Runtime u OpenVINO queda solo letterbox + una
+llamada al motor + filtrar la salida. YOLOv10 no necesita NMS: el grafo
+exportado ya da (1, 300, 6) = x0, y0, x1, y1, puntaje, clase.
+
+Exportar una vez (necesita ultralytics, en cualquier máquina):
+
+    python detectores.py exportar --imgsz 224        # .onnx y _openvino_model/
+
+Los grafos exportados tienen el imgsz fijo: usar el mismo que IMGSZ.
+"""
+import argparse
+import ast
+import os
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+Deteccion = namedtuple('Deteccion', 'clase nombre conf caja')
+
+RUTAS_DEFECTO = {
+    'pytorch': 'yolov10n.pt',
+    'onnx': 'yolov10n.onnx',
+    'openvino': 'yolov10n_openvino_model',
+}
+
+# las 80 clases de COCO, por si el grafo exportado no trae los nombres
+NOMBRES_COCO = (
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat',
+    'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'bench', 'bird', 'cat',
+    'dog', 'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra', 'giraffe', 'backpack',
+    'umbrella', 'handbag', 'tie', 'suitcase', 'frisbee', 'skis', 'snowboard', 'sports ball',
+    'kite', 'baseball bat', 'baseball glove', 'skateboard', 'surfboard', 'tennis racket',
+    'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple',
+    'sandwich', 'orange', 'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair',
+    'couch', 'potted plant', 'bed', 'dining table', 'toilet', 'tv', 'laptop', 'mouse',
+    'remote', 'keyboard', 'cell phone', 'microwave', 'oven', 'toaster', 'sink',
+    'refrigerator', 'book', 'clock', 'vase', 'scissors', 'teddy bear', 'hair drier',
+    'toothbrush')
+
+
+def _nombres(texto):
+    """Nombres de clase de los metadatos de ultralytics ("{0: 'person', ...}")."""
+    try:
+        nombres = ast.literal_eval(texto)
+        return {int(k): str(v) for k, v in nombres.items()}
+    except (ValueError, SyntaxError, AttributeError):
+        return None
+
+
+def letterbox(roi, imgsz):
+    """
+    ROI BGR → tensor (1, 3, imgsz, imgsz) float32 RGB 0–1, con bordes grises
+    como ultralytics. Devuelve también (escala, dx, dy) para deshacerlo.
+    """
+    h, w = roi.shape[:2]
+    escala = min(imgsz / w, imgsz / h)
+    nw, nh = round(w * escala), round(h * escala)
+    if (nw, nh) != (w, h):
+        roi = cv2.resize(roi, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    dx, dy = (imgsz - nw) // 2, (imgsz - nh) // 2
+    lienzo = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    lienzo[dy:dy + nh, dx:dx + nw] = roi
+    tensor = lienzo[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+    return np.ascontiguousarray(tensor), (escala, dx, dy)
+
+
+class _DetectorExportado:
+    """Pre y posproceso comunes a los grafos exportados (salida (1, N, 6))."""
+    backend = None
+
+    def __init__(self, imgsz, conf=0.45, max_det=3):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.max_det = max_det
+        self.nombres = dict(enumerate(NOMBRES_COCO))
+
+    def detectar(self, rois):
+        resultados = []
+        for roi in rois:
+            tensor, ajuste = letterbox(roi, self.imgsz)
+            salida = self._correr(tensor)
+            resultados.append(self._convertir(salida, ajuste, roi.shape[:2]))
+        return resultados
+
+    def _correr(self, tensor):
+        raise NotImplementedError
+
+    def _convertir(self, salida, ajuste, forma):
+        salida = np.asarray(salida).reshape(-1, salida.shape[-1])
+        if salida.shape[1] != 6:
+            raise ValueError(f"Salida {salida.shape}: se esperaba un YOLOv10 exportado (N, 6)")
+        salida = salida[salida[:, 4] >= self.conf]
+        salida = salida[np.argsort(-salida[:, 4])[:self.max_det]]
+        escala, dx, dy = ajuste
+        h, w = forma
+        detecciones = []
+        for x0, y0, x1, y1, conf, clase in salida.tolist():
+            clase = int(clase)
+            caja = (min(max((x0 - dx) / escala / w, 0.0), 1.0),
+                    min(max((y0 - dy) / escala / h, 0.0), 1.0),
+                    min(max((x1 - dx) / escala / w, 0.0), 1.0),
+                    min(max((y1 - dy) / escala / h, 0.0), 1.0))
+            detecciones.append(Deteccion(clase, self.nombres.get(clase, str(clase)), conf, caja))
+        return detecciones
+
+
+# ===============================
+# MOTORES
+# ===============================
+class DetectorPyTorch:
+    """ultralytics + PyTorch, como hasta ahora (acepta cualquier imgsz)."""
+    backend = 'pytorch'
+
+    def __init__(self, ruta=RUTAS_DEFECTO['pytorch'], imgsz=224, conf=0.45, iou=0.45,
+                 max_det=3, device='cpu'):
+        import torch
+        from ultralytics import YOLO
+        self._torch = torch
+        self.model = YOLO(ruta)
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        self.device = device
+        self.nombres = self.model.names
+
+    def detectar(self, rois):
+        with self._torch.inference_mode():
+            resultados = self.model.predict(rois, conf=self.conf, iou=self.iou, imgsz=self.imgsz,
+                                            max_det=self.max_det, verbose=False, device=self.device)
+        salida = []
+        for r in resultados:
+            cajas = getattr(r, 'boxes', None)
+            if cajas is None:
+                salida.append([])
+                continue
+            salida.append([Deteccion(int(c), self.nombres.get(int(c), str(int(c))), p, tuple(xyxyn))
+                           for c, p, xyxyn in zip(cajas.cls.tolist(), cajas.conf.tolist(),
+                                                  cajas.xyxyn.tolist())])
+        return salida
+
+
+class DetectorONNX(_DetectorExportado):
+    """ONNX Runtime en CPU, con un hilo por núcleo."""
+    backend = 'onnx'
+
+    def __init__(self, ruta=RUTAS_DEFECTO['onnx'], imgsz=None, conf=0.45, iou=None,
+                 max_det=3, hilos=None):
+        import onnxruntime as ort
+        opciones = ort.SessionOptions()
+        opciones.intra_op_num_threads = hilos or os.cpu_count() or 1
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.sesion = ort.InferenceSession(ruta, opciones, providers=['CPUExecutionProvider'])
+        entrada = self.sesion.get_inputs()[0]
+        self._entrada = entrada.name
+        fijo = entrada.shape[-1] if isinstance(entrada.shape[-1], int) else None
+        super().__init__(fijo or imgsz or 224, conf, max_det)
+        nombres = _nombres(self.sesion.get_modelmeta().custom_metadata_map.get('names', ''))
+        if nombres:
+            self.nombres = nombres
+
+    def _correr(self, tensor):
+        return self.sesion.run(None, {self._entrada: tensor})[0]
+
+
+class DetectorOpenVINO(_DetectorExportado):
+    """OpenVINO en CPU con hint de latencia. Lee la carpeta exportada o un .onnx."""
+    backend = 'openvino'
+
+    def __init__(self, ruta=RUTAS_DEFECTO['openvino'], imgsz=None, conf=0.45, iou=None,
+                 max_det=3):
+        import openvino as ov
+        if os.path.isdir(ruta):
+            xml = [f for f in os.listdir(ruta) if f.endswith('.xml')]
+            if not xml:
+                raise FileNotFoundError(f"No hay un .xml en {ruta}")
+            modelo = os.path.join(ruta, xml[0])
+        else:
+            modelo = ruta
+        nucleo = ov.Core()
+        red = nucleo.read_model(modelo)
+        fijo = red.input(0).get_partial_shape()[-1]
+        self.compilado = nucleo.compile_model(red, 'CPU', {'PERFORMANCE_HINT': 'LATENCY'})
+        self._pedido = self.compilado.create_infer_request()
+        super().__init__(fijo.get_length() if fijo.is_static else (imgsz or 224), conf, max_det)
+        nombres = self._nombres_de(ruta if os.path.isdir(ruta) else os.path.dirname(modelo))
+        if nombres:
+            self.nombres = nombres
+
+    @staticmethod
+    def _nombres_de(carpeta):
+        # metadata.yaml de ultralytics: "names:\n  0: person\n  1: bicycle ..."
+        ruta = os.path.join(carpeta, 'metadata.yaml')
+        if not os.path.exists(ruta):
+            return None
+        nombres, dentro = {}, False
+        with open(ruta, encoding='utf-8') as f:
+            for linea in f:
+                if linea.startswith('names:'):
+                    dentro = True
+                elif dentro and linea.startswith('  ') and ':' in linea:
+                    clave, valor = linea.strip().split(':', 1)
+                    nombres[int(clave)] = valor.strip().strip("'\"")
+                elif dentro:
+                    break
+        return nombres or None
+
+    def _correr(self, tensor):
+        self._pedido.infer({0: tensor})
+        return self._pedido.get_output_tensor(0).data
+
+
+BACKENDS = {
+    'pytorch': DetectorPyTorch,
+    'onnx': DetectorONNX,
+    'openvino': DetectorOpenVINO,
+}
+
+
+def crear_detector(backend='pytorch', ruta=None, **opciones):
+    """Detector del motor pedido ('pytorch', 'onnx', 'openvino')."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend} (hay {', '.join(BACKENDS)})")
+    return BACKENDS[backend](ruta or RUTAS_DEFECTO[backend], **opciones)
+
+
+def exportar(ruta_pt=RUTAS_DEFECTO['pytorch'], imgsz=224, formatos=('onnx', 'openvino')):
+    """Exporta los pesos de ultralytics a ONNX y/o OpenVINO con imgsz fijo."""
+    from ultralytics import YOLO
+    rutas = {}
+    for formato in formatos:
+        rutas[formato] = YOLO(ruta_pt).export(format=formato, imgsz=imgsz, simplify=True)
+    return rutas
+
+
+# ===============================
+# MAIN
+# ===============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Detectores YOLOv10n")
+    sub = ap.add_subparsers(dest='accion', required=True)
+    e = sub.add_parser('exportar', help="exportar los pesos .pt a ONNX y OpenVINO")
+    e.add_argument('--pesos', default=RUTAS_DEFECTO['pytorch'])
+    e.add_argument('--imgsz', type=int, default=224)
+    e.add_argument('--formatos', nargs='+', default=['onnx', 'openvino'], choices=['onnx', 'openvino'])
+    args = ap.parse_args()
+
+    for formato, ruta in exportar(args.pesos, args.imgsz, args.formatos).items():
+        print(f"💾 {formato}: {ruta}")
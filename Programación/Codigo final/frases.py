@@ -0,0 +1,29 @@
+"""
+Frases que se anuncian por espeak.
+
+Separado del script principal para poder usarlo (y medirlo) sin abrir el
+puerto serial ni cargar el modelo.
+"""
+DISTANCIA_MAX_RANGO = 100  # cm — límite para determinar "fuera de rango"
+
+
+def enumerar(objs):
+    """['a', 'b', 'c'] → 'a, b y c'."""
+    if len(objs) == 1:
+        return objs[0]
+    return ", ".join(objs[:-1]) + f" y {objs[-1]}"
+
+
+def frase_objetos(objs, distancia, distancia_max=DISTANCIA_MAX_RANGO, ubicacion=None):
+    """Frase para los objetos detectados a `distancia` cm (y dónde, si se da)."""
+    if distancia > distancia_max:
+        # fuera de rango
+        texto = f"{enumerar(objs)} fuera de rango"
+    elif len(objs) == 1:
+        texto = f"{objs[0]} detectado a {distancia} centímetros"
+    else:
+        texto = f"{enumerar(objs)} detectados a {distancia} centímetros"
+
+    if ubicacion:
+        texto += ", " + ubicacion
+    return texto
@@ -0,0 +1,323 @@
+"""
+Control de regresiones de rendimiento contra presupuestos guardados en el repo.
+
+Reproduce una sesión fija (JPEGs + traza de distancias) con el simulador
+del ESP32-CAM, corre el script principal de verdad contra ese pty y mide
+desde afuera, por /metrics y /trace:
+
+    fps_captura            frames recibidos por segundo
+    fps_inferencia         frames inferidos por segundo
+    inferencia_p50/p95_ms  model.predict del lote
+    captura_audio_p50/p95_ms  del frame a espeak (solo si hubo frases)
+    rss_pico_mb            memoria máxima del proceso (VmHWM)
+
+y compara contra presupuestos_rendimiento.json. Sale con error si alguna
+métrica se pasa de su presupuesto por más del margen.
+
+La medición empieza después de un calentamiento: la primera inferencia y
+después hasta que el control adaptativo de la cámara convergió (una
+ventana sin CFG nuevos y con fps de captura parecidos a la anterior). Con
+la sesión sintética, los JPEG de ~77 KB tardan unos 45 s en bajar al
+tamaño que entra en el enlace; medir desde antes daría la rampa, no el
+régimen.
+
+
+    python gate_rendimiento.py correr --sesion sesiones/calle1 --segundos 60
+    python gate_rendimiento.py correr --margen 0.2 --salida ultima.json
+
+Sin --sesion usa la sesión sintética del simulador (siempre la misma).
+Para grabar una sesión real desde la cámara conectada:
+
+    python gate_rendimiento.py grabar sesiones/calle1 --puerto /dev/ttyUSB0 --segundos 60
+
+Cuando un cambio mejora (o empeora a propósito) el rendimiento, --actualizar
+reescribe los presupuestos con lo medido y ese cambio queda en el commit.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from simulador_esp32 import (SimuladorESP32, cargar_jpegs, cargar_distancias,
+                             jpegs_sinteticos, distancias_sinteticas)
+
+CARPETA = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(CARPETA, 'deteccion-yolov10-tts-v4.1.2.py')
+PRESUPUESTOS = os.path.join(CARPETA, 'presupuestos_rendimiento.json')
+ARCHIVO_DISTANCIAS = 'distancias.txt'
+
+
+# ===============================
+# SESIONES
+# ===============================
+def cargar_sesion(carpeta=None):
+    """(jpegs, distancias, descripción). Sin carpeta, la sesión sintética."""
+    if carpeta is None:
+        return jpegs_sinteticos(), distancias_sinteticas('aproximacion'), 'sintetica'
+    jpegs = cargar_jpegs(carpeta)
+    ruta = os.path.join(carpeta, ARCHIVO_DISTANCIAS)
+    distancias = cargar_distancias(ruta) if os.path.exists(ruta) else distancias_sinteticas()
+    return jpegs, distancias, os.path.abspath(carpeta)
+
+
+def grabar_sesion(carpeta, puerto, segundos, baudios=500000):
+    """Guarda los JPEGs y las distancias que manda una ESP32-CAM en streaming."""
+    import serial
+    from protocolo_via import (LectorTramas, PoolBuffers, TIPO_IMAGEN, TIPO_DISTANCIA,
+                               CMD_STREAM_INICIO, CMD_STREAM_FIN, SIN_DISTANCIA, es_jpeg)
+
+    os.makedirs(carpeta, exist_ok=True)
+    ser = serial.Serial(puerto, baudios, timeout=1)
+    lector = LectorTramas(ser, PoolBuffers(cantidad=3))
+    ser.write(CMD_STREAM_FIN)
+    time.sleep(0.2)
+    ser.reset_input_buffer()
+    ser.write(CMD_STREAM_INICIO)
+    imagenes = 0
+    fin = time.monotonic() + segundos
+    try:
+        with open(os.path.join(carpeta, ARCHIVO_DISTANCIAS), 'w') as f:
+            f.write("# cm, una muestra por período del HC-SR04\n")
+            while time.monotonic() < fin:
+                trama = lector.leer_trama(timeout=fin - time.monotonic())
+                if trama is None:
+                    break
+                try:
+                    if trama.tipo == TIPO_DISTANCIA:
+                        f.write(f"{trama.aux}\n")
+                    elif trama.tipo == TIPO_IMAGEN and es_jpeg(trama.payload):
+                        if trama.aux != SIN_DISTANCIA:
+                            f.write(f"{trama.aux}\n")      # firmware sin telemetría aparte
+                        with open(os.path.join(carpeta, f"{imagenes:05d}.jpg"), 'wb') as img:
+                            img.write(trama.payload)
+                        imagenes += 1
+                finally:
+                    trama.liberar()
+    finally:
+        ser.write(CMD_STREAM_FIN)
+        ser.close()
+    return imagenes
+
+
+# ===============================
+# CORRIDA
+# ===============================
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _pedir(url, timeout=5.0):
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        return r.read().decode('utf-8')
+
+
+def sumar_metrica(texto, nombre):
+    """Suma de todas las series de una métrica en el texto de /metrics."""
+    total = None
+    for linea in texto.splitlines():
+        if linea.startswith(nombre) and linea[len(nombre):len(nombre) + 1] in ('{', ' '):
+            total = (total or 0) + float(linea.rsplit(' ', 1)[1])
+    return total
+
+
+def _rss_pico_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for linea in f:
+            if linea.startswith('VmHWM:'):
+                return int(linea.split()[1]) / 1024.0
+    return None
+
+
+def esperar_regimen(base, proceso, limite, ventana=10.0, tolerancia=0.15):
+    """
+    Espera a que la captura esté en régimen: una ventana sin comandos CFG
+    y con fps de captura a menos de `tolerancia` de la ventana anterior.
+    Devuelve los segundos que tardó.
+    """
+    t0 = time.monotonic()
+    texto = _pedir(base + '/metrics')
+    fps_anterior = None
+    while True:
+        time.sleep(ventana)
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El script terminó en el calentamiento (código {proceso.returncode})")
+        nuevo = _pedir(base + '/metrics')
+        frames = (sumar_metrica(nuevo, 'via_frames_total') or 0) - \
+            (sumar_metrica(texto, 'via_frames_total') or 0)
+        ajustes = sumar_metrica(nuevo, 'via_comandos_camara_total') != \
+            sumar_metrica(texto, 'via_comandos_camara_total')
+        fps, texto = frames / ventana, nuevo
+        if not ajustes and fps > 0 and fps_anterior is not None \
+                and abs(fps - fps_anterior) <= tolerancia * fps_anterior:
+            return time.monotonic() - t0
+        if time.monotonic() > limite:
+            raise RuntimeError(f"La captura no se estabilizó (última ventana {fps:.2f} fps)")
+        fps_anterior = fps
+
+
+def medir_sesion(jpegs, distancias, segundos, arranque=180.0, calentamiento=180.0, log=None):
+    """Corre el script principal contra la sesión y devuelve las métricas."""
+    sim = SimuladorESP32(jpegs, distancias, semilla=0).iniciar()
+    puerto_web = _puerto_libre()
+    entorno = dict(os.environ, VIA_PUERTO=sim.ruta, VIA_SERVIDOR='async',
+                   VIA_PUERTO_WEB=str(puerto_web))
+    salida = open(log, 'w') if log else subprocess.DEVNULL
+    proceso = subprocess.Popen([sys.executable, SCRIPT], cwd=CARPETA, env=entorno,
+                               stdout=salida, stderr=subprocess.STDOUT)
+    base = f'http://127.0.0.1:{puerto_web}'
+    try:
+        # esperar a que cargue el modelo y haga la primera inferencia
+        limite = time.monotonic() + arranque
+        while True:
+            if proceso.poll() is not None:
+                raise RuntimeError(f"El script terminó al arrancar (código {proceso.returncode})")
+            if time.monotonic() > limite:
+                raise RuntimeError(f"Sin inferencias después de {arranque:.0f} s")
+            try:
+                if sumar_metrica(_pedir(base + '/metrics'), 'via_inferencias_total'):
+                    break
+            except OSError:
+                pass
+            time.sleep(1.0)
+        regimen = esperar_regimen(base, proceso, time.monotonic() + calentamiento)
+
+        antes = _pedir(base + '/metrics')
+        t0 = time.monotonic()
+        time.sleep(segundos)
+        despues = _pedir(base + '/metrics')
+        duracion = time.monotonic() - t0
+        resumen = json.loads(_pedir(f'{base}/trace?segundos={duracion:.0f}&formato=resumen'))
+        rss = _rss_pico_mb(proceso.pid)
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+        sim.cerrar()
+        if log:
+            salida.close()
+
+    def tasa(nombre):
+        return (sumar_metrica(despues, nombre) or 0) - (sumar_metrica(antes, nombre) or 0)
+
+    medido = {
+        'fps_captura': round(tasa('via_frames_total') / duracion, 2),
+        'fps_inferencia': round(tasa('via_inferencias_total') / duracion, 3),
+        'rss_pico_mb': round(rss, 1) if rss else None,
+        'calentamiento_s': round(regimen, 1),
+    }
+    inferencia = resumen.get('etapas', {}).get('inferencia')
+    if inferencia:
+        medido['inferencia_p50_ms'] = inferencia['p50_ms']
+        medido['inferencia_p95_ms'] = inferencia['p95_ms']
+    audio = resumen.get('captura_audio')
+    if audio:
+        medido['captura_audio_p50_ms'] = audio['p50_ms']
+        medido['captura_audio_p95_ms'] = audio['p95_ms']
+    return medido
+
+
+# ===============================
+# PRESUPUESTOS
+# ===============================
+def evaluar(medido, presupuestos, margen):
+    """
+    [(métrica, valor, límite, estado)] con estado 'ok', 'excedido' o
+    'sin datos'. 'max' admite hasta límite·(1+margen); 'min', hasta
+    límite·(1−margen). Una métrica sin datos falla solo si es 'requerida'.
+    """
+    filas = []
+    for nombre, limite in presupuestos.items():
+        valor = medido.get(nombre)
+        if valor is None:
+            estado = 'excedido' if limite.get('requerida', True) else 'sin datos'
+            filas.append((nombre, None, limite, estado))
+            continue
+        ok = True
+        if 'max' in limite:
+            ok = valor <= limite['max'] * (1 + margen)
+        if 'min' in limite:
+            ok = ok and valor >= limite['min'] * (1 - margen)
+        filas.append((nombre, valor, limite, 'ok' if ok else 'excedido'))
+    return filas
+
+
+def actualizar_presupuestos(ruta, medido, datos):
+    """Reescribe los límites con lo medido (manteniendo 'min'/'max' y el resto)."""
+    for nombre, limite in datos['presupuestos'].items():
+        valor = medido.get(nombre)
+        if valor is None:
+            continue
+        for clave in ('max', 'min'):
+            if clave in limite:
+                limite[clave] = valor
+    with open(ruta, 'w') as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+
+
+# ===============================
+# MAIN
+# ===============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Gate de rendimiento del pipeline VIA")
+    sub = ap.add_subparsers(dest='accion', required=True)
+
+    c = sub.add_parser('correr', help="reproducir una sesión y comparar con los presupuestos")
+    c.add_argument('--sesion', help="carpeta con JPEGs y distancias.txt (si no, sintética)")
+    c.add_argument('--segundos', type=float, default=60)
+    c.add_argument('--calentamiento', type=float, default=180,
+                   help="máximo de segundos hasta que la captura entre en régimen")
+    c.add_argument('--presupuestos', default=PRESUPUESTOS)
+    c.add_argument('--margen', type=float, help="tolerancia sobre cada presupuesto (p. ej. 0.1)")
+    c.add_argument('--salida', help="guardar lo medido como JSON")
+    c.add_argument('--log', help="guardar la salida del script principal")
+    c.add_argument('--actualizar', action='store_true', help="reescribir los presupuestos con lo medido")
+
+    g = sub.add_parser('grabar', help="grabar una sesión desde una ESP32-CAM")
+    g.add_argument('carpeta')
+    g.add_argument('--puerto', default='/dev/ttyUSB0')
+    g.add_argument('--segundos', type=float, default=60)
+    g.add_argument('--baudios', type=int, default=500000)
+    args = ap.parse_args()
+
+    if args.accion == 'grabar':
+        n = grabar_sesion(args.carpeta, args.puerto, args.segundos, args.baudios)
+        print(f"💾 {n} imágenes grabadas en {args.carpeta}")
+        sys.exit(0)
+
+    with open(args.presupuestos) as f:
+        datos = json.load(f)
+    margen = datos.get('margen', 0.1) if args.margen is None else args.margen
+    jpegs, distancias, sesion = cargar_sesion(args.sesion)
+    if not jpegs:
+        raise SystemExit(f"❌ No hay JPEGs en {args.sesion}")
+
+    print(f"🎬 Sesión {sesion} ({len(jpegs)} JPEGs), {args.segundos:.0f} s")
+    medido = medir_sesion(jpegs, distancias, args.segundos, calentamiento=args.calentamiento,
+                          log=args.log)
+    print(f"🔥 Captura en régimen después de {medido['calentamiento_s']} s")
+    filas = evaluar(medido, datos['presupuestos'], margen)
+
+    print(f"📏 Presupuestos de {args.presupuestos} (margen {margen:.0%}, {datos.get('equipo', '?')})")
+    for nombre, valor, limite, estado in filas:
+        marca = {'ok': '✅', 'excedido': '❌', 'sin datos': '⚠️'}[estado]
+        rango = ' '.join(f"{k} {v}" for k, v in limite.items() if k in ('min', 'max'))
+        print(f"  {marca} {nombre:<22} {valor if valor is not None else '-':>10}   ({rango})")
+
+    if args.salida:
+        with open(args.salida, 'w') as f:
+            json.dump({'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'), 'sesion': sesion,
+                       'segundos': args.segundos, 'margen': margen, 'medido': medido}, f, indent=2)
+    if args.actualizar:
+        actualizar_presupuestos(args.presupuestos, medido, datos)
+        print(f"💾 Presupuestos actualizados en {args.presupuestos}")
+    elif any(estado == 'excedido' for *_, estado in filas):
+        raise SystemExit("❌ Rendimiento fuera de presupuesto")
@@ -0,0 +1,252 @@
+"""
+Métricas del sistema en formato de texto de Prometheus (/metrics).
+
+Contadores, medidores e histogramas de latencia por etapa. Registrar una
+muestra cuesta lo mismo que tomar un lock y sumar (un par de
+microsegundos en la Pi): no hay formateo ni asignaciones hasta que alguien
+pide /metrics.
+
+    registro = Registro()
+    etapas = registro.histograma('via_etapa_segundos', "Duración por etapa", ('etapa',))
+    decodificar = etapas.con('decodificacion')     # guardar el hijo: evita buscarlo
+    with decodificar.medir():
+        ...
+    registro.contador('via_frames_total', "Frames recibidos").inc()
+
+Lo que ya cuenta otro objeto (el parser, el pool, el servidor) no se
+duplica: se declara el contador o medidor con `funcion`, que se evalúa al
+exponer. Sin etiquetas devuelve un número; con etiquetas,
+{(valores...): número}. None quiere decir que lo que mide todavía no
+existe (la métrica sale sin muestras); un error en la función no se tapa.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+
+# de 0,5 ms a 2,5 s: de un imdecode reducido a un predict lento
+CUBETAS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                    0.1, 0.25, 0.5, 1.0, 2.5)
+TIPO_PROMETHEUS = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _numero(v):
+    if isinstance(v, float):
+        if math.isinf(v):
+            return '+Inf' if v > 0 else '-Inf'
+        if math.isnan(v):
+            return 'NaN'
+        return repr(v)
+    return str(v)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+class _Cronometro:
+    """Context manager de medir(): más barato que un @contextmanager."""
+    __slots__ = ('_hist', '_t0')
+
+    def __init__(self, hist):
+        self._hist = hist
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observar(time.perf_counter() - self._t0)
+        return False
+
+
+class _ValorContador:
+    __slots__ = ('_lock', 'valor')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.valor = 0
+
+    def inc(self, n=1):
+        with self._lock:
+            self.valor += n
+
+
+class _ValorMedidor(_ValorContador):
+    __slots__ = ()
+
+    def establecer(self, v):
+        self.valor = v
+
+    def dec(self, n=1):
+        self.inc(-n)
+
+
+class _ValorHistograma:
+    __slots__ = ('_lock', '_limites', 'cuentas', 'suma', 'total')
+
+    def __init__(self, limites):
+        self._lock = threading.Lock()
+        self._limites = limites
+        self.cuentas = [0] * (len(limites) + 1)   # la última es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, v):
+        i = bisect_left(self._limites, v)
+        with self._lock:
+            self.cuentas[i] += 1
+            self.suma += v
+            self.total += 1
+
+    def medir(self):
+        return _Cronometro(self)
+
+
+class _Familia:
+    """Una métrica con sus etiquetas; con etiquetas, con(...) da cada serie."""
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=(), funcion=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion
+        self._series = {}
+        self._lock = threading.Lock()
+        self._sin_etiquetas = self._nuevo() if not self.etiquetas else None
+
+    def con(self, *valores):
+        serie = self._series.get(valores)
+        if serie is None:
+            if len(valores) != len(self.etiquetas):
+                raise ValueError(f"{self.nombre} lleva etiquetas {self.etiquetas}")
+            with self._lock:
+                serie = self._series.setdefault(valores, self._nuevo())
+        return serie
+
+    def _nuevo(self):
+        raise NotImplementedError
+
+    def _todas(self):
+        if self._sin_etiquetas is not None:
+            return [((), self._sin_etiquetas)]
+        with self._lock:
+            return list(self._series.items())
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        if self.funcion is not None:
+            valor = self.funcion()
+            if valor is None:
+                return lineas         # lo que mide todavía no existe
+            series = valor.items() if self.etiquetas else [((), valor)]
+            for valores, v in series:
+                lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {_numero(v)}")
+            return lineas
+        for valores, serie in self._todas():
+            lineas.extend(self._lineas(valores, serie))
+        return lineas
+
+    def _lineas(self, valores, serie):
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {_numero(serie.valor)}"]
+
+
+class Contador(_Familia):
+    tipo = 'counter'
+
+    def _nuevo(self):
+        return _ValorContador()
+
+    def inc(self, n=1):
+        self._sin_etiquetas.inc(n)
+
+
+class Medidor(_Familia):
+    """Valor que sube y baja."""
+    tipo = 'gauge'
+
+    def _nuevo(self):
+        return _ValorMedidor()
+
+    def establecer(self, v):
+        self._sin_etiquetas.establecer(v)
+
+    def inc(self, n=1):
+        self._sin_etiquetas.inc(n)
+
+    def dec(self, n=1):
+        self._sin_etiquetas.dec(n)
+
+
+class Histograma(_Familia):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), cubetas=CUBETAS_SEGUNDOS):
+        self.limites = tuple(sorted(cubetas))
+        super().__init__(nombre, ayuda, etiquetas)
+
+    def _nuevo(self):
+        return _ValorHistograma(self.limites)
+
+    def observar(self, v):
+        self._sin_etiquetas.observar(v)
+
+    def medir(self):
+        return self._sin_etiquetas.medir()
+
+    def _lineas(self, valores, serie):
+        with serie._lock:
+            cuentas, suma, total = list(serie.cuentas), serie.suma, serie.total
+        lineas = []
+        acumulado = 0
+        for limite, n in zip(self.limites + (math.inf,), cuentas):
+            acumulado += n
+            le = f'le="{_numero(float(limite))}"'
+            lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {acumulado}")
+        etiquetas = _etiquetas(self.etiquetas, valores)
+        lineas.append(f"{self.nombre}_sum{etiquetas} {_numero(suma)}")
+        lineas.append(f"{self.nombre}_count{etiquetas} {total}")
+        return lineas
+
+
+class Registro:
+    """Las métricas de un proceso; exponer() arma el texto de /metrics."""
+
+    def __init__(self):
+        self._familias = {}
+        self._lock = threading.Lock()
+
+    def _agregar(self, familia):
+        with self._lock:
+            existente = self._familias.get(familia.nombre)
+            if existente is not None:
+                if type(existente) is not type(familia) or existente.etiquetas != familia.etiquetas:
+                    raise ValueError(f"Métrica {familia.nombre} ya registrada con otra forma")
+                return existente
+            self._familias[familia.nombre] = familia
+            return familia
+
+    def contador(self, nombre, ayuda, etiquetas=(), funcion=None):
+        return self._agregar(Contador(nombre, ayuda, etiquetas, funcion))
+
+    def medidor(self, nombre, ayuda, etiquetas=(), funcion=None):
+        return self._agregar(Medidor(nombre, ayuda, etiquetas, funcion))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), cubetas=CUBETAS_SEGUNDOS):
+        return self._agregar(Histograma(nombre, ayuda, etiquetas, cubetas))
+
+    def exponer(self):
+        with self._lock:
+            familias = list(self._familias.values())
+        lineas = []
+        for familia in familias:
+            lineas.extend(familia.exponer())
+        return '\n'.join(lineas) + '\n'
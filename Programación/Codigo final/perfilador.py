@@ -0,0 +1,122 @@
+"""
+Perfilador por muestreo de todos los hilos, para usar en la Pi en marcha.
+
+Un hilo aparte mira cada `intervalo` segundos la pila de todos los demás
+(sys._current_frames) y cuenta cuántas veces aparece cada una. No
+instrumenta ninguna función: el programa corre a su velocidad normal y lo
+único que se agrega es ese hilo (decenas de µs por muestra).
+
+    perfil = PerfiladorMuestreo().muestrear(10)
+    perfil.colapsado()     # "hilo;funcion;funcion 37" (flamegraph.pl, speedscope)
+    perfil.speedscope()    # dict JSON para https://www.speedscope.app
+
+Conviene nombrar los hilos (threading.Thread(name=...)): el nombre es la
+raíz de cada pila.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+
+def _nombre_marco(codigo):
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+
+
+class Perfil:
+    """Pilas muestreadas: {(hilo, (marco raíz, ..., marco hoja)): muestras}."""
+
+    def __init__(self, pilas, intervalo, duracion, muestras):
+        self.pilas = pilas
+        self.intervalo = intervalo
+        self.duracion = duracion
+        self.muestras = muestras      # veces que se miraron los hilos
+
+    def colapsado(self):
+        """Formato 'collapsed stacks': una línea por pila con su cuenta."""
+        lineas = [';'.join((hilo,) + pila) + f" {n}"
+                  for (hilo, pila), n in sorted(self.pilas.items())]
+        return '\n'.join(lineas) + '\n'
+
+    def speedscope(self, nombre='VIA'):
+        """Un perfil 'sampled' por hilo, con los marcos compartidos."""
+        marcos, indices = [], {}
+        por_hilo = {}
+        for (hilo, pila), n in self.pilas.items():
+            fila = []
+            for marco in pila:
+                if marco not in indices:
+                    indices[marco] = len(marcos)
+                    marcos.append({'name': marco})
+                fila.append(indices[marco])
+            por_hilo.setdefault(hilo, []).append((fila, n))
+
+        perfiles = []
+        for hilo, filas in sorted(por_hilo.items()):
+            pesos = [n * self.intervalo for _, n in filas]
+            perfiles.append({'type': 'sampled', 'name': hilo, 'unit': 'seconds',
+                             'startValue': 0, 'endValue': sum(pesos),
+                             'samples': [fila for fila, _ in filas], 'weights': pesos})
+        return {'$schema': SPEEDSCOPE_SCHEMA, 'name': nombre, 'exporter': 'perfilador.py',
+                'shared': {'frames': marcos}, 'profiles': perfiles}
+
+
+class PerfiladorMuestreo:
+    """Un muestreo a la vez; muestrear() bloquea al que llama `segundos`."""
+
+    def __init__(self, intervalo=0.01):
+        self.intervalo = intervalo
+        self._ocupado = threading.Lock()
+
+    def ocupado(self):
+        return self._ocupado.locked()
+
+    def muestrear(self, segundos, intervalo=None):
+        """Perfil de `segundos`, o None si ya hay otro muestreo corriendo."""
+        if not self._ocupado.acquire(blocking=False):
+            return None
+        try:
+            return self._muestrear(segundos, intervalo or self.intervalo)
+        finally:
+            self._ocupado.release()
+
+    def _muestrear(self, segundos, intervalo):
+        # el muestreo corre en su propio hilo para no aparecer como uno más
+        resultado = {}
+        hilo = threading.Thread(target=self._bucle, args=(segundos, intervalo, resultado),
+                                name='perfilador', daemon=True)
+        hilo.start()
+        hilo.join()
+        return resultado['perfil']
+
+    def _bucle(self, segundos, intervalo, resultado):
+        propio = threading.get_ident()
+        pilas = Counter()
+        muestras = 0
+        t0 = time.monotonic()
+        proximo = t0
+        while True:
+            ahora = time.monotonic()
+            if ahora - t0 >= segundos:
+                break
+            nombres = {h.ident: h.name for h in threading.enumerate()}
+            for ident, marco in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                pila = []
+                while marco is not None:
+                    pila.append(_nombre_marco(marco.f_code))
+                    marco = marco.f_back
+                pila.reverse()
+                pilas[(nombres.get(ident, f"hilo-{ident}"), tuple(pila))] += 1
+            muestras += 1
+            proximo += intervalo
+            espera = proximo - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            else:
+                proximo = time.monotonic()   # atrasado: no acumular muestras de golpe
+        resultado['perfil'] = Perfil(dict(pilas), intervalo, time.monotonic() - t0, muestras)
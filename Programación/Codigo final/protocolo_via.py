@@ -0,0 +1,437 @@
+"""
+Protocolo de tramas ESP32-CAM <-> Raspberry Pi (modo streaming).
+
+Cada trama viaja con esta cabecera de 20 bytes (big-endian):
+
+    offset  tam  campo
+    0       4    sincronismo  A5 5A C3 3C
+    4       1    tipo         0x01 = imagen JPEG, 0x02 = respuesta a CFG,
+                              0x03 = distancia, 0x04 = fragmento de imagen
+    5       1    flags        bit 0: imagen recortada en el sensor
+                              bit 1: último fragmento de la imagen
+    6       2    seq          contador de tramas (da la vuelta en 65535)
+    8       2    aux          dato según el tipo (imagen y distancia: cm,
+                              fragmento: índice dentro de la imagen)
+    10      4    longitud     bytes de payload
+    14      4    crc32        CRC32 del payload
+    18      2    crc_cab      CRC32 de los bytes 0..17, 16 bits bajos
+
+seguida del payload. Un byte corrupto solo invalida su trama: el lector
+busca el siguiente sincronismo dentro de lo que ya recibió, sin vaciar el
+serial ni volver a pedir nada.
+
+En streaming el firmware manda cada imagen partida en fragmentos de ~1 KB
+y entre fragmentos intercala tramas de distancia (20–50 Hz), así el HC-SR04
+no queda atado al tiempo de transferencia de la imagen. El parser vuelve a
+juntar los fragmentos en un solo buffer y entrega una trama de imagen.
+
+La recepción no copia: el payload se lee directo (readv) dentro de un
+buffer preasignado del pool y se entrega como memoryview. Quien recibe la
+trama llama a trama.liberar() cuando ya no la necesita.
+"""
+import os
+import select
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+# ===============================
+# FORMATO
+# ===============================
+SYNC = b'\xa5\x5a\xc3\x3c'
+CABECERA = struct.Struct('>4sBBHHII')     # todo menos crc_cab
+LARGO_CABECERA = CABECERA.size + 2        # 20 bytes
+
+TIPO_IMAGEN = 0x01
+TIPO_CONFIG = 0x02                        # payload: "OK VGA 12 [RECORTE]" / "ERR ..."
+TIPO_DISTANCIA = 0x03                     # aux: cm, payload: millis() del ESP32 (u32)
+TIPO_FRAGMENTO = 0x04                     # aux: índice, payload: pedazo del JPEG
+
+FLAG_RECORTE = 0x01
+FLAG_FIN = 0x02                           # último fragmento de la imagen
+
+SIN_DISTANCIA = 0xFFFF                    # aux de imágenes armadas con fragmentos
+TAM_FRAGMENTO = 1024
+MARCA_DISTANCIA = struct.Struct('>I')
+
+MAX_PAYLOAD = 600000                      # mismo límite que leer_frame()
+TAMANO_MIN_JPEG = 1000                    # menos es una respuesta rota de IMGSTART
+
+# Comandos de texto hacia el ESP32
+CMD_IMAGEN = b"IMGSTART\n"
+CMD_STREAM_INICIO = b"STREAMSTART\n"
+CMD_STREAM_FIN = b"STREAMSTOP\n"
+
+
+def cmd_config(tamano, calidad, recorte=None):
+    """
+    Comando CFG: tamaño de frame ('QQVGA', 'QVGA', 'CIF', 'VGA'), calidad
+    JPEG del ESP32 (4–63, menor = mejor) y recorte opcional en el sensor
+    (x, y, ancho, alto) como fracciones del campo completo.
+    """
+    texto = f"CFG {tamano} {int(calidad)}"
+    if recorte:
+        texto += " " + " ".join(str(int(round(v * 1000))) for v in recorte)
+    return (texto + "\n").encode()
+
+
+def empaquetar_trama(tipo, seq, aux, payload, flags=0):
+    """Arma una trama completa (cabecera + payload). La usa el simulador."""
+    cab = CABECERA.pack(SYNC, tipo, flags, seq & 0xFFFF, aux & 0xFFFF,
+                        len(payload), zlib.crc32(payload))
+    crc_cab = zlib.crc32(cab) & 0xFFFF
+    return cab + struct.pack('>H', crc_cab) + bytes(payload)
+
+
+def leer_distancia(trama):
+    """(cm, millis del ESP32) de una trama TIPO_DISTANCIA."""
+    return trama.aux, MARCA_DISTANCIA.unpack_from(trama.payload)[0]
+
+
+def es_jpeg(datos):
+    """Chequea las marcas SOI/EOI sin copiar (acepta bytes o memoryview)."""
+    return len(datos) >= 4 and datos[:2] == b'\xff\xd8' and datos[-2:] == b'\xff\xd9'
+
+
+# ===============================
+# POOL DE BUFFERS
+# ===============================
+class PoolBuffers:
+    """Buffers de payload preasignados y reutilizables."""
+
+    def __init__(self, cantidad=4, tamano=MAX_PAYLOAD):
+        self.tamano = tamano
+        self._libres = [bytearray(tamano) for _ in range(cantidad)]
+        self._lock = threading.Lock()
+        self.asignaciones_extra = 0   # veces que el pool se quedó vacío
+
+    def tomar(self):
+        with self._lock:
+            if self._libres:
+                return self._libres.pop()
+        # Nadie devolvió a tiempo: antes que frenar la captura se crea uno.
+        self.asignaciones_extra += 1
+        return bytearray(self.tamano)
+
+    def devolver(self, buf):
+        with self._lock:
+            self._libres.append(buf)
+
+
+class Trama:
+    """
+    Trama recibida. El payload es una vista sobre un buffer del pool.
+    `t` es el time.monotonic() en que empezó a llegar (para una imagen
+    fragmentada, el del primer fragmento).
+    """
+    __slots__ = ('tipo', 'flags', 'seq', 'aux', 'payload', 't', '_buffer', '_pool')
+
+    def __init__(self, tipo, flags, seq, aux, payload, buffer=None, pool=None, t=None):
+        self.tipo = tipo
+        self.flags = flags
+        self.seq = seq
+        self.aux = aux
+        self.payload = payload
+        self.t = t
+        self._buffer = buffer
+        self._pool = pool
+
+    def liberar(self):
+        """Devuelve el buffer al pool. Después no hay que usar payload."""
+        if self._pool is not None:
+            self._pool.devolver(self._buffer)
+            self._pool = None
+            self._buffer = None
+
+
+# ===============================
+# PARSER (sin E/S)
+# ===============================
+class ParserTramas:
+    """
+    Máquina de estados que no hace E/S: destino() indica en qué memoryview
+    escribir los próximos bytes y alimentar(n) avisa cuántos se escribieron.
+    Así el mismo parser sirve para lectura bloqueante y para asyncio.
+
+    Los fragmentos de una imagen se escriben uno detrás del otro en el mismo
+    buffer del pool (sin copiar); si falta o llega dañado alguno, la imagen
+    entera se descarta y se espera el índice 0 de la siguiente.
+    """
+
+    def __init__(self, pool=None, max_payload=MAX_PAYLOAD):
+        self.pool = pool or PoolBuffers(tamano=max_payload)
+        self.max_payload = max_payload
+        self._cab = bytearray(LARGO_CABECERA)
+        self._vista_cab = memoryview(self._cab)
+        self._llenos = 0
+        self._buffer = None           # None → leyendo cabecera
+        self._vista = None
+        self._base = 0                # donde empieza el payload dentro del buffer
+        self._largo = 0
+        self._recibidos = 0
+        self._campos = None
+        self._t = None
+        # imagen fragmentada en armado
+        self._ens = None
+        self._ens_largo = 0
+        self._ens_indice = 0
+        self._ens_seq = 0
+        self._ens_t = None
+        self._huerfano = False        # fragmento que se lee solo para tirarlo
+        self._listas = deque()
+        self.ultima_seq = None
+        # estadísticas
+        self.tramas_ok = 0
+        self.tramas_corruptas = 0
+        self.tramas_perdidas = 0      # huecos en la secuencia
+        self.bytes_descartados = 0
+        self.imagenes_incompletas = 0
+
+    def reiniciar(self):
+        """Olvida lo recibido (por ejemplo tras un STREAMSTART nuevo)."""
+        self._soltar_buffer()
+        self._soltar_ensamble()
+        self._huerfano = False
+        self._llenos = 0
+        self.ultima_seq = None
+        while self._listas:
+            self._listas.popleft().liberar()
+
+    def destino(self):
+        if self._buffer is None:
+            return self._vista_cab[self._llenos:]
+        return self._vista[self._base + self._recibidos:self._base + self._largo]
+
+    def trama_lista(self):
+        return self._listas.popleft() if self._listas else None
+
+    def alimentar(self, n):
+        if n <= 0:
+            return
+        if self._buffer is None:
+            self._llenos += n
+            self._procesar_cabecera()
+        else:
+            self._recibidos += n
+            if self._recibidos == self._largo:
+                self._cerrar_payload()
+
+    # -------------------------------
+    def _soltar_buffer(self):
+        if self._buffer is not None:
+            self.pool.devolver(self._buffer)
+        self._buffer = None
+        self._vista = None
+
+    def _soltar_ensamble(self, incompleta=False):
+        if self._ens is not None:
+            self.pool.devolver(self._ens)
+            self._ens = None
+        if incompleta:
+            self.imagenes_incompletas += 1
+
+    def _descartar_cabecera(self, n):
+        """Corre la cabecera parcial n bytes y la realinea al próximo sync."""
+        cab = self._cab
+        fin = self._llenos
+        i = cab.find(SYNC, n, fin)
+        if i < 0:
+            # conservar un posible sincronismo partido al final
+            i = fin
+            for k in range(min(len(SYNC) - 1, fin - n), 0, -1):
+                if cab[fin - k:fin] == SYNC[:k]:
+                    i = fin - k
+                    break
+        cab[:fin - i] = cab[i:fin]
+        self._llenos = fin - i
+        self.bytes_descartados += i
+
+    def _procesar_cabecera(self):
+        while True:
+            if self._llenos >= len(SYNC) and self._cab[:len(SYNC)] != SYNC:
+                self._descartar_cabecera(1)
+            if self._llenos < LARGO_CABECERA:
+                return
+
+            _, tipo, flags, seq, aux, largo, crc = CABECERA.unpack_from(self._cab)
+            crc_cab, = struct.unpack_from('>H', self._cab, CABECERA.size)
+            if (zlib.crc32(self._vista_cab[:CABECERA.size]) & 0xFFFF) != crc_cab \
+                    or largo > self.max_payload:
+                # sincronismo falso o cabecera dañada: seguir buscando
+                self.tramas_corruptas += 1
+                self._descartar_cabecera(1)
+                continue
+
+            self._llenos = 0
+            self._campos = (tipo, flags, seq, aux, crc)
+            self._largo = largo
+            self._recibidos = 0
+            self._base = 0
+            if tipo == TIPO_FRAGMENTO:
+                self._empezar_fragmento(seq, aux, largo)
+            else:
+                self._buffer = self.pool.tomar()
+                self._t = time.monotonic()
+            self._vista = memoryview(self._buffer)
+            if largo == 0:
+                self._cerrar_payload()
+            return
+
+    def _empezar_fragmento(self, seq, indice, largo):
+        """Ubica el fragmento a continuación de los anteriores de su imagen."""
+        if indice == 0:
+            self._soltar_ensamble(incompleta=self._ens is not None)
+            self._ens = self.pool.tomar()
+            self._ens_largo = 0
+            self._ens_seq = seq
+            self._ens_t = time.monotonic()
+        elif self._ens is not None and indice != self._ens_indice + 1:
+            # se perdió un fragmento: esta imagen ya no se puede armar
+            self._soltar_ensamble(incompleta=True)
+
+        if self._ens is None or self._ens_largo + largo > self.max_payload:
+            self._soltar_ensamble(incompleta=self._ens is not None)
+            # se lee igual (para validar el CRC y seguir sincronizado) y se tira
+            self._huerfano = True
+            self._buffer = self.pool.tomar()
+            return
+        self._buffer, self._ens = self._ens, None
+        self._base = self._ens_largo
+
+    def _cerrar_payload(self):
+        tipo, flags, seq, aux, crc = self._campos
+        base = self._base
+        payload = self._vista[base:base + self._largo]
+        if zlib.crc32(payload) != crc:
+            # Payload dañado o con bytes perdidos: la próxima cabecera puede
+            # estar dentro de lo ya leído. Solo en este caso se copia la cola.
+            # Si era un fragmento, con el buffer se va la imagen entera.
+            self.tramas_corruptas += 1
+            if tipo == TIPO_FRAGMENTO and not self._huerfano:
+                self.imagenes_incompletas += 1
+            i = self._buffer.find(SYNC, base + 1, base + self._largo)
+            cola = bytes(self._buffer[i:base + self._largo]) if i > 0 else b''
+            self.bytes_descartados += self._largo - len(cola)
+            self._huerfano = False
+            self._soltar_buffer()
+            self._reinyectar(cola)
+            return
+
+        if self.ultima_seq is not None:
+            self.tramas_perdidas += (seq - self.ultima_seq - 1) & 0xFFFF
+        self.ultima_seq = seq
+        self.tramas_ok += 1
+
+        buffer = self._buffer
+        self._buffer = None
+        self._vista = None
+        if tipo != TIPO_FRAGMENTO:
+            self._listas.append(Trama(tipo, flags, seq, aux, payload, buffer,
+                                      self.pool, self._t))
+        elif self._huerfano:
+            self._huerfano = False
+            self.pool.devolver(buffer)
+        else:
+            self._ens_largo += self._largo
+            self._ens_indice = aux
+            if flags & FLAG_FIN:
+                imagen = memoryview(buffer)[:self._ens_largo]
+                self._listas.append(Trama(TIPO_IMAGEN, flags & ~FLAG_FIN, self._ens_seq,
+                                          SIN_DISTANCIA, imagen, buffer, self.pool,
+                                          self._ens_t))
+            else:
+                self._ens = buffer
+
+    def _reinyectar(self, datos):
+        while datos:
+            d = self.destino()
+            k = min(len(d), len(datos))
+            d[:k] = datos[:k]
+            datos = datos[k:]
+            self.alimentar(k)
+
+
+# ===============================
+# LECTURA BLOQUEANTE
+# ===============================
+def leer_en(ser, vista, timeout):
+    """
+    Lee lo disponible directo dentro de `vista` (sin buffers intermedios).
+    Devuelve la cantidad de bytes leídos, 0 si venció el timeout.
+    """
+    try:
+        fd = ser.fileno()
+    except (AttributeError, OSError, ValueError):
+        fd = None
+    if fd is None:
+        # objetos tipo archivo (BytesIO en benchmarks, puertos sin fd)
+        return ser.readinto(vista) or 0
+
+    listos, _, _ = select.select([fd], [], [], max(timeout, 0))
+    if not listos:
+        return 0
+    try:
+        return os.readv(fd, [vista])
+    except BlockingIOError:
+        return 0
+
+
+def leer_exacto(ser, vista, timeout):
+    """Llena toda la vista o devuelve False si vence el timeout."""
+    limite = time.monotonic() + timeout
+    llenos = 0
+    while llenos < len(vista):
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            return False
+        llenos += leer_en(ser, vista[llenos:], restante)
+    return True
+
+
+def leer_respuesta_imagen(ser, buffer, al_distancia=None):
+    """
+    Lee la respuesta a IMGSTART (distancia u16, tamaño u32, JPEG) dentro de
+    `buffer`, sin copiar. Devuelve (jpeg, None), con jpeg una vista válida
+    hasta la próxima lectura, o (None, motivo) con 'serial', 'tamano' o 'jpeg'.
+    """
+    if not leer_exacto(ser, buffer[:2], 1.0):
+        return None, 'serial'
+    if al_distancia is not None:
+        al_distancia(struct.unpack_from('>H', buffer)[0])
+    if not leer_exacto(ser, buffer[:4], 1.0):
+        return None, 'serial'
+    largo = struct.unpack_from('>I', buffer)[0]
+    if not (TAMANO_MIN_JPEG <= largo <= min(len(buffer), MAX_PAYLOAD)):
+        return None, 'tamano'
+    jpeg = buffer[:largo]
+    if not leer_exacto(ser, jpeg, 3.0):
+        return None, 'serial'
+    if not es_jpeg(jpeg):
+        return None, 'jpeg'
+    return jpeg, None
+
+
+class LectorTramas:
+    """Lee tramas de un puerto serial abierto, resincronizando solo."""
+
+    def __init__(self, ser, pool=None, max_payload=MAX_PAYLOAD):
+        self.ser = ser
+        self.parser = ParserTramas(pool, max_payload)
+
+    def reiniciar(self):
+        self.parser.reiniciar()
+
+    def leer_trama(self, timeout=3.0):
+        """Devuelve la próxima trama válida o None si vence el timeout."""
+        limite = time.monotonic() + timeout
+        parser = self.parser
+        while True:
+            trama = parser.trama_lista()
+            if trama is not None:
+                return trama
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return None
+            parser.alimentar(leer_en(self.ser, parser.destino(), restante))
@@ -0,0 +1,169 @@
+"""
+Prueba de carga de /video con muchos espectadores, sin cámara ni modelo.
+
+Levanta el servidor web en un proceso aparte con una Transmision que
+recibe JPEGs sintéticos a ritmo fijo, conecta N clientes (algunos lentos)
+y mide memoria (RSS) y CPU de ese proceso una vez por segundo:
+
+    python prueba_carga.py --espectadores 50 --lentos 5 --segundos 20
+    python prueba_carga.py --servidor flask      # para comparar
+
+Con el servidor asíncrono la memoria debe quedar acotada aunque haya
+clientes lentos (backpressure) y la CPU no debe crecer por cliente quieto.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from simulador_esp32 import jpegs_sinteticos
+from transmision import Transmision, TIPO_MJPEG
+from servidor_async import ServidorAsync
+
+MARCA = b'--frame\r\n'
+
+
+# ===============================
+# SERVIDOR (proceso hijo)
+# ===============================
+def _publicar(transmision, jpegs, fps):
+    i = 0
+    while True:
+        if transmision.quiere_frame() is not None:
+            transmision.publicar(jpegs[i % len(jpegs)])
+            i += 1
+        time.sleep(1.0 / fps)
+
+
+def _servidor(tipo, puerto, fps):
+    transmision = Transmision(fps_max=fps)
+    threading.Thread(target=_publicar, args=(transmision, jpegs_sinteticos(), fps),
+                     daemon=True).start()
+    if tipo == 'async':
+        rutas = {'/': lambda parametros: ('text/plain', 'ok')}
+        rutas_flujo = {'/video': lambda parametros, asincronico:
+                       (TIPO_MJPEG, transmision.generar_async())}
+        servidor = ServidorAsync(rutas, rutas_flujo, host='127.0.0.1', puerto=puerto)
+        asyncio.run(servidor.correr())
+        return
+
+    from flask import Flask, Response   # solo para comparar
+    app = Flask(__name__)
+
+    @app.route('/video')
+    def video():
+        return Response(transmision.generar(), mimetype=TIPO_MJPEG)
+
+    app.run(host='127.0.0.1', port=puerto, threaded=True)
+
+
+def _uso_proceso(pid):
+    """(RSS en MB, segundos de CPU) de un proceso, leídos de /proc."""
+    with open(f'/proc/{pid}/status') as f:
+        rss = next(int(l.split()[1]) for l in f if l.startswith('VmRSS:'))
+    with open(f'/proc/{pid}/stat') as f:
+        campos = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(campos[11]) + int(campos[12])) / os.sysconf('SC_CLK_TCK')
+    return rss / 1024.0, cpu
+
+
+# ===============================
+# CLIENTES
+# ===============================
+async def _espectador(puerto, lento, cuenta, i):
+    # buffer de recepción chico, como un teléfono: en loopback el kernel
+    # aceptaría megas y un cliente lento no se notaría en el servidor
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 64 * 1024)
+    sock.setblocking(False)
+    try:
+        await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', puerto))
+        lector, escritor = await asyncio.open_connection(sock=sock)
+    except OSError:
+        sock.close()
+        return
+    escritor.write(b'GET /video HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    cola = b''
+    try:
+        while True:
+            datos = await lector.read(4096 if lento else 65536)
+            if not datos:
+                break
+            bloque = cola + datos
+            cuenta[i] += bloque.count(MARCA)
+            cola = bloque[-(len(MARCA) - 1):]
+            if lento:
+                await asyncio.sleep(0.1)      # ≈40 KB/s, menos que un frame por segundo
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        escritor.close()
+
+
+async def _prueba(pid, puerto, espectadores, lentos, segundos):
+    cuenta = [0] * espectadores
+    tareas = [asyncio.ensure_future(_espectador(puerto, i < lentos, cuenta, i))
+              for i in range(espectadores)]
+    muestras = []
+    rss0, cpu0 = _uso_proceso(pid)
+    t0 = time.monotonic()
+    for _ in range(int(segundos)):
+        await asyncio.sleep(1.0)
+        rss, cpu = _uso_proceso(pid)
+        muestras.append((time.monotonic() - t0, rss, cpu))
+    for t in tareas:
+        t.cancel()
+    await asyncio.gather(*tareas, return_exceptions=True)
+
+    duracion = time.monotonic() - t0
+    cpus = [100 * (b[2] - a[2]) / (b[0] - a[0]) for a, b in zip(muestras, muestras[1:])]
+    rapidos = cuenta[lentos:] or [0]
+    return dict(
+        espectadores=espectadores,
+        lentos=lentos,
+        segundos=round(duracion, 1),
+        rss_inicial_mb=round(rss0, 1),
+        rss_max_mb=round(max(m[1] for m in muestras), 1),
+        rss_final_mb=round(muestras[-1][1], 1),
+        cpu_medio_pct=round(sum(cpus) / len(cpus), 1) if cpus else None,
+        cpu_max_pct=round(max(cpus), 1) if cpus else None,
+        cpu_total_s=round(muestras[-1][2] - cpu0, 2),
+        fps_por_espectador_min=round(min(rapidos) / duracion, 1),
+        fps_por_espectador_medio=round(sum(rapidos) / len(rapidos) / duracion, 1),
+        fps_lentos_medio=round(sum(cuenta[:lentos]) / max(1, lentos) / duracion, 2),
+    )
+
+
+# ===============================
+# MAIN
+# ===============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Prueba de carga de /video")
+    ap.add_argument('--servidor', default='async', choices=['async', 'flask'])
+    ap.add_argument('--espectadores', type=int, default=50)
+    ap.add_argument('--lentos', type=int, default=5, help="cuántos leen a ~40 KB/s")
+    ap.add_argument('--segundos', type=float, default=20)
+    ap.add_argument('--fps', type=float, default=10.0, help="frames publicados por segundo")
+    ap.add_argument('--puerto', type=int, default=8099)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args()
+
+    proceso = multiprocessing.Process(target=_servidor,
+                                      args=(args.servidor, args.puerto, args.fps), daemon=True)
+    proceso.start()
+    time.sleep(1.5)
+    try:
+        resultado = asyncio.run(_prueba(proceso.pid, args.puerto, args.espectadores,
+                                        args.lentos, args.segundos))
+    finally:
+        proceso.terminate()
+    resultado['servidor'] = args.servidor
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+    else:
+        for clave, valor in resultado.items():
+            print(f"  {clave}: {valor}")
@@ -0,0 +1,168 @@
+"""
+Seguimiento de objetos entre inferencias (estilo SORT / ByteTrack).
+
+Cada objeto es una Pista con id fijo y un filtro de Kalman de velocidad
+constante sobre la caja (cx, cy, w, h, normalizadas al ROI). En cada
+inferencia:
+
+  1. las pistas se predicen al instante del frame;
+  2. las detecciones con conf >= `conf_alta` se asocian por IoU (misma
+     clase, de mayor a menor IoU) y las que sobran abren pistas nuevas;
+  3. las de conf baja solo pueden continuar pistas que quedaron sin
+     detección (así un objeto medio tapado no pierde su id);
+  4. una pista sin detección en `max_perdidas` inferencias seguidas se borra.
+
+Entre inferencias no se decodifica nada: predecir(t) extrapola las cajas
+con la velocidad de cada pista (hasta `horizonte` segundos), que alcanza
+para que /eventos siga mostrando las cajas moviéndose.
+
+Los ids sirven para no repetir avisos: por_anunciar() devuelve solo las
+pistas que todavía no se dijeron (o que se dijeron hace más de `repetir` s).
+
+    seguidor = Seguidor()
+    visibles = seguidor.actualizar(detecciones, t)   # Deteccion de detectores.py
+    cajas = seguidor.predecir(t_frame)               # [(pista, caja)]
+    nuevas = seguidor.por_anunciar(t)
+"""
+import itertools
+
+import numpy as np
+
+# Kalman: estado (cx, cy, w, h, vx, vy, vw, vh), medición (cx, cy, w, h)
+_H = np.hstack([np.eye(4), np.zeros((4, 4))])
+_R = np.eye(4) * 0.02 ** 2                              # ruido de la caja del detector
+_Q = np.diag([0.01 ** 2] * 4 + [0.1 ** 2] * 4)         # por segundo
+_P0 = np.diag([0.02 ** 2] * 4 + [0.5 ** 2] * 4)        # velocidad desconocida al nacer
+
+# Umbrales de confianza del pipeline: el detector devuelve desde CONF_MINIMA
+# y solo las de CONF_NUEVA o más abren (y anuncian) pistas; el resto solo
+# continúa pistas que ya existen.
+CONF_MINIMA = 0.25
+CONF_NUEVA = 0.45
+
+
+def _centro(caja):
+    x0, y0, x1, y1 = caja
+    return np.array([(x0 + x1) / 2, (y0 + y1) / 2, x1 - x0, y1 - y0])
+
+
+def _caja(estado):
+    cx, cy, w, h = estado[:4]
+    w, h = max(w, 1e-3), max(h, 1e-3)
+    return (min(max(cx - w / 2, 0.0), 1.0), min(max(cy - h / 2, 0.0), 1.0),
+            min(max(cx + w / 2, 0.0), 1.0), min(max(cy + h / 2, 0.0), 1.0))
+
+
+def iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Pista:
+    """Un objeto seguido: id, clase y su filtro de Kalman."""
+
+    def __init__(self, id, deteccion, t):
+        self.id = id
+        self.clase = deteccion.clase
+        self.nombre = deteccion.nombre
+        self.conf = deteccion.conf
+        self.x = np.concatenate([_centro(deteccion.caja), np.zeros(4)])
+        self.P = _P0.copy()
+        self.t = t                    # instante del estado
+        self.aciertos = 1
+        self.perdidas = 0             # inferencias seguidas sin detección
+        self.anunciada = None         # cuándo se dijo por última vez
+
+    @property
+    def caja(self):
+        return _caja(self.x)
+
+    def predecir(self, t):
+        dt = max(t - self.t, 0.0)
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + _Q * dt
+        self.t = t
+
+    def corregir(self, deteccion):
+        S = _H @ self.P @ _H.T + _R
+        K = self.P @ _H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (_centro(deteccion.caja) - _H @ self.x)
+        self.P = (np.eye(8) - K @ _H) @ self.P
+        self.conf = deteccion.conf
+        self.aciertos += 1
+        self.perdidas = 0
+
+    def caja_en(self, t, horizonte):
+        """Caja extrapolada a t sin tocar el estado."""
+        dt = min(max(t - self.t, 0.0), horizonte)
+        return _caja(self.x[:4] + self.x[4:] * dt)
+
+
+class Seguidor:
+    """Pistas de una cámara. Se usa desde un solo hilo (el de inferencia)."""
+
+    def __init__(self, iou_min=0.3, conf_alta=CONF_NUEVA, max_perdidas=2, min_aciertos=1,
+                 horizonte=1.0):
+        self.iou_min = iou_min
+        self.conf_alta = conf_alta
+        self.max_perdidas = max_perdidas
+        self.min_aciertos = min_aciertos
+        self.horizonte = horizonte    # s que se extrapola como mucho
+        self.pistas = []
+        self._ids = itertools.count(1)
+
+    def _emparejar(self, detecciones, pistas):
+        """Asociación codiciosa por IoU: (pares, detecciones sueltas, pistas sueltas)."""
+        candidatos = sorted(((iou(d.caja, p.caja), i, j)
+                             for i, d in enumerate(detecciones)
+                             for j, p in enumerate(pistas) if d.clase == p.clase),
+                            reverse=True)
+        usadas_d, usadas_p, pares = set(), set(), []
+        for valor, i, j in candidatos:
+            if valor < self.iou_min:
+                break
+            if i in usadas_d or j in usadas_p:
+                continue
+            usadas_d.add(i)
+            usadas_p.add(j)
+            pares.append((pistas[j], detecciones[i]))
+        return (pares,
+                [d for i, d in enumerate(detecciones) if i not in usadas_d],
+                [p for j, p in enumerate(pistas) if j not in usadas_p])
+
+    def actualizar(self, detecciones, t):
+        """Incorpora las detecciones de un frame; devuelve las pistas visibles."""
+        for pista in self.pistas:
+            pista.predecir(t)
+        altas = [d for d in detecciones if d.conf >= self.conf_alta]
+        bajas = [d for d in detecciones if d.conf < self.conf_alta]
+        pares, sueltas, libres = self._emparejar(altas, self.pistas)
+        pares_bajas, _, libres = self._emparejar(bajas, libres)
+        for pista, deteccion in pares + pares_bajas:
+            pista.corregir(deteccion)
+        for pista in libres:
+            pista.perdidas += 1
+        self.pistas = [p for p in self.pistas if p.perdidas <= self.max_perdidas]
+        self.pistas.extend(Pista(next(self._ids), d, t) for d in sueltas)
+        return self.visibles()
+
+    def visibles(self):
+        """Pistas confirmadas que tuvieron detección en la última inferencia."""
+        return [p for p in self.pistas if p.perdidas == 0 and p.aciertos >= self.min_aciertos]
+
+    def predecir(self, t):
+        """[(pista, caja extrapolada a t)] de las pistas visibles."""
+        return [(p, p.caja_en(t, self.horizonte)) for p in self.visibles()]
+
+    def por_anunciar(self, t, repetir=10.0, todas=False):
+        """Pistas visibles que no se dijeron (o hace más de `repetir` s); las marca."""
+        elegidas = [p for p in self.visibles()
+                    if todas or p.anunciada is None or t - p.anunciada >= repetir]
+        for pista in elegidas:
+            pista.anunciada = t
+        return elegidas
@@ -0,0 +1,129 @@
+"""
+Servidor HTTP sobre asyncio para /, /video, /eventos y los endpoints JSON.
+
+El servidor de desarrollo de Flask usa un hilo del sistema por cada
+cliente de /video. Acá todos los clientes comparten un solo event loop:
+cada uno es una corrutina que espera el próximo frame de su Transmision y
+lo escribe con control de flujo (drain). Un cliente lento llena su buffer
+de escritura, deja de recibir frames intermedios (salta al más nuevo) y,
+si no avanza dentro de `plazo_envio`, se lo desconecta. La memoria por
+cliente queda acotada por `limite_buffer` (más el buffer del socket, que
+para los flujos se achica al mismo valor).
+
+Las rutas son las mismas que sirve Flask:
+  - rutas:       f(parametros) → (tipo, cuerpo) o (estado, tipo, cuerpo)
+  - rutas_flujo: f(parametros, asincronico=True) → igual, pero si sale
+                 bien el cuerpo es un iterador asíncrono de bytes
+"""
+import asyncio
+import socket
+from urllib.parse import urlsplit, parse_qs
+
+ESTADOS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 500: 'Internal Server Error'}
+
+
+class ServidorAsync:
+    """
+    servidor = ServidorAsync(rutas, rutas_flujo)
+    asyncio.run(servidor.correr())
+    """
+
+    def __init__(self, rutas, rutas_flujo=None, host='0.0.0.0', puerto=8080,
+                 limite_buffer=128 * 1024, plazo_envio=10.0):
+        self.rutas = rutas
+        self.rutas_flujo = rutas_flujo or {}
+        self.host = host
+        self.puerto = puerto
+        self.limite_buffer = limite_buffer
+        self.plazo_envio = plazo_envio
+        self.servidor = None
+        self.clientes_flujo = 0
+        self.desconectados_lentos = 0
+
+    async def iniciar(self):
+        self.servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+        return self
+
+    async def correr(self):
+        await self.iniciar()
+        async with self.servidor:
+            await self.servidor.serve_forever()
+
+    # -------------------------------
+    async def _atender(self, lector, escritor):
+        escritor.transport.set_write_buffer_limits(high=self.limite_buffer)
+        try:
+            try:
+                pedido = await asyncio.wait_for(lector.readuntil(b'\r\n\r\n'), 10.0)
+                metodo, destino, _ = pedido.split(b'\r\n', 1)[0].decode('latin-1').split(' ', 2)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                    asyncio.TimeoutError, ValueError):
+                return
+            url = urlsplit(destino)
+            parametros = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+            if metodo != 'GET':
+                await self._responder(escritor, 405, 'text/plain', 'Solo GET')
+                return
+            try:
+                if url.path in self.rutas_flujo:
+                    respuesta = self.rutas_flujo[url.path](parametros, asincronico=True)
+                elif url.path in self.rutas:
+                    respuesta = self.rutas[url.path](parametros)
+                else:
+                    respuesta = (404, 'text/plain', 'No encontrado')
+            except Exception as e:
+                print("⚠️ Error en", url.path, e)
+                respuesta = (500, 'text/plain', 'Error interno')
+            if len(respuesta) == 2:
+                respuesta = (200,) + tuple(respuesta)
+            estado, tipo, cuerpo = respuesta
+            if hasattr(cuerpo, '__aiter__'):
+                await self._flujo(escritor, estado, tipo, cuerpo)
+            else:
+                await self._responder(escritor, estado, tipo, cuerpo)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            escritor.close()
+
+    async def _responder(self, escritor, estado, tipo, cuerpo):
+        if isinstance(cuerpo, str):
+            cuerpo = cuerpo.encode('utf-8')
+        escritor.write(self._cabecera(estado, tipo, len(cuerpo)) + cuerpo)
+        await escritor.drain()
+
+    def _cabecera(self, estado, tipo, largo=None):
+        lineas = [f"HTTP/1.1 {estado} {ESTADOS.get(estado, '')}",
+                  f"Content-Type: {tipo}",
+                  "Cache-Control: no-cache",
+                  "Connection: close"]
+        if largo is not None:
+            lineas.append(f"Content-Length: {largo}")
+        return ("\r\n".join(lineas) + "\r\n\r\n").encode('latin-1')
+
+    async def _flujo(self, escritor, estado, tipo, cuerpo):
+        # drain() espera a que se vacíe todo (low=0): así el próximo frame
+        # que se escribe es siempre el más nuevo, no uno encolado hace rato
+        escritor.transport.set_write_buffer_limits(high=self.limite_buffer, low=0)
+        sock = escritor.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.limite_buffer)
+        escritor.write(self._cabecera(estado, tipo))
+        self.clientes_flujo += 1
+        try:
+            async for datos in cuerpo:
+                escritor.write(datos)
+                try:
+                    # backpressure: el productor no avanza hasta que el socket
+                    # acepte esto; mientras tanto los frames nuevos se saltean
+                    await asyncio.wait_for(escritor.drain(), self.plazo_envio)
+                except asyncio.TimeoutError:
+                    self.desconectados_lentos += 1
+                    print(f"⚠️ Cliente sin avanzar en {self.plazo_envio:.0f} s, se corta")
+                    escritor.transport.abort()    # sin esperar a vaciar su buffer
+                    return
+        finally:
+            self.clientes_flujo -= 1
+            await cuerpo.aclose()
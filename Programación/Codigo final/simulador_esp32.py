@@ -0,0 +1,494 @@
+"""
+Simulador del ESP32-CAM + HC-SR04 sobre un pseudo-terminal (pty).
+
+Habla el mismo protocolo que el firmware v3.4:
+  - IMGSTART\\n    → distancia (2 bytes BE) + tamaño (4 bytes BE) + JPEG
+  - STREAMSTART\\n → imágenes en fragmentos con cabecera, intercalados con
+                    tramas de distancia (ver protocolo_via.py)
+  - STREAMSTOP\\n  → corta el stream
+  - CFG ...\\n     → responde con una trama TIPO_CONFIG; con OpenCV además
+                    recodifica los JPEGs al tamaño/calidad/recorte pedidos
+
+Reproduce una carpeta de JPEGs y una traza de distancias (una muestra por
+período del sensor, 25 Hz por defecto) a la velocidad del enlace real, con
+latencia de captura y corrupción de bytes configurables.
+Sirve para medir la captura sin hardware:
+
+    # medir FPS, latencia y recuperación con el cliente incluido
+    python simulador_esp32.py --jpegs capturas/ --corrupcion 0.05 --medir 20
+
+    # o dejarlo corriendo y apuntar el script principal al pty
+    python simulador_esp32.py --jpegs capturas/
+    VIA_PUERTO=/dev/pts/3 python deteccion-yolov10-tts-v4.1.2.py
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import select
+import struct
+import threading
+import time
+import tty
+from collections import deque
+
+from protocolo_via import (TIPO_IMAGEN, TIPO_CONFIG, TIPO_DISTANCIA, TIPO_FRAGMENTO,
+                           FLAG_RECORTE, FLAG_FIN, TAM_FRAGMENTO, MARCA_DISTANCIA,
+                           CMD_IMAGEN, CMD_STREAM_INICIO, CMD_STREAM_FIN, LectorTramas,
+                           PoolBuffers, empaquetar_trama, es_jpeg, leer_respuesta_imagen)
+
+# ===============================
+# FUENTES DE DATOS
+# ===============================
+def cargar_jpegs(carpeta):
+    """Lee todos los .jpg/.jpeg de una carpeta (orden alfabético)."""
+    rutas = sorted(glob.glob(os.path.join(carpeta, '*.jp*g')))
+    jpegs = []
+    for ruta in rutas:
+        with open(ruta, 'rb') as f:
+            datos = f.read()
+        if es_jpeg(datos):
+            jpegs.append(datos)
+    return jpegs
+
+
+def jpegs_sinteticos(cantidad=30, ancho=640, alto=480, calidad=80):
+    """
+    Genera JPEGs de prueba. Con OpenCV son imágenes reales (un rectángulo
+    que se mueve sobre ruido); sin OpenCV son bytes con marcas SOI/EOI que
+    alcanzan para probar el protocolo pero no se pueden decodificar.
+    """
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        rnd = random.Random(0)
+        return [b'\xff\xd8' + bytes(rnd.getrandbits(8) for _ in range(30000)) + b'\xff\xd9'
+                for _ in range(cantidad)]
+
+    rng = np.random.default_rng(0)
+    fondo = rng.integers(0, 60, (alto, ancho, 3), dtype=np.uint8)
+    jpegs = []
+    for i in range(cantidad):
+        img = fondo.copy()
+        x = int((ancho - 160) * (0.5 + 0.5 * math.sin(i / 5.0)))
+        cv2.rectangle(img, (x, alto // 3), (x + 160, alto // 3 + 200), (40, 160, 220), -1)
+        ok, jpeg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, calidad])
+        jpegs.append(jpeg.tobytes())
+    return jpegs
+
+
+def cargar_distancias(ruta):
+    """Una distancia en cm por línea (si hay comas, se toma la última columna)."""
+    valores = []
+    with open(ruta) as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea or linea.startswith('#'):
+                continue
+            try:
+                valores.append(int(float(linea.split(',')[-1])))
+            except ValueError:
+                continue    # encabezado
+    return valores
+
+
+def distancias_sinteticas(tipo='aproximacion', cantidad=200):
+    """Trazas típicas: 'aproximacion' (obstáculo que se acerca), 'seno', 'fija'."""
+    if tipo == 'fija':
+        return [150] * cantidad
+    if tipo == 'seno':
+        return [int(120 + 80 * math.sin(i / 10.0)) for i in range(cantidad)]
+    # de 250 cm a 30 cm y vuelta a empezar
+    return [int(250 - 220 * (i % cantidad) / cantidad) for i in range(cantidad)]
+
+
+TAMANOS_FIRMWARE = {'QQVGA': (160, 120), 'QVGA': (320, 240), 'CIF': (400, 296), 'VGA': (640, 480)}
+
+
+def recodificar(jpegs, tamano, calidad, recorte=None):
+    """Imita CFG del firmware: recorte en milésimas, tamaño y calidad ESP32."""
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return jpegs
+    ancho, alto = TAMANOS_FIRMWARE[tamano]
+    # calidad del ESP32 (menor = mejor) a calidad de OpenCV, aproximada
+    calidad_cv = int(max(5, min(95, 100 - 1.5 * calidad)))
+    salida = []
+    for jpeg in jpegs:
+        img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            salida.append(jpeg)
+            continue
+        if recorte:
+            h, w = img.shape[:2]
+            x, y, rw, rh = (v / 1000.0 for v in recorte)
+            img = img[int(y * h):int((y + rh) * h), int(x * w):int((x + rw) * w)]
+        img = cv2.resize(img, (ancho, alto), interpolation=cv2.INTER_AREA)
+        ok, nuevo = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, calidad_cv])
+        salida.append(nuevo.tobytes() if ok else jpeg)
+    return salida
+
+
+# ===============================
+# SIMULADOR
+# ===============================
+class SimuladorESP32:
+    """ESP32-CAM falso detrás de un pty. `ruta` es el puerto para el host."""
+
+    def __init__(self, jpegs, distancias, baudios=500000, latencia=0.03,
+                 corrupcion=0.0, semilla=None, frecuencia_distancia=25.0):
+        self.jpegs_originales = jpegs
+        self.jpegs = jpegs
+        self.recorte_activo = False
+        self.distancias = distancias or [0]
+        self.periodo_distancia = 1.0 / frecuencia_distancia
+        self.bytes_por_seg = baudios / 10.0          # 8N1
+        self.latencia = latencia
+        self.corrupcion = corrupcion
+        self.rnd = random.Random(semilla)
+
+        self.maestro, self.esclavo = os.openpty()
+        tty.setraw(self.esclavo)
+        self.ruta = os.ttyname(self.esclavo)
+
+        self.streaming = False
+        self.activo = False
+        self._hilo = None
+        self._indice = 0
+        self.seq = 0
+        self._t0 = time.monotonic()
+        self._t_distancia = 0.0
+        self.distancias_enviadas = 0
+        # seq → (t_captura, t_fin_envio, corrupta) de los últimos frames
+        # (en streaming, seq del primer fragmento de la imagen)
+        self.historial = {}
+        self._orden = deque(maxlen=512)
+        self.frames_enviados = 0
+        self.frames_corruptos = 0
+
+    def iniciar(self):
+        self.activo = True
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+        return self
+
+    def cerrar(self):
+        self.activo = False
+        if self._hilo:
+            self._hilo.join(timeout=2)
+        os.close(self.maestro)
+        os.close(self.esclavo)
+
+    # -------------------------------
+    def _bucle(self):
+        # el firmware real imprime texto al arrancar: el host debe tolerarlo
+        self._escribir(b"\nESP32-CAM lista. Esperando comando IMGSTART / STREAMSTART...\n")
+        pendiente = b''
+        while self.activo:
+            espera = 0 if self.streaming else 0.05
+            listos, _, _ = select.select([self.maestro], [], [], espera)
+            if listos:
+                try:
+                    pendiente += os.read(self.maestro, 256)
+                except OSError:
+                    break
+                while b'\n' in pendiente:
+                    linea, pendiente = pendiente.split(b'\n', 1)
+                    self._comando(linea.strip() + b'\n')
+            if self.streaming:
+                self._enviar_frame(enmarcado=True)
+
+    def _comando(self, cmd):
+        if cmd == CMD_IMAGEN:
+            self._enviar_frame(enmarcado=False)
+        elif cmd == CMD_STREAM_INICIO:
+            self.streaming = True
+        elif cmd == CMD_STREAM_FIN:
+            self.streaming = False
+        elif cmd.startswith(b'CFG '):
+            self._config(cmd.decode(errors='replace').strip())
+
+    def _config(self, cmd):
+        partes = cmd.split()
+        try:
+            tamano, calidad = partes[1], int(partes[2])
+            recorte = [int(v) for v in partes[3:7]] if len(partes) == 7 else None
+            if tamano not in TAMANOS_FIRMWARE or not 4 <= calidad <= 63 or len(partes) not in (3, 7):
+                raise ValueError
+        except (IndexError, ValueError):
+            respuesta = "ERR " + cmd
+        else:
+            self.jpegs = recodificar(self.jpegs_originales, tamano, calidad, recorte)
+            self.recorte_activo = recorte is not None
+            respuesta = f"OK {tamano} {calidad}" + (" RECORTE" if recorte else "")
+        if self.streaming:
+            self._escribir(empaquetar_trama(TIPO_CONFIG, self.seq, 0, respuesta.encode()))
+            self.seq += 1
+
+    def _distancia(self):
+        """Lo que mediría el HC-SR04 ahora: la traza avanza con el reloj."""
+        i = int((time.monotonic() - self._t0) / self.periodo_distancia)
+        return self.distancias[i % len(self.distancias)]
+
+    def _tomar_seq(self):
+        seq = self.seq & 0xFFFF
+        self.seq += 1
+        return seq
+
+    def _enviar_distancia_si_toca(self):
+        """Como la tarea del firmware: una trama por período del sensor."""
+        ahora = time.monotonic()
+        if ahora - self._t_distancia < self.periodo_distancia:
+            return
+        self._t_distancia = ahora
+        millis = int((ahora - self._t0) * 1000) & 0xFFFFFFFF
+        self._escribir(empaquetar_trama(TIPO_DISTANCIA, self._tomar_seq(), self._distancia(),
+                                        MARCA_DISTANCIA.pack(millis)))
+        self.distancias_enviadas += 1
+
+    def _enviar_frame(self, enmarcado):
+        time.sleep(self.latencia)                 # captura
+        jpeg = self.jpegs[self._indice % len(self.jpegs)]
+        self._indice += 1
+        t_captura = time.monotonic()
+        corrupta = self.corrupcion > 0 and self.rnd.random() < self.corrupcion
+        if corrupta:
+            self.frames_corruptos += 1
+
+        if not enmarcado:
+            datos = struct.pack('>HI', self._distancia(), len(jpeg)) + jpeg
+            seq = self._tomar_seq()
+            self._registrar(seq, t_captura, corrupta)
+            self._escribir(self._corromper(datos) if corrupta else datos)
+            self._registrar(seq, t_captura, corrupta, time.monotonic())
+            self.frames_enviados += 1
+            return
+
+        flags = FLAG_RECORTE if self.recorte_activo else 0
+        partes = range(0, len(jpeg), TAM_FRAGMENTO)
+        danada = self.rnd.randrange(len(partes)) if corrupta else -1
+        seq_imagen = None
+        for indice, inicio in enumerate(partes):
+            self._enviar_distancia_si_toca()
+            if not self.streaming or not self.activo:
+                return                            # STREAMSTOP a mitad de imagen
+            fin = inicio + TAM_FRAGMENTO >= len(jpeg)
+            seq = self._tomar_seq()
+            datos = empaquetar_trama(TIPO_FRAGMENTO, seq, indice,
+                                     jpeg[inicio:inicio + TAM_FRAGMENTO],
+                                     flags | (FLAG_FIN if fin else 0))
+            if indice == danada:
+                datos = self._corromper(datos)
+            if seq_imagen is None:
+                # se registra antes de escribir: el host puede terminar de
+                # leer el frame antes de que vuelva _escribir()
+                seq_imagen = seq
+                self._registrar(seq, t_captura, corrupta)
+            self._escribir(datos)
+        self._registrar(seq_imagen, t_captura, corrupta, time.monotonic())
+        self.frames_enviados += 1
+
+    def _registrar(self, seq, t_captura, corrupta, t_fin=None):
+        if seq not in self.historial:
+            if len(self._orden) == self._orden.maxlen:
+                self.historial.pop(self._orden[0], None)
+            self._orden.append(seq)
+        self.historial[seq] = (t_captura, t_fin, corrupta)
+
+    def _corromper(self, datos):
+        """Invierte un byte o pierde unos pocos, como un cable USB ruidoso."""
+        datos = bytearray(datos)
+        i = self.rnd.randrange(len(datos))
+        if self.rnd.random() < 0.7:
+            datos[i] ^= 0xFF
+        else:
+            del datos[i:i + self.rnd.randint(1, 16)]
+        return bytes(datos)
+
+    def _escribir(self, datos):
+        """Escribe respetando la velocidad del enlace (bloques de 1 KB)."""
+        inicio = time.monotonic()
+        enviados = 0
+        vista = memoryview(datos)
+        while enviados < len(datos) and self.activo:
+            try:
+                enviados += os.write(self.maestro, vista[enviados:enviados + 1024])
+            except OSError:
+                return
+            adelanto = inicio + enviados / self.bytes_por_seg - time.monotonic()
+            if adelanto > 0:
+                time.sleep(adelanto)
+
+
+# ===============================
+# CLIENTE DE MEDICIÓN
+# ===============================
+class _Puerto:
+    """Lado host del pty con la interfaz mínima que usa protocolo_via."""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def fileno(self):
+        return self.fd
+
+    def write(self, datos):
+        os.write(self.fd, datos)
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(round(p / 100.0 * (len(orden) - 1))))]
+
+
+def medir(sim, segundos, modo='stream'):
+    """Mide FPS, latencia captura→host y tiempo de recuperación."""
+    puerto = _Puerto(sim.esclavo)
+    latencias = []
+    recuperaciones = []
+    frames = 0
+    inicio = time.monotonic()
+    fin = inicio + segundos
+
+    if modo == 'stream':
+        lector = LectorTramas(puerto, PoolBuffers(cantidad=3))
+        puerto.write(CMD_STREAM_INICIO)
+        ultima_seq = None
+        distancias = 0
+        t_distancia = None
+        huecos_distancia = []
+        while time.monotonic() < fin:
+            trama = lector.leer_trama(timeout=fin - time.monotonic())
+            if trama is None:
+                break
+            ahora = time.monotonic()
+            if trama.tipo != TIPO_IMAGEN:
+                if trama.tipo == TIPO_DISTANCIA:
+                    distancias += 1
+                    if t_distancia is not None:
+                        huecos_distancia.append(ahora - t_distancia)
+                    t_distancia = ahora
+                trama.liberar()
+                continue
+            datos = sim.historial.get(trama.seq)
+            if datos:
+                latencias.append(ahora - datos[0])
+            if ultima_seq is not None:
+                # ¿se perdieron frames corruptos entre medio?
+                s = (ultima_seq + 1) & 0xFFFF
+                while s != trama.seq:
+                    perdido = sim.historial.get(s)
+                    if perdido and perdido[2] and perdido[1]:
+                        recuperaciones.append(ahora - perdido[1])
+                        break
+                    s = (s + 1) & 0xFFFF
+            ultima_seq = trama.seq
+            trama.liberar()
+            frames += 1
+        puerto.write(CMD_STREAM_FIN)
+        estadisticas = {
+            'distancias_hz': round(distancias / (time.monotonic() - inicio), 1),
+            'distancia_hueco_max_ms': _ms(max(huecos_distancia) if huecos_distancia else None),
+            'imagenes_incompletas': lector.parser.imagenes_incompletas,
+            'tramas_corruptas': lector.parser.tramas_corruptas,
+            'tramas_perdidas': lector.parser.tramas_perdidas,
+            'bytes_descartados': lector.parser.bytes_descartados,
+        }
+    else:
+        buffer = memoryview(bytearray(600000))
+        fallos = 0
+        t_fallo = None
+        while time.monotonic() < fin:
+            t0 = time.monotonic()
+            puerto.write(CMD_IMAGEN)
+            jpeg, _ = leer_respuesta_imagen(puerto, buffer)
+            if jpeg is not None:
+                latencias.append(time.monotonic() - t0)
+                frames += 1
+                if t_fallo is not None:
+                    recuperaciones.append(time.monotonic() - t_fallo)
+                    t_fallo = None
+            else:
+                # el script original descarta el buffer y vuelve a pedir
+                fallos += 1
+                if t_fallo is None:
+                    t_fallo = t0
+                time.sleep(0.05)
+                try:
+                    while select.select([sim.esclavo], [], [], 0.05)[0]:
+                        os.read(sim.esclavo, 65536)
+                except OSError:
+                    pass
+        estadisticas = {'pedidos_fallidos': fallos}
+
+    duracion = time.monotonic() - inicio
+    return dict(
+        modo=modo,
+        segundos=round(duracion, 2),
+        frames=frames,
+        fps=round(frames / duracion, 2) if duracion else 0.0,
+        frames_corruptos_enviados=sim.frames_corruptos,
+        latencia_p50_ms=_ms(percentil(latencias, 50)),
+        latencia_p95_ms=_ms(percentil(latencias, 95)),
+        recuperacion_p50_ms=_ms(percentil(recuperaciones, 50)),
+        recuperacion_max_ms=_ms(max(recuperaciones) if recuperaciones else None),
+        **estadisticas,
+    )
+
+
+def _ms(segundos):
+    return None if segundos is None else round(segundos * 1000, 1)
+
+
+# ===============================
+# MAIN
+# ===============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Simulador ESP32-CAM sobre pty")
+    ap.add_argument('--jpegs', help="carpeta con JPEGs a reproducir (si no, sintéticos)")
+    ap.add_argument('--distancias', help="archivo con una distancia en cm por línea")
+    ap.add_argument('--traza', default='aproximacion', choices=['aproximacion', 'seno', 'fija'],
+                    help="traza sintética si no se pasa --distancias")
+    ap.add_argument('--baudios', type=int, default=500000)
+    ap.add_argument('--latencia', type=float, default=0.03, help="segundos de captura por frame")
+    ap.add_argument('--corrupcion', type=float, default=0.0, help="probabilidad de corromper cada frame")
+    ap.add_argument('--semilla', type=int, default=None)
+    ap.add_argument('--hz-distancia', type=float, default=25.0,
+                    help="muestras por segundo del HC-SR04 en streaming")
+    ap.add_argument('--medir', type=float, metavar='SEG', help="medir con el cliente incluido y salir")
+    ap.add_argument('--modo', default='stream', choices=['stream', 'imgstart'])
+    ap.add_argument('--json', action='store_true', help="imprimir el resultado como JSON")
+    args = ap.parse_args()
+
+    jpegs = cargar_jpegs(args.jpegs) if args.jpegs else jpegs_sinteticos()
+    if not jpegs:
+        raise SystemExit(f"❌ No hay JPEGs válidos en {args.jpegs}")
+    distancias = cargar_distancias(args.distancias) if args.distancias \
+        else distancias_sinteticas(args.traza)
+
+    sim = SimuladorESP32(jpegs, distancias, args.baudios, args.latencia,
+                         args.corrupcion, args.semilla, args.hz_distancia).iniciar()
+    print(f"🔌 ESP32-CAM simulada en {sim.ruta} ({len(jpegs)} JPEGs, {args.baudios} bps)")
+
+    try:
+        if args.medir:
+            resultado = medir(sim, args.medir, args.modo)
+            if args.json:
+                print(json.dumps(resultado, indent=2))
+            else:
+                for clave, valor in resultado.items():
+                    print(f"  {clave}: {valor}")
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.cerrar()
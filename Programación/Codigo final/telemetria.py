@@ -0,0 +1,90 @@
+"""
+Historial de distancias del HC-SR04.
+
+El ESP32 manda la distancia en tramas propias a 20–50 Hz, intercaladas con
+los fragmentos de imagen. Acá se guardan con el instante de llegada en un
+buffer circular, para que cualquier frame o detección pueda buscar la
+muestra más cercana a su propio instante, y los avisos de proximidad usen
+la última sin esperar a que termine de llegar una imagen.
+"""
+import threading
+import time
+
+
+class HistorialDistancias:
+    """Buffer circular de (t, cm, t_esp) ordenado por t (time.monotonic)."""
+
+    def __init__(self, capacidad=512):
+        self.capacidad = capacidad
+        self._t = [0.0] * capacidad
+        self._cm = [0] * capacidad
+        self._t_esp = [None] * capacidad
+        self._inicio = 0              # índice físico de la muestra más vieja
+        self._n = 0
+        self._lock = threading.Lock()
+        self.muestras = 0             # total recibidas
+
+    def __len__(self):
+        return self._n
+
+    def agregar(self, cm, t=None, t_esp=None):
+        """Guarda una muestra; t_esp es el millis() del ESP32 si viene."""
+        t = time.monotonic() if t is None else t
+        with self._lock:
+            if self._n and t < self._t[self._fisico(self._n - 1)]:
+                # reloj fuera de orden (no debería pasar): no romper el orden
+                t = self._t[self._fisico(self._n - 1)]
+            if self._n < self.capacidad:
+                i = self._fisico(self._n)
+                self._n += 1
+            else:
+                i = self._inicio
+                self._inicio = (self._inicio + 1) % self.capacidad
+            self._t[i], self._cm[i], self._t_esp[i] = t, cm, t_esp
+            self.muestras += 1
+
+    def ultima(self):
+        """(t, cm) de la muestra más nueva, o None si no hay ninguna."""
+        with self._lock:
+            if not self._n:
+                return None
+            i = self._fisico(self._n - 1)
+            return self._t[i], self._cm[i]
+
+    def cercana(self, t, tolerancia=None):
+        """
+        (t, cm) de la muestra más cercana al instante t, o None si no hay
+        ninguna (o si la más cercana está a más de `tolerancia` segundos).
+        """
+        with self._lock:
+            if not self._n:
+                return None
+            k = self._primera_desde(t)
+            candidatas = [j for j in (k - 1, k) if 0 <= j < self._n]
+            j = min(candidatas, key=lambda j: abs(self._t[self._fisico(j)] - t))
+            i = self._fisico(j)
+            if tolerancia is not None and abs(self._t[i] - t) > tolerancia:
+                return None
+            return self._t[i], self._cm[i]
+
+    def ventana(self, desde):
+        """Lista de (t, cm) con t >= desde, de la más vieja a la más nueva."""
+        with self._lock:
+            k = self._primera_desde(desde)
+            return [(self._t[i], self._cm[i])
+                    for i in map(self._fisico, range(k, self._n))]
+
+    # -------------------------------
+    def _fisico(self, j):
+        return (self._inicio + j) % self.capacidad
+
+    def _primera_desde(self, t):
+        """Búsqueda binaria: primera posición lógica con tiempo >= t."""
+        bajo, alto = 0, self._n
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._t[self._fisico(medio)] < t:
+                bajo = medio + 1
+            else:
+                alto = medio
+        return bajo
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# los módulos del sistema están sueltos en la carpeta de arriba
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import pty
+import termios
+import tty
+
+import pytest
+
+from captura_async import FuenteFramesAsync
+from protocolo_via import (PoolBuffers, empaquetar_trama, TIPO_IMAGEN, TIPO_DISTANCIA,
+                           MARCA_DISTANCIA)
+
+JPEG = b'\xff\xd8' + bytes(2000) + b'\xff\xd9'
+
+
+class PuertoPty:
+    """El lado esclavo de un pty configurado como lo deja pyserial (VMIN=VTIME=0)."""
+
+    def __init__(self):
+        self.maestro, self.esclavo = pty.openpty()
+        tty.setraw(self.esclavo)
+        atributos = termios.tcgetattr(self.esclavo)
+        atributos[6][termios.VMIN] = 0
+        atributos[6][termios.VTIME] = 0
+        termios.tcsetattr(self.esclavo, termios.TCSANOW, atributos)
+        self.port = 'pty'
+        self.escrito = b''
+
+    def fileno(self):
+        return self.esclavo
+
+    def write(self, datos):
+        self.escrito += datos
+
+    def reset_input_buffer(self):
+        termios.tcflush(self.esclavo, termios.TCIFLUSH)
+
+    def cerrar(self):
+        for fd in (self.maestro, self.esclavo):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+@pytest.fixture
+def puerto():
+    p = PuertoPty()
+    yield p
+    p.cerrar()
+
+
+def test_lectura_vacia_no_es_fin_de_archivo(puerto):
+    # con VMIN=0 un tty vacío devuelve 0 bytes en lugar de EAGAIN
+    os.set_blocking(puerto.esclavo, False)
+    assert os.read(puerto.esclavo, 16) == b''
+
+    distancias = []
+    pool = PoolBuffers(cantidad=3, tamano=8192)
+
+    async def correr():
+        fuente = FuenteFramesAsync(puerto, pool, plazo_frame=2.0,
+                                   al_distancia=lambda cm, t, t_esp: distancias.append(cm))
+        await fuente.iniciar()
+        for seq in range(3):
+            os.write(puerto.maestro, empaquetar_trama(TIPO_DISTANCIA, seq, 100 + seq,
+                                                      MARCA_DISTANCIA.pack(seq)))
+            await asyncio.sleep(0.05)
+        os.write(puerto.maestro, empaquetar_trama(TIPO_IMAGEN, 3, 50, JPEG))
+        trama = await fuente.__anext__()
+        recibido = bytes(trama.payload)
+        trama.liberar()
+        abierto = fuente._fd is not None
+        fuente.cerrar()
+        return recibido, abierto
+
+    recibido, abierto = asyncio.run(correr())
+    assert recibido == JPEG
+    assert abierto
+    assert distancias == [100, 101, 102]
+
+
+def test_puerto_cerrado_termina_con_connection_error(puerto):
+    pool = PoolBuffers(cantidad=3, tamano=8192)
+
+    async def correr():
+        fuente = FuenteFramesAsync(puerto, pool, plazo_frame=2.0)
+        await fuente.iniciar()
+        os.close(puerto.maestro)
+        with pytest.raises(ConnectionError):
+            await fuente.__anext__()
+        return fuente._fd
+
+    assert asyncio.run(correr()) is None
+    assert pool.asignaciones_extra == 0
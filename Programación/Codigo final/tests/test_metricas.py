@@ -0,0 +1,40 @@
+import pytest
+
+from metricas import Registro
+
+
+def test_contador_con_etiquetas_e_histograma():
+    registro = Registro()
+    frames = registro.contador('via_frames_total', "Frames", ('camara',))
+    frames.con('frente').inc()
+    frames.con('frente').inc(2)
+    etapas = registro.histograma('via_etapa_segundos', "Etapas", ('etapa',), cubetas=(0.1, 1.0))
+    etapas.con('captura').observar(0.5)
+    texto = registro.exponer()
+    assert 'via_frames_total{camara="frente"} 3' in texto
+    assert 'via_etapa_segundos_bucket{etapa="captura",le="0.1"} 0' in texto
+    assert 'via_etapa_segundos_bucket{etapa="captura",le="1.0"} 1' in texto
+    assert 'via_etapa_segundos_count{etapa="captura"} 1' in texto
+
+
+def test_funcion_none_no_expone_muestras():
+    registro = Registro()
+    registro.medidor('via_clientes', "Clientes", funcion=lambda: None)
+    texto = registro.exponer()
+    assert '# TYPE via_clientes gauge' in texto
+    assert '\nvia_clientes ' not in texto
+
+
+def test_error_en_la_funcion_no_se_tapa():
+    registro = Registro()
+    registro.contador('via_roto_total', "Roto", funcion=lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        registro.exponer()
+
+
+def test_misma_metrica_con_otra_forma():
+    registro = Registro()
+    registro.contador('via_x_total', "X", ('camara',))
+    assert registro.contador('via_x_total', "X", ('camara',)) is not None
+    with pytest.raises(ValueError):
+        registro.medidor('via_x_total', "X")
@@ -0,0 +1,129 @@
+import io
+
+from protocolo_via import (ParserTramas, PoolBuffers, LectorTramas, empaquetar_trama,
+                           leer_distancia, leer_respuesta_imagen, es_jpeg,
+                           TIPO_IMAGEN, TIPO_DISTANCIA, TIPO_FRAGMENTO, FLAG_FIN,
+                           FLAG_RECORTE, SIN_DISTANCIA, MARCA_DISTANCIA, LARGO_CABECERA)
+
+JPEG = b'\xff\xd8' + bytes(range(256)) * 8 + b'\xff\xd9'
+
+
+def alimentar(parser, datos, de_a=7):
+    """Pasa `datos` al parser en pedazos chicos, como llegan del serial."""
+    datos = memoryview(datos)
+    while datos:
+        destino = parser.destino()
+        k = min(len(destino), len(datos), de_a)
+        destino[:k] = datos[:k]
+        parser.alimentar(k)
+        datos = datos[k:]
+
+
+def tramas(parser):
+    lista = []
+    while True:
+        trama = parser.trama_lista()
+        if trama is None:
+            return lista
+        lista.append((trama.tipo, trama.flags, trama.seq, trama.aux, bytes(trama.payload)))
+        trama.liberar()
+
+
+def fragmentos(jpeg, seq=0, tam=100, flags=0):
+    datos = b''
+    partes = range(0, len(jpeg), tam)
+    for indice, inicio in enumerate(partes):
+        fin = FLAG_FIN if inicio + tam >= len(jpeg) else 0
+        datos += empaquetar_trama(TIPO_FRAGMENTO, seq + indice, indice,
+                                  jpeg[inicio:inicio + tam], flags | fin)
+    return datos
+
+
+def test_trama_simple():
+    parser = ParserTramas(PoolBuffers(cantidad=2, tamano=4096), max_payload=4096)
+    alimentar(parser, empaquetar_trama(TIPO_IMAGEN, 5, 120, JPEG, FLAG_RECORTE))
+    assert tramas(parser) == [(TIPO_IMAGEN, FLAG_RECORTE, 5, 120, JPEG)]
+    assert parser.tramas_ok == 1
+
+
+def test_resincroniza_despues_de_basura():
+    parser = ParserTramas(PoolBuffers(cantidad=2, tamano=4096), max_payload=4096)
+    distancia = empaquetar_trama(TIPO_DISTANCIA, 1, 80, MARCA_DISTANCIA.pack(1234))
+    basura = b'\x00\x11\xa5\x5a\xc3basura'      # con un sincronismo a medias
+    alimentar(parser, basura + distancia)
+    assert tramas(parser) == [(TIPO_DISTANCIA, 0, 1, 80, MARCA_DISTANCIA.pack(1234))]
+    assert parser.bytes_descartados == len(basura)
+    assert parser.tramas_corruptas == 0
+
+
+def test_rechaza_crc_de_cabecera():
+    parser = ParserTramas(PoolBuffers(cantidad=2, tamano=4096), max_payload=4096)
+    mala = bytearray(empaquetar_trama(TIPO_DISTANCIA, 1, 80, MARCA_DISTANCIA.pack(1)))
+    mala[LARGO_CABECERA - 1] ^= 0xFF
+    buena = empaquetar_trama(TIPO_DISTANCIA, 2, 90, MARCA_DISTANCIA.pack(2))
+    alimentar(parser, bytes(mala) + buena)
+    assert [t[2] for t in tramas(parser)] == [2]
+    assert parser.tramas_corruptas >= 1
+
+
+def test_rechaza_crc_de_payload_y_rescata_la_siguiente():
+    parser = ParserTramas(PoolBuffers(cantidad=2, tamano=4096), max_payload=4096)
+    mala = bytearray(empaquetar_trama(TIPO_IMAGEN, 1, 50, JPEG))
+    buena = empaquetar_trama(TIPO_DISTANCIA, 2, 90, MARCA_DISTANCIA.pack(2))
+    # se cortó la imagen: la trama siguiente empieza dentro del payload declarado
+    alimentar(parser, bytes(mala[:LARGO_CABECERA + 300]) + buena + bytes(len(JPEG)))
+    assert [t[2] for t in tramas(parser)] == [2]
+    assert parser.tramas_corruptas == 1
+
+
+def test_arma_imagen_de_fragmentos_con_distancias_intercaladas():
+    parser = ParserTramas(PoolBuffers(cantidad=3, tamano=4096), max_payload=4096)
+    datos = fragmentos(JPEG, seq=10)
+    # una distancia en el medio de la imagen
+    corte = datos.find(empaquetar_trama(TIPO_FRAGMENTO, 13, 3, JPEG[300:400]))
+    distancia = empaquetar_trama(TIPO_DISTANCIA, 99, 70, MARCA_DISTANCIA.pack(5))
+    alimentar(parser, datos[:corte] + distancia + datos[corte:])
+    recibidas = tramas(parser)
+    assert recibidas[0][:4] == (TIPO_DISTANCIA, 0, 99, 70)
+    assert recibidas[1] == (TIPO_IMAGEN, 0, 10, SIN_DISTANCIA, JPEG)
+
+
+def test_fragmento_perdido_descarta_la_imagen():
+    pool = PoolBuffers(cantidad=3, tamano=4096)
+    parser = ParserTramas(pool, max_payload=4096)
+    datos = fragmentos(JPEG, seq=0)
+    sin_el_2 = datos.replace(empaquetar_trama(TIPO_FRAGMENTO, 2, 2, JPEG[200:300]), b'')
+    alimentar(parser, sin_el_2 + fragmentos(JPEG, seq=100))
+    assert [t[2] for t in tramas(parser)] == [100]
+    assert parser.imagenes_incompletas == 1
+    assert pool.asignaciones_extra == 0
+
+
+def test_liberar_devuelve_el_buffer():
+    pool = PoolBuffers(cantidad=1, tamano=4096)
+    parser = ParserTramas(pool, max_payload=4096)
+    for seq in range(5):
+        alimentar(parser, empaquetar_trama(TIPO_IMAGEN, seq, 0, JPEG))
+        tramas(parser)
+    assert pool.asignaciones_extra == 0
+
+
+def test_lector_bloqueante_sobre_archivo():
+    distancia = empaquetar_trama(TIPO_DISTANCIA, 1, 42, MARCA_DISTANCIA.pack(777))
+    lector = LectorTramas(io.BytesIO(b'xx' + distancia), PoolBuffers(cantidad=1, tamano=4096),
+                          max_payload=4096)
+    trama = lector.leer_trama(timeout=1.0)
+    assert leer_distancia(trama) == (42, 777)
+    trama.liberar()
+
+
+def test_respuesta_imagen():
+    buffer = memoryview(bytearray(8192))
+    vistas = []
+    respuesta = (57).to_bytes(2, 'big') + len(JPEG).to_bytes(4, 'big') + JPEG
+    jpeg, motivo = leer_respuesta_imagen(io.BytesIO(respuesta), buffer, vistas.append)
+    assert motivo is None and bytes(jpeg) == JPEG and es_jpeg(jpeg)
+    assert vistas == [57]
+
+    corta = (57).to_bytes(2, 'big') + (10).to_bytes(4, 'big')
+    assert leer_respuesta_imagen(io.BytesIO(corta), buffer) == (None, 'tamano')
@@ -0,0 +1,40 @@
+from collections import namedtuple
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from seguimiento import Seguidor, CONF_NUEVA  # noqa: E402
+
+# la misma forma que detectores.Deteccion, sin traer cv2
+Deteccion = namedtuple('Deteccion', 'clase nombre conf caja')
+
+
+def persona(x, conf=0.9):
+    return Deteccion(0, 'person', conf, (x, 0.2, x + 0.2, 0.8))
+
+
+def test_mantiene_el_id_y_no_repite_el_aviso():
+    seguidor = Seguidor()
+    primera = seguidor.actualizar([persona(0.10)], 0.0)
+    assert [p.id for p in seguidor.por_anunciar(0.0)] == [primera[0].id]
+    segunda = seguidor.actualizar([persona(0.12)], 0.5)
+    assert [p.id for p in segunda] == [primera[0].id]
+    assert seguidor.por_anunciar(0.5) == []
+    assert len(seguidor.por_anunciar(20.0, repetir=10.0)) == 1
+
+
+def test_conf_baja_solo_continua_pistas():
+    seguidor = Seguidor()
+    assert seguidor.actualizar([persona(0.1, conf=CONF_NUEVA - 0.1)], 0.0) == []
+    seguidor.actualizar([persona(0.1)], 1.0)
+    continuada = seguidor.actualizar([persona(0.11, conf=CONF_NUEVA - 0.1)], 1.5)
+    assert len(continuada) == 1
+
+
+def test_pista_sin_deteccion_se_borra():
+    seguidor = Seguidor(max_perdidas=2)
+    seguidor.actualizar([persona(0.1)], 0.0)
+    for t in (1.0, 2.0, 3.0):
+        seguidor.actualizar([], t)
+    assert seguidor.pistas == []
@@ -0,0 +1,19 @@
+from telemetria import HistorialDistancias
+
+
+def test_cercana_y_ventana():
+    historial = HistorialDistancias(capacidad=4)
+    for i, cm in enumerate((100, 90, 80, 70, 60)):
+        historial.agregar(cm, t=float(i))
+    assert len(historial) == 4                    # la más vieja se pisó
+    assert historial.ultima() == (4.0, 60)
+    assert historial.cercana(2.4) == (2.0, 80)
+    assert historial.cercana(10.0, tolerancia=1.0) is None
+    assert historial.ventana(3.0) == [(3.0, 70), (4.0, 60)]
+
+
+def test_muestra_fuera_de_orden_no_rompe_el_orden():
+    historial = HistorialDistancias()
+    historial.agregar(100, t=5.0)
+    historial.agregar(90, t=4.0)
+    assert historial.ventana(0.0) == [(5.0, 100), (5.0, 90)]
@@ -0,0 +1,285 @@
+"""
+Streaming MJPEG que solo trabaja si alguien lo está mirando.
+
+Lo normal en la calle es que nadie tenga abierto /video: en ese caso la
+captura no prepara ningún JPEG para el streaming y esa CPU queda para la
+inferencia. Con espectadores, se producen frames al ritmo del que más fps
+pide (con la calidad del más modesto) y a cada cliente se le entregan a su
+propio ritmo: uno que pide pocos fps no frena a los demás. Si todos siguen
+escribiendo el frame anterior (socket lleno, red lenta), no se produce
+ninguno nuevo hasta que alguno se libera: no se codifican frames que nadie
+llega a recibir. Un cliente que no llega a consumir ese ritmo se saltea
+frames.
+
+Cada frame se publica una sola vez (ya armado como parte multipart) y los
+clientes esperan en una Condition: no hay sondeo ni reenvío del mismo
+frame, y el que se atrasa salta directo al más nuevo. Los clientes de un
+event loop (servidor_async.py) esperan en esperar_async().
+
+CanalEventos usa el mismo mecanismo para las detecciones de /eventos (SSE).
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+FRONTERA = b'frame'
+TIPO_MJPEG = 'multipart/x-mixed-replace; boundary=' + FRONTERA.decode()
+TIPO_EVENTOS = 'text/event-stream'
+
+
+def parte_mjpeg(jpeg):
+    """Un JPEG como parte del multipart de /video."""
+    return b'--' + FRONTERA + b'\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
+
+
+class _Difusion:
+    """
+    Un productor y muchos lectores: cada publicación sube la versión y
+    despierta a los hilos (Condition) y a las corrutinas (un futuro por
+    publicación en el loop de los clientes asíncronos).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._version = 0
+        self._loop = None             # loop de los clientes asíncronos
+        self._futuro = None           # se completa con la próxima publicación
+
+    def _avisar(self):
+        """Con el lock tomado, después de cambiar el estado."""
+        self._version += 1
+        self._cond.notify_all()
+
+    def _avisar_loop(self):
+        """Sin el lock: un solo aviso por publicación al loop, no uno por cliente."""
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._resolver_futuro)
+            except RuntimeError:
+                self._loop = None     # el loop ya se cerró
+
+    def _resolver_futuro(self):
+        futuro, self._futuro = self._futuro, None
+        if futuro is not None and not futuro.done():
+            futuro.set_result(None)
+
+    def _hay_nuevo(self, version_vista):
+        return self._version != version_vista
+
+    def _esperar_version(self, version_vista, timeout):
+        """Con el lock tomado: True si hay algo nuevo antes del timeout."""
+        return self._cond.wait_for(lambda: self._hay_nuevo(version_vista), timeout)
+
+    async def _esperar_version_async(self, version_vista):
+        while not self._hay_nuevo(version_vista):
+            if self._futuro is None:
+                self._loop = asyncio.get_running_loop()
+                self._futuro = self._loop.create_future()
+            await asyncio.shield(self._futuro)
+
+
+class Suscriptor:
+    """Un cliente de /video: lo que pidió y si todavía está mandando un frame."""
+
+    def __init__(self, fps=12.5, calidad=65):
+        self.fps = fps
+        self.calidad = calidad
+        self.enviando = False         # el servidor sigue escribiendo el último frame
+        self._t_envio = None
+
+    def espera(self, ahora=None):
+        """Segundos que faltan para que le toque otro frame según sus fps."""
+        if self._t_envio is None:
+            return 0.0
+        ahora = time.monotonic() if ahora is None else ahora
+        return max(0.0, self._t_envio + 1.0 / self.fps - ahora)
+
+    def registrar_envio(self, ahora=None):
+        self._t_envio = time.monotonic() if ahora is None else ahora
+
+
+class Transmision(_Difusion):
+    """
+    Difusión del streaming de una cámara en un perfil: suscriptores y
+    último frame. publicar() despierta a todos los que esperan en esperar().
+    `ancho` es el ancho máximo del perfil (None: el que manda la cámara).
+    """
+
+    def __init__(self, fps_max=12.5, calidad=65, ancho=None):
+        super().__init__()
+        self.fps_max = fps_max
+        self.calidad_max = calidad
+        self.ancho = ancho
+        self._suscriptores = set()
+        self._parte = None
+        self._t_frame = None
+
+    def suscribir(self, fps=None, calidad=None):
+        fps = min(self.fps_max, fps or self.fps_max)
+        calidad = min(self.calidad_max, calidad or self.calidad_max)
+        s = Suscriptor(fps, calidad)
+        with self._lock:
+            self._suscriptores.add(s)
+        return s
+
+    def desuscribir(self, s):
+        with self._lock:
+            self._suscriptores.discard(s)
+            if not self._suscriptores:
+                # no mostrar un frame viejo al próximo
+                self._parte = None
+
+    def espectadores(self):
+        return len(self._suscriptores)
+
+    def demanda(self):
+        """
+        (fps, calidad) a producir, o None si no hay nadie mirando o si todos
+        siguen escribiendo el frame anterior (contrapresión del socket).
+        """
+        with self._lock:
+            if not self._suscriptores or all(s.enviando for s in self._suscriptores):
+                return None
+            fps = max(s.fps for s in self._suscriptores)
+            calidad = min(s.calidad for s in self._suscriptores)
+        return fps, calidad
+
+    def quiere_frame(self, ahora=None):
+        """
+        Calidad JPEG con la que producir este frame, o None si no hace
+        falta (nadie mirando o todavía no toca según los fps pedidos).
+        """
+        demanda = self.demanda()
+        if demanda is None:
+            return None
+        fps, calidad = demanda
+        ahora = time.monotonic() if ahora is None else ahora
+        # 10 % de tolerancia: con la cámara justo al ritmo pedido, un frame
+        # que llega apenas antes (jitter) no tiene que esperar al siguiente
+        if self._t_frame is not None and ahora - self._t_frame < 0.9 / fps:
+            return None
+        return calidad
+
+    def publicar(self, jpeg, ahora=None):
+        parte = parte_mjpeg(jpeg)     # se arma una vez para todos los clientes
+        with self._cond:
+            self._parte = parte
+            self._t_frame = time.monotonic() if ahora is None else ahora
+            self._avisar()
+        self._avisar_loop()
+
+    def _hay_nuevo(self, version_vista):
+        return self._parte is not None and self._version != version_vista
+
+    def esperar(self, version_vista=0, timeout=None):
+        """
+        Bloquea hasta que haya un frame más nuevo que `version_vista` y
+        devuelve (parte_mjpeg, version); (None, version_vista) si vence el
+        timeout. Si se publicaron varios mientras tanto, solo el último.
+        """
+        with self._cond:
+            if not self._esperar_version(version_vista, timeout):
+                return None, version_vista
+            return self._parte, self._version
+
+    async def esperar_async(self, version_vista=0):
+        """Como esperar(), pero para corrutinas (sin timeout: usar wait_for)."""
+        await self._esperar_version_async(version_vista)
+        return self._parte, self._version
+
+    def generar(self, fps=None, calidad=None):
+        """
+        Cuerpo de /video para servidores con un hilo por cliente (Flask).
+        Si no hay frames en 5 s se reenvía el último (o un CRLF de preámbulo
+        si todavía no hubo ninguno): el servidor solo se entera de que el
+        cliente se fue al escribir, y así el hilo no queda colgado.
+        """
+        suscriptor = self.suscribir(fps, calidad)
+        version = 0
+        ultima = None
+        try:
+            while True:
+                time.sleep(suscriptor.espera())
+                parte, version = self.esperar(version, timeout=5.0)
+                if parte is None:
+                    yield ultima or b'\r\n'
+                    continue
+                ultima = parte
+                suscriptor.registrar_envio()
+                # el generador sigue recién cuando el servidor terminó de escribir
+                suscriptor.enviando = True
+                yield parte
+                suscriptor.enviando = False
+        finally:
+            self.desuscribir(suscriptor)
+
+    async def generar_async(self, fps=None, calidad=None):
+        """Cuerpo de /video para servidor_async (el servidor hace el drain)."""
+        suscriptor = self.suscribir(fps, calidad)
+        version = 0
+        try:
+            while True:
+                await asyncio.sleep(suscriptor.espera())
+                parte, version = await self.esperar_async(version)
+                suscriptor.registrar_envio()
+                suscriptor.enviando = True
+                yield parte
+                suscriptor.enviando = False
+        finally:
+            self.desuscribir(suscriptor)
+
+
+class CanalEventos(_Difusion):
+    """
+    Eventos JSON para Server-Sent Events. Cada evento se serializa una vez
+    y se guardan los últimos `capacidad`: un cliente atrasado recibe los
+    que sigan guardados, y si se atrasó más que eso, desde el más viejo.
+    """
+
+    def __init__(self, capacidad=64):
+        super().__init__()
+        self._eventos = deque(maxlen=capacidad)   # (id, bytes SSE)
+
+    def publicar(self, evento):
+        datos = json.dumps(evento, separators=(',', ':'))
+        with self._cond:
+            ident = self._version + 1
+            self._eventos.append((ident, f"id: {ident}\ndata: {datos}\n\n".encode()))
+            self._avisar()
+        self._avisar_loop()
+
+    def _desde(self, version_vista):
+        return b''.join(e for i, e in self._eventos if i > version_vista)
+
+    def esperar(self, version_vista=0, timeout=None):
+        """(bytes con los eventos nuevos, version), o (None, version_vista)."""
+        with self._cond:
+            if not self._esperar_version(version_vista, timeout):
+                return None, version_vista
+            return self._desde(version_vista), self._version
+
+    async def esperar_async(self, version_vista=0):
+        await self._esperar_version_async(version_vista)
+        with self._lock:
+            return self._desde(version_vista), self._version
+
+    def generar(self):
+        """Cuerpo de /eventos para Flask. Los comentarios mantienen viva la conexión."""
+        version = self._version
+        yield b': conectado\n\n'
+        while True:
+            datos, version = self.esperar(version, timeout=15.0)
+            yield datos if datos is not None else b': ping\n\n'
+
+    async def generar_async(self):
+        version = self._version
+        yield b': conectado\n\n'
+        while True:
+            try:
+                datos, version = await asyncio.wait_for(self.esperar_async(version), 15.0)
+            except asyncio.TimeoutError:
+                datos = b': ping\n\n'
+            yield datos
@@ -0,0 +1,134 @@
+"""
+Trazas por frame: de la captura al audio.
+
+Cada frame lleva una Traza con un id y el instante (time.monotonic) en que
+termina cada etapa. Las etapas son los tramos entre marcas consecutivas:
+
+    recepcion          IMGSTART enviado / primera trama → JPEG completo
+    espera_inferencia  JPEG listo → la inferencia lo toma
+    decodificacion     ¿cambió la escena? y ROI decodificado
+    inferencia         model.predict del lote
+    resultado          cajas armadas y frase encolada para TTS
+    espera_tts         frase en cola → hilo TTS la toma
+    espeak             proceso espeak lanzado
+
+Las trazas cerradas quedan en un buffer circular; chrome() las exporta en
+formato Chrome trace (chrome://tracing, ui.perfetto.dev) y resumen() da
+los percentiles por etapa y de punta a punta.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+ETAPAS = ('recepcion', 'espera_inferencia', 'decodificacion', 'inferencia',
+          'resultado', 'espera_tts', 'espeak')
+
+
+class Traza:
+    """Marcas de tiempo de un frame; cada marca cierra una etapa."""
+    __slots__ = ('id', 'camara', 't0', 'marcas', 'datos')
+
+    def __init__(self, ident, camara, t0):
+        self.id = ident
+        self.camara = camara
+        self.t0 = t0
+        self.marcas = []              # (etapa, instante en que terminó)
+        self.datos = {}
+
+    def marcar(self, etapa, t=None):
+        self.marcas.append((etapa, time.monotonic() if t is None else t))
+        return self
+
+    @property
+    def t_fin(self):
+        return self.marcas[-1][1] if self.marcas else self.t0
+
+    def tramos(self):
+        """[(etapa, inicio, fin)] en orden."""
+        tramos, inicio = [], self.t0
+        for etapa, fin in self.marcas:
+            tramos.append((etapa, inicio, fin))
+            inicio = fin
+        return tramos
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p * len(valores)))]
+
+
+def _estadisticas(segundos):
+    return {'n': len(segundos),
+            'p50_ms': round(1000 * _percentil(segundos, 0.50), 2),
+            'p95_ms': round(1000 * _percentil(segundos, 0.95), 2),
+            'max_ms': round(1000 * max(segundos), 2)}
+
+
+class Trazador:
+    """Crea trazas y guarda las últimas `capacidad` cerradas."""
+
+    def __init__(self, capacidad=512):
+        self._ids = itertools.count(1)
+        self._cerradas = deque(maxlen=capacidad)
+        self._lock = threading.Lock()
+
+    def nueva(self, camara, t0=None):
+        return Traza(next(self._ids), camara, time.monotonic() if t0 is None else t0)
+
+    def cerrar(self, traza, **datos):
+        """Guarda la traza (ya no se marca más). `datos` van a los args del trace."""
+        traza.datos.update(datos)
+        with self._lock:
+            self._cerradas.append(traza)
+
+    def trazas(self, segundos=None):
+        with self._lock:
+            trazas = list(self._cerradas)
+        if segundos is not None:
+            desde = time.monotonic() - segundos
+            trazas = [t for t in trazas if t.t_fin >= desde]
+        return trazas
+
+    def chrome(self, segundos=None):
+        """Trazas de la ventana en formato Chrome trace (dict listo para json.dumps)."""
+        trazas = self.trazas(segundos)
+        procesos = {}
+        eventos = []
+        for traza in trazas:
+            pid = procesos.setdefault(traza.camara, len(procesos) + 1)
+            base = {'cat': 'frame', 'id': traza.id, 'pid': pid, 'tid': pid}
+            args = dict(traza.datos, traza=traza.id)
+            eventos.append(dict(base, ph='b', name=f"frame {traza.id}",
+                                ts=traza.t0 * 1e6, args=args))
+            for etapa, inicio, fin in traza.tramos():
+                eventos.append(dict(base, ph='b', name=etapa, ts=inicio * 1e6))
+                eventos.append(dict(base, ph='e', name=etapa, ts=fin * 1e6))
+            eventos.append(dict(base, ph='e', name=f"frame {traza.id}", ts=traza.t_fin * 1e6))
+        for camara, pid in procesos.items():
+            eventos.append({'ph': 'M', 'name': 'process_name', 'pid': pid,
+                            'args': {'name': f"cámara {camara}"}})
+        return {'traceEvents': eventos, 'displayTimeUnit': 'ms'}
+
+    def resumen(self, segundos=None):
+        """Percentiles por etapa, captura→inferencia y captura→audio."""
+        trazas = self.trazas(segundos)
+        por_etapa = {}
+        hasta_inferencia, hasta_audio = [], []
+        for traza in trazas:
+            for etapa, inicio, fin in traza.tramos():
+                por_etapa.setdefault(etapa, []).append(fin - inicio)
+                if etapa == 'inferencia':
+                    hasta_inferencia.append(fin - traza.t0)
+            if traza.marcas and traza.marcas[-1][0] == 'espeak':
+                hasta_audio.append(traza.t_fin - traza.t0)
+        orden = [e for e in ETAPAS if e in por_etapa] + sorted(set(por_etapa) - set(ETAPAS))
+        resumen = {'trazas': len(trazas),
+                   'etapas': {e: _estadisticas(por_etapa[e]) for e in orden}}
+        if hasta_inferencia:
+            resumen['captura_inferencia'] = _estadisticas(hasta_inferencia)
+        if hasta_audio:
+            resumen['captura_audio'] = _estadisticas(hasta_audio)
+        return resumen
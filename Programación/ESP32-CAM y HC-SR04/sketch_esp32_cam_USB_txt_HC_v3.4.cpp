@@ -1,4 +1,5 @@
 #include "esp_camera.h"
+#include "rom/crc.h"
 
 // ===============================
 // CONFIGURACIÓN DE LA CÁMARA (AI Thinker ESP32-CAM)
@@ -26,33 +27,55 @@
 // ===============================
 #define TRIG_PIN  14
 #define ECHO_PIN  15
+#define PERIODO_DISTANCIA_MS 40   // 25 Hz, independiente de las imágenes
 
 // ===============================
 // CONFIGURACIÓN SERIAL
 // ===============================
 #define BAUDRATE 500000
-#define CMD_TIMEOUT_MS 1000
+
+// ===============================
+// TRAMAS DEL MODO STREAMING
+// ===============================
+// Cabecera de 20 bytes (big-endian), igual que protocolo_via.py:
+// sync A5 5A C3 3C | tipo | flags | seq(2) | aux(2) | largo(4) | crc32(4) | crc_cab(2)
+#define TRAMA_TIPO_IMAGEN  0x01
+#define TRAMA_TIPO_CONFIG  0x02   // respuesta a CFG (texto "OK ..." / "ERR ...")
+#define TRAMA_TIPO_DISTANCIA 0x03 // aux = cm, payload = millis() (4 bytes BE)
+#define TRAMA_TIPO_FRAGMENTO 0x04 // aux = índice del fragmento dentro de la imagen
+#define TRAMA_LARGO_CAB    20
+#define TRAMA_FLAG_RECORTE 0x01   // la imagen es solo la ventana pedida en CFG
+#define TRAMA_FLAG_FIN     0x02   // último fragmento de la imagen
+#define TAM_FRAGMENTO      1024   // ≈20 ms a 500 kbps entre muestras de distancia
 
 // ===============================
 // FUNCIONES AUXILIARES
 // ===============================
 
-// Espera el comando “IMGSTART” con timeout
-bool esperarComandoIMG(unsigned long timeout_ms) {
-  unsigned long start = millis();
-  String cmd = "";
-  while (millis() - start < timeout_ms) {
-    while (Serial.available() > 0) {
-      char c = (char)Serial.read();
-      if (c == '\n') {
-        cmd.trim();
-        if (cmd == "IMGSTART") return true;
-        cmd = "";
-      } else {
-        cmd += c;
-      }
+// Estado del modo streaming (STREAMSTART / STREAMSTOP)
+bool streaming = false;
+String bufferCmd = "";
+uint16_t secuencia = 0;
+bool recorteActivo = false;
+
+// Última medición de la tarea del HC-SR04
+portMUX_TYPE muxDistancia = portMUX_INITIALIZER_UNLOCKED;
+uint16_t distanciaActual = 0;
+uint32_t tDistancia = 0;
+bool distanciaNueva = false;
+
+// Lee los comandos pendientes sin bloquear.
+// Devuelve true cuando se completó una línea (terminada en '\n').
+bool leerComando(String &cmd) {
+  while (Serial.available() > 0) {
+    char c = (char)Serial.read();
+    if (c == '\n') {
+      bufferCmd.trim();
+      cmd = bufferCmd;
+      bufferCmd = "";
+      return true;
     }
-    delay(1);
+    if (bufferCmd.length() < 64) bufferCmd += c;
   }
   return false;
 }
@@ -71,13 +94,36 @@ float medirDistanciaCM() {
   return distance;
 }
 
+// Tarea aparte (núcleo 0): mide a ritmo fijo aunque el loop esté ocupado
+// mandando una imagen. El loop toma la muestra entre fragmentos.
+void tareaDistancia(void *) {
+  TickType_t ultimo = xTaskGetTickCount();
+  for (;;) {
+    float d = medirDistanciaCM();
+    uint16_t cm = d < 0 ? 0 : (uint16_t)d;
+    portENTER_CRITICAL(&muxDistancia);
+    distanciaActual = cm;
+    tDistancia = millis();
+    distanciaNueva = true;
+    portEXIT_CRITICAL(&muxDistancia);
+    vTaskDelayUntil(&ultimo, pdMS_TO_TICKS(PERIODO_DISTANCIA_MS));
+  }
+}
+
+uint16_t leerDistancia() {
+  portENTER_CRITICAL(&muxDistancia);
+  uint16_t cm = distanciaActual;
+  portEXIT_CRITICAL(&muxDistancia);
+  return cm;
+}
+
 // ===============================
 // CONFIGURACIÓN PRINCIPAL
 // ===============================
 void setup() {
   Serial.begin(BAUDRATE);
   Serial.setTimeout(100);
-  Serial.println("\nESP32-CAM lista. Esperando comando IMGSTART...");
+  Serial.println("\nESP32-CAM lista. Esperando comando IMGSTART / STREAMSTART...");
 
   // Inicializa pines del sensor ultrasónico
   pinMode(TRIG_PIN, OUTPUT);
@@ -109,31 +155,121 @@ void setup() {
   config.jpeg_quality = 12;            // menor → más calidad
   config.fb_count = 1;
 
+  // Con PSRAM usamos doble buffer: la cámara captura el siguiente frame
+  // mientras el anterior sale por el serial (clave en modo streaming).
+  if (psramFound()) {
+    config.fb_count = 2;
+    config.grab_mode = CAMERA_GRAB_LATEST;
+  }
+
   if (esp_camera_init(&config) != ESP_OK) {
     Serial.println("❌ Error al inicializar la cámara");
     while (true) delay(1000);
   }
 
   Serial.println("✅ Cámara inicializada correctamente");
+
+  xTaskCreatePinnedToCore(tareaDistancia, "distancia", 2048, NULL, 1, NULL, 0);
+}
+
+// Envía una trama con cabecera, secuencia y CRC32 (modo streaming).
+// crc32_le(0, ...) de la ROM da el mismo valor que zlib.crc32 en Python.
+void enviarTrama(uint8_t tipo, uint16_t aux, const uint8_t *payload, uint32_t len, uint8_t flags = 0) {
+  uint32_t crc = crc32_le(0, payload, len);
+  uint8_t cab[TRAMA_LARGO_CAB] = {
+    0xA5, 0x5A, 0xC3, 0x3C,
+    tipo, flags,
+    (uint8_t)(secuencia >> 8), (uint8_t)(secuencia & 0xFF),
+    (uint8_t)(aux >> 8), (uint8_t)(aux & 0xFF),
+    (uint8_t)(len >> 24), (uint8_t)(len >> 16), (uint8_t)(len >> 8), (uint8_t)(len & 0xFF),
+    (uint8_t)(crc >> 24), (uint8_t)(crc >> 16), (uint8_t)(crc >> 8), (uint8_t)(crc & 0xFF),
+    0, 0
+  };
+  uint16_t crc_cab = (uint16_t)(crc32_le(0, cab, TRAMA_LARGO_CAB - 2) & 0xFFFF);
+  cab[18] = (uint8_t)(crc_cab >> 8);
+  cab[19] = (uint8_t)(crc_cab & 0xFF);
+
+  Serial.write(cab, TRAMA_LARGO_CAB);
+  Serial.write(payload, len);
+  secuencia++;
+}
+
+// Manda la muestra de distancia si hay una nueva (solo en streaming).
+void enviarDistanciaSiHay() {
+  portENTER_CRITICAL(&muxDistancia);
+  bool nueva = distanciaNueva;
+  uint16_t cm = distanciaActual;
+  uint32_t t = tDistancia;
+  distanciaNueva = false;
+  portEXIT_CRITICAL(&muxDistancia);
+  if (!nueva) return;
+
+  uint8_t marca[4] = { (uint8_t)(t >> 24), (uint8_t)(t >> 16), (uint8_t)(t >> 8), (uint8_t)(t & 0xFF) };
+  enviarTrama(TRAMA_TIPO_DISTANCIA, cm, marca, 4);
 }
 
 // ===============================
-// LOOP PRINCIPAL
+// CONFIGURACIÓN EN CALIENTE (CFG)
 // ===============================
-void loop() {
-  // Esperar comando IMGSTART\n desde Raspberry
-  if (!esperarComandoIMG(CMD_TIMEOUT_MS)) {
-    delay(5);
-    return;
+framesize_t tamanoDesdeNombre(const char *nombre) {
+  if (strcmp(nombre, "QQVGA") == 0) return FRAMESIZE_QQVGA;  // 160×120
+  if (strcmp(nombre, "QVGA") == 0)  return FRAMESIZE_QVGA;   // 320×240
+  if (strcmp(nombre, "CIF") == 0)   return FRAMESIZE_CIF;    // 400×296
+  if (strcmp(nombre, "VGA") == 0)   return FRAMESIZE_VGA;    // 640×480
+  return FRAMESIZE_INVALID;
+}
+
+// "CFG <tamaño> <calidad> [x y ancho alto]"
+// El recorte opcional va en milésimas del campo completo del sensor y solo
+// se aplica en la OV2640 (ventana UXGA 1600×1200 escalada al tamaño pedido).
+// Los frame buffers se reservaron para VGA: no se puede pedir algo mayor.
+void aplicarConfig(const String &cmd) {
+  char nombre[8] = "";
+  int calidad = 0, x = 0, y = 0, ancho = 0, alto = 0;
+  int n = sscanf(cmd.c_str(), "CFG %7s %d %d %d %d %d", nombre, &calidad, &x, &y, &ancho, &alto);
+  framesize_t fs = tamanoDesdeNombre(nombre);
+  sensor_t *s = esp_camera_sensor_get();
+  String resp;
+
+  if (n < 2 || fs == FRAMESIZE_INVALID || calidad < 4 || calidad > 63 || (n > 2 && n != 6)) {
+    resp = "ERR " + cmd;
+  } else {
+    s->set_framesize(s, fs);
+    s->set_quality(s, calidad);
+    recorteActivo = false;
+    if (n == 6 && s->id.PID == OV2640_PID &&
+        x >= 0 && y >= 0 && ancho > 0 && alto > 0 && x + ancho <= 1000 && y + alto <= 1000) {
+      int ox = (x * 1600 / 1000) & ~3;
+      int oy = (y * 1200 / 1000) & ~3;
+      int ow = (ancho * 1600 / 1000) & ~3;
+      int oh = (alto * 1200 / 1000) & ~3;
+      s->set_res_raw(s, 0, 0, 0, 0, ox, oy, ow, oh,
+                     resolution[fs].width, resolution[fs].height, false, false);
+      recorteActivo = true;
+    }
+    resp = String("OK ") + nombre + " " + calidad + (recorteActivo ? " RECORTE" : "");
   }
 
-  // Medir distancia
-  float distancia = medirDistanciaCM();
-  if (distancia < 0) distancia = 0;
+  if (streaming) {
+    enviarTrama(TRAMA_TIPO_CONFIG, 0, (const uint8_t *)resp.c_str(), resp.length());
+  }
+}
+
+// ===============================
+// ENVÍO DE UN FRAME
+// ===============================
+// IMGSTART: distancia (2 bytes BE) + tamaño (4 bytes BE) + JPEG
+// Streaming: la imagen en tramas TRAMA_TIPO_FRAGMENTO, con las tramas de
+// distancia intercaladas entre fragmentos (el host arma la imagen de nuevo)
+void enviarFrame() {
+  // La distancia la mide tareaDistancia(): acá solo se lee la última
+  uint16_t dist_int = leerDistancia();
 
   // Capturar imagen
   camera_fb_t *fb = esp_camera_fb_get();
   if (!fb) {
+    // En streaming se saltea el frame sin escribir texto entre tramas.
+    if (streaming) return;
     Serial.println("⚠️ Error al capturar imagen");
     uint16_t dist_int_err = 0;
     uint8_t dist_bytes_err[2] = { (uint8_t)(dist_int_err >> 8), (uint8_t)(dist_int_err & 0xFF) };
@@ -144,8 +280,21 @@ void loop() {
     return;
   }
 
+  if (streaming) {
+    uint8_t flags = recorteActivo ? TRAMA_FLAG_RECORTE : 0;
+    uint16_t indice = 0;
+    for (size_t off = 0; off < fb->len; off += TAM_FRAGMENTO, indice++) {
+      enviarDistanciaSiHay();
+      size_t n = fb->len - off < TAM_FRAGMENTO ? fb->len - off : TAM_FRAGMENTO;
+      bool fin = off + n >= fb->len;
+      enviarTrama(TRAMA_TIPO_FRAGMENTO, indice, fb->buf + off, n,
+                  flags | (fin ? TRAMA_FLAG_FIN : 0));
+    }
+    esp_camera_fb_return(fb);
+    return;
+  }
+
   // Enviar distancia (2 bytes big-endian)
-  uint16_t dist_int = (uint16_t)distancia;
   uint8_t dist_bytes[2] = {
     (uint8_t)((dist_int >> 8) & 0xFF),
     (uint8_t)(dist_int & 0xFF)
@@ -164,11 +313,39 @@ void loop() {
 
   // Enviar datos JPEG
   Serial.write(fb->buf, fb->len);
-  Serial.flush();
 
   // Liberar frame buffer
   esp_camera_fb_return(fb);
+}
+
+// ===============================
+// LOOP PRINCIPAL
+// ===============================
+void loop() {
+  String cmd;
+  if (leerComando(cmd)) {
+    if (cmd == "IMGSTART") {
+      // Modo clásico: un frame por pedido
+      enviarFrame();
+      Serial.flush();
+    } else if (cmd == "STREAMSTART") {
+      streaming = true;
+    } else if (cmd == "STREAMSTOP") {
+      streaming = false;
+      Serial.flush();
+    } else if (cmd.startsWith("CFG ")) {
+      aplicarConfig(cmd);
+    }
+  }
+
+  // Modo streaming: frames continuos, sin esperar pedidos ni pausas.
+  // Serial.write solo bloquea cuando se llena el buffer de TX, así que
+  // el enlace queda ocupado todo el tiempo.
+  if (streaming) {
+    enviarDistanciaSiHay();
+    enviarFrame();
+    return;
+  }
 
-  // Pequeña pausa entre capturas
-  delay(50);
+  delay(1);
 }